@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上传准入控制
+新上传开始前检查排队任务数、正在上传的数据量、磁盘剩余空间和客户端的令牌桶，
+超出限制时拒绝并告诉客户端多久之后重试，避免突发的大文件上传占满磁盘或拖慢整个服务
+"""
+
+import math
+import os
+import shutil
+import threading
+import time
+
+# 保存的客户端令牌桶数量超过该值时清理已回满的令牌桶
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionError(Exception):
+    """上传被拒绝
+
+    Args:
+        message: 返回给客户端的错误信息
+        reason: 拒绝原因，用于统计（queue/inflight/disk/client）
+        retry_after: 建议的重试间隔（秒）
+        status: HTTP状态码
+    """
+
+    def __init__(self, message, reason, retry_after, status=503):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.status = status
+
+
+class TokenBucket:
+    """令牌桶：以rate个/秒的速度补充，最多积累capacity个"""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """取出amount个令牌还需等待的时间（秒），0表示可以立即取出"""
+        self._refill(now)
+        # 超过桶容量的请求在桶满时放行，否则永远无法通过
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """上传准入控制器，准入的上传预留其大小，直到上传结束时释放
+
+    Args:
+        folder: 上传目录，用于检查所在磁盘的剩余空间
+        queue_depth: 返回当前排队任务数的函数
+        max_queue_jobs: 排队任务数上限
+        max_inflight_bytes: 同时进行的上传总大小上限
+        min_free_bytes: 上传完成后磁盘至少保留的剩余空间
+        client_bytes_rate: 每个客户端每秒可上传的字节数
+        client_bytes_burst: 每个客户端可突发上传的字节数
+        client_jobs_rate: 每个客户端每秒可提交的任务数
+        client_jobs_burst: 每个客户端可突发提交的任务数
+        retry_after: 因排队任务过多、上传过多或磁盘空间不足被拒绝时建议的重试间隔（秒）
+        clock: 返回当前时间（秒）的函数
+    """
+
+    def __init__(self, folder, queue_depth, max_queue_jobs, max_inflight_bytes, min_free_bytes,
+                 client_bytes_rate, client_bytes_burst, client_jobs_rate, client_jobs_burst,
+                 retry_after=10, clock=time.monotonic):
+        self.folder = folder
+        self.queue_depth = queue_depth
+        self.max_queue_jobs = max_queue_jobs
+        self.max_inflight_bytes = max_inflight_bytes
+        self.min_free_bytes = min_free_bytes
+        self.client_bytes_rate = client_bytes_rate
+        self.client_bytes_burst = client_bytes_burst
+        self.client_jobs_rate = client_jobs_rate
+        self.client_jobs_burst = client_jobs_burst
+        self.retry_after = retry_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        # 上传标识 -> 预留的字节数
+        self._reserved = {}
+        self._inflight_bytes = 0
+        # 客户端 -> (任务令牌桶, 字节令牌桶)
+        self._buckets = {}
+
+    @property
+    def inflight_bytes(self):
+        with self._lock:
+            return self._inflight_bytes
+
+    def free_bytes(self):
+        # 上传目录尚未创建时检查所在的上级目录
+        path = os.path.abspath(self.folder)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def check_queue(self):
+        """排队任务过多时抛出AdmissionError"""
+        if self.queue_depth() >= self.max_queue_jobs:
+            raise AdmissionError('打印队列已满，请稍后重试', 'queue', self.retry_after)
+
+    def admit(self, key, client, size):
+        """检查能否开始一个size字节的上传，通过时以key预留其大小，否则抛出AdmissionError"""
+        self.check_queue()
+        with self._lock:
+            if self._inflight_bytes + size > self.max_inflight_bytes and self._inflight_bytes > 0:
+                raise AdmissionError('服务器正忙，请稍后重试', 'inflight', self.retry_after)
+            # 保守估计：正在上传的数据都尚未写入磁盘
+            if self.free_bytes() - self._inflight_bytes - size < self.min_free_bytes:
+                raise AdmissionError('服务器存储空间不足，请稍后重试', 'disk', self.retry_after * 6)
+            now = self._clock()
+            jobs_bucket, bytes_bucket = self._client_buckets(client, now)
+            wait = max(jobs_bucket.wait_time(1, now), bytes_bucket.wait_time(size, now))
+            if wait > 0:
+                raise AdmissionError('上传过于频繁，请稍后重试', 'client', wait, status=429)
+            jobs_bucket.take(1, now)
+            bytes_bucket.take(size, now)
+            self._reserve_locked(key, size)
+
+    def charge(self, client):
+        """不需要上传数据的任务（内容已在服务器上）只检查排队任务数并计入客户端的任务令牌桶，
+        不通过时抛出AdmissionError"""
+        self.check_queue()
+        with self._lock:
+            now = self._clock()
+            jobs_bucket, _ = self._client_buckets(client, now)
+            wait = jobs_bucket.wait_time(1, now)
+            if wait > 0:
+                raise AdmissionError('上传过于频繁，请稍后重试', 'client', wait, status=429)
+            jobs_bucket.take(1, now)
+
+    def reserve(self, key, size):
+        """不经检查直接预留（例如服务重启后加载的未完成上传）"""
+        with self._lock:
+            self._reserve_locked(key, size)
+
+    def release(self, key):
+        """上传结束（完成、失败或放弃）后释放预留"""
+        with self._lock:
+            self._inflight_bytes -= self._reserved.pop(key, 0)
+
+    def release_where(self, predicate):
+        """释放所有predicate(key)为真的预留，返回释放的数量"""
+        with self._lock:
+            keys = [key for key in self._reserved if predicate(key)]
+            for key in keys:
+                self._inflight_bytes -= self._reserved.pop(key)
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'inflight_uploads': len(self._reserved),
+                'inflight_bytes': self._inflight_bytes,
+                'tracked_clients': len(self._buckets)
+            }
+
+    def _reserve_locked(self, key, size):
+        self._inflight_bytes += size - self._reserved.get(key, 0)
+        self._reserved[key] = size
+
+    def _client_buckets(self, client, now):
+        buckets = self._buckets.get(client)
+        if buckets is None:
+            if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                # 已回满的令牌桶与新建的没有区别
+                self._buckets = {name: pair for name, pair in self._buckets.items()
+                                 if not (pair[0].full(now) and pair[1].full(now))}
+            buckets = self._buckets[client] = (
+                TokenBucket(self.client_jobs_rate, self.client_jobs_burst, now),
+                TokenBucket(self.client_bytes_rate, self.client_bytes_burst, now)
+            )
+        return buckets
@@ -1,19 +1,44 @@
-from flask import Flask, request, jsonify, send_from_directory, redirect
+from flask import Flask, request, jsonify, send_file, redirect, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 import time
 import uuid
 import shutil
 from werkzeug.utils import secure_filename
-import subprocess
+from werkzeug.exceptions import RequestEntityTooLarge
 import threading
 from queue import Queue
 import sys
 import logging
 import importlib.util
 import pathlib
-import json
 from datetime import datetime
+from events import EventBroker, format_sse
+from event_server import EventServer, StreamRejected
+from printers import Printer, PrinterRegistry, Dispatcher
+from printer_backends import MockBackend, LprBackend, IppBackend
+from job_store import create_job_store, FINISHED_STATES
+from process_lock import FileLock
+from metrics import MetricsRegistry, InstrumentedLock, LOCK_BUCKETS
+from admission import AdmissionController, AdmissionError
+from collections import deque, OrderedDict
+from fileops import concat_files, preallocate, pwrite_stream
+from upload_stream import FileSink, UploadError, parse_multipart
+from chunk_upload import ChunkUploadRegistry, recommend_upload_params, MAX_CHUNKS
+from blob_store import BlobStore, derived_key, file_sha256, is_valid_hash
+from converter import ConverterPool
+from pipeline import Stage
+from batching import Batcher, image_to_pdf, merge_pdfs
+from scheduler import Scheduler, PriorityPolicy, DEFAULT_PRIORITY, job_cost
+from estimator import estimate_job, estimate_print_seconds
+from imaging import normalize_image, target_size
+import heapq
+import tempfile
+import resource
+import atexit
+import signal
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 
 # 配置日志
 logging.basicConfig(
@@ -40,17 +65,190 @@ CHUNKS_FOLDER = 'uploads/chunks'
 if not os.path.exists(CHUNKS_FOLDER):
     os.makedirs(CHUNKS_FOLDER)
 
-# 打印队列
-print_queue = Queue()
-# 打印状态（文件ID -> 状态）
-print_status = {}
-# 锁定打印队列的互斥锁
-queue_lock = threading.Lock()
-# 当前是否有文件正在打印
-currently_printing = False
+# 进行中的分块上传
+chunk_uploads = ChunkUploadRegistry(CHUNKS_FOLDER)
+# 超过该时间（秒）仍未完成的分块上传视为已放弃
+CHUNK_UPLOAD_TTL = 24 * 3600
+# 按内容哈希保存的已上传文件，用于重复打印时免上传
+BLOBS_FOLDER = 'uploads/blobs'
+BLOB_STORE_MAX_BYTES = int(os.environ.get('WEBPRINT_BLOB_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+blob_store = BlobStore(BLOBS_FOLDER, BLOB_STORE_MAX_BYTES)
+# 可下载的上传文件：文件ID -> 任务信息，任务进入队列时登记，文件删除时移除
+download_index = {}
+# 直接写入模式下预分配的目标文件名（位于分块目录中，完成时重命名）
+PART_FILENAME = 'data.part'
+# 合并分块期间持有的锁文件（位于分块目录中），防止同一上传被多个进程同时合并
+ASSEMBLE_LOCK_FILENAME = 'assemble.lock'
+# 后台合并分块的线程数，同时完成的上传超过该数量时排队等待
+ASSEMBLE_WORKERS = 2
+assemble_executor = ThreadPoolExecutor(max_workers=ASSEMBLE_WORKERS, thread_name_prefix='assemble')
+
+# 打印任务存储（任务信息、状态及状态历史），可通过WEBPRINT_JOB_STORE选择sqlite或memory
+JOB_STORE_BACKEND = os.environ.get('WEBPRINT_JOB_STORE', 'sqlite')
+JOB_DB_PATH = os.path.join('data', 'jobs.db')
+# 已结束任务的保留时间（秒），超时后从存储中清理
+JOB_RETENTION_SECONDS = int(os.environ.get('WEBPRINT_JOB_RETENTION', 24 * 3600))
+job_store = create_job_store(JOB_STORE_BACKEND, JOB_DB_PATH, retention_seconds=JOB_RETENTION_SECONDS)
+
+# 多进程部署（gunicorn -c gunicorn.conf.py wsgi:app，由wsgi.py设置WEBPRINT_MULTI_WORKER=1）：
+# 各工作进程处理HTTP请求，通过flock选出唯一的调度进程运行调度器、流水线和所有打印机；
+# 新任务通过SQLite任务存储提交给调度进程，状态变化和队列状态由各进程从任务存储中读取
+MULTI_WORKER = os.environ.get('WEBPRINT_MULTI_WORKER', '0') == '1'
+if MULTI_WORKER and JOB_STORE_BACKEND != 'sqlite':
+    raise RuntimeError("多进程模式需要使用SQLite任务存储（WEBPRINT_JOB_STORE=sqlite）")
+dispatcher_lock = FileLock(os.path.join('data', 'dispatcher.lock'))
+# 未成为调度进程时重新尝试获取锁的间隔（秒）
+DISPATCHER_RETRY_INTERVAL = 2
+# 调度进程取出新提交的任务、各进程读取状态变化的间隔（秒）
+SHARED_POLL_INTERVAL = 0.2
+# 本进程是否运行打印机和流水线，在start_dispatcher中设置
+is_dispatcher = False
+# start_background是否已经调用
+background_started = False
+# 恢复时已直接加入调度器、之后仍可能从提交队列中取出的任务
+restored_job_ids = set()
+# 关闭时等待已接收任务打印完成的最长时间（秒），可通过WEBPRINT_DRAIN_TIMEOUT配置
+DRAIN_TIMEOUT = float(os.environ.get('WEBPRINT_DRAIN_TIMEOUT', 30))
+DRAIN_POLL_INTERVAL = 0.1
+# 服务正在关闭，不再接收新任务
+shutting_down = threading.Event()
+# 关闭（排空）已完成
+shutdown_complete = threading.Event()
+# 调度进程之外的进程读取到的队列状态
+shared_queue_state = {'queue_size': 0, 'is_printing': False, 'printers': [], 'stages': [], 'jobs': []}
+# 运行指标，通过/metrics以Prometheus文本格式输出；多进程模式下每个进程单独统计
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram('webprint_http_request_seconds', 'HTTP请求处理耗时',
+                                    ('endpoint', 'method', 'status'))
+upload_bytes = metrics.counter('webprint_upload_bytes_total', '接收的上传数据量', ('kind',))
+# 任务各阶段耗时：upload上传、assemble合并、queue_wait等待调度、convert转换、printer_wait等待打印机、print打印
+job_stage_seconds = metrics.histogram('webprint_job_stage_seconds', '任务在各阶段的耗时', ('stage',))
+jobs_finished = metrics.counter('webprint_jobs_finished_total', '结束的任务数', ('status',))
+queue_lock_wait_seconds = metrics.histogram('webprint_queue_lock_wait_seconds', '获取队列锁的等待时间',
+                                            buckets=LOCK_BUCKETS)
+queue_lock_hold_seconds = metrics.histogram('webprint_queue_lock_hold_seconds', '队列锁的持有时间',
+                                            buckets=LOCK_BUCKETS)
+# 锁定打印队列的互斥锁，记录等待和持有时间
+queue_lock = InstrumentedLock(queue_lock_wait_seconds, queue_lock_hold_seconds)
+# 打印机注册表，每台打印机的忙闲状态在持有queue_lock时修改
+printer_registry = PrinterRegistry()
+# 状态变化条件变量，与queue_lock共用同一把锁，供长轮询等待
+status_changed = threading.Condition(queue_lock)
+# 状态变化版本号及最近变化的文件ID，长轮询据此判断关心的任务是否变化
+status_version = 0
+recent_status_changes = deque(maxlen=1000)
+
+# 批量状态查询的限制
+MAX_BATCH_STATUS_IDS = 200
+MAX_LONG_POLL_TIMEOUT = 30
+
+# 事件推送（SSE）
+event_broker = EventBroker()
+# 队列状态已变化、等待推送线程生成和推送
+queue_state_changed = threading.Event()
+# 空闲连接的心跳间隔（秒），用于保持连接并及时发现断开的客户端
+SSE_HEARTBEAT_INTERVAL = 15
+# 推送连接数已满时建议客户端重新尝试推送的间隔（秒）
+EVENT_STREAM_RETRY_AFTER = 60
+# 独立的推送服务器监听地址（如 0.0.0.0:5002），/api/events重定向到该服务器：
+# 一个线程以非阻塞方式服务所有推送连接，每个进程最多WEBPRINT_MAX_EVENT_CONNECTIONS个连接
+EVENTS_BIND = os.environ.get('WEBPRINT_EVENTS_BIND', '')
+MAX_EVENT_CONNECTIONS = int(os.environ.get('WEBPRINT_MAX_EVENT_CONNECTIONS', 10000))
+# 浏览器访问推送服务器的地址，默认为页面的主机名加推送服务器的端口；经反向代理转发时需要配置
+EVENTS_URL = os.environ.get('WEBPRINT_EVENTS_URL', '')
+# 推送服务器，在start_background中创建
+event_server = None
+# 未配置推送服务器时SSE连接在整个连接期间占用一个WSGI工作线程，限制每个进程的连接数，超出时客户端改用长轮询
+MAX_EVENT_STREAMS = int(os.environ.get('WEBPRINT_MAX_EVENT_STREAMS', 8))
 
 # 使用模拟打印机
 USE_MOCK_PRINTER = True
+# 真实打印机的后端：lpr（交给本机CUPS）或ipp（直接通过IPP提交并跟踪任务状态）
+PRINTER_BACKEND = os.environ.get('WEBPRINT_PRINTER_BACKEND', 'lpr')
+# IPP打印机URI，{name}替换为打印机名称
+IPP_URI_TEMPLATE = os.environ.get('WEBPRINT_IPP_URI', 'ipp://localhost:631/printers/{name}')
+# 等待IPP任务结束的最长时间（秒），在预计打印耗时之外额外等待
+IPP_JOB_TIMEOUT = 600
+
+# 打印机名称列表，可通过环境变量WEBPRINT_PRINTERS（逗号分隔）配置多台打印机
+# 使用真实打印机时名称即CUPS队列名，DEFAULT_PRINTER表示系统默认打印机
+DEFAULT_PRINTER = 'default'
+PRINTER_NAMES = [name.strip() for name in os.environ.get('WEBPRINT_PRINTERS', DEFAULT_PRINTER).split(',') if name.strip()]
+# 模拟打印时长与预计耗时的比例，可通过WEBPRINT_MOCK_TIME_SCALE调小以加快开发测试
+MOCK_PRINT_TIME_SCALE = float(os.environ.get('WEBPRINT_MOCK_TIME_SCALE', 1.0))
+# 模拟打印机失败注入的随机种子，设置WEBPRINT_MOCK_SEED后每台模拟打印机的成功/失败序列可重现
+MOCK_PRINTER_SEED = os.environ.get('WEBPRINT_MOCK_SEED')
+
+# DOCX转换：常驻LibreOffice进程数（可通过WEBPRINT_CONVERTERS配置）及工作目录
+CONVERTER_POOL_SIZE = int(os.environ.get('WEBPRINT_CONVERTERS', 2))
+CONVERT_FOLDER = 'uploads/convert'
+# 单次转换的超时时间（秒）
+CONVERT_TIMEOUT = 120
+converter_pool = ConverterPool(CONVERTER_POOL_SIZE, CONVERT_FOLDER, timeout=CONVERT_TIMEOUT)
+# 转换结果缓存，按原文件内容哈希和转换参数保存转换后的文件
+CONVERTED_FOLDER = 'uploads/converted'
+CONVERSION_CACHE_MAX_BYTES = int(os.environ.get('WEBPRINT_CONVERSION_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+conversion_cache = BlobStore(CONVERTED_FOLDER, CONVERSION_CACHE_MAX_BYTES)
+# DOCX转PDF的转换参数，参数变化时旧的缓存结果不再命中
+DOCX_CONVERSION_OPTIONS = 'pdf:writer_pdf_Export'
+# 图片按打印机分辨率（dpi）和纸张尺寸缩小后再发送到打印机
+PRINTER_DPI = int(os.environ.get('WEBPRINT_PRINTER_DPI', 300))
+PAPER_SIZE = os.environ.get('WEBPRINT_PAPER_SIZE', 'A4')
+IMAGE_NORMALIZE_OPTIONS = f'image:{PRINTER_DPI}:{PAPER_SIZE}'
+
+# 打印流水线：调度 -> 接收 -> 转换 -> 打印，打印机打印当前任务时下一个任务已在转换
+# 等待中的任务由调度器按优先级和客户端公平排序，不设上限，上传请求不会因流水线繁忙而阻塞
+# WEBPRINT_FAIR_SHARE=0关闭按客户端公平调度，WEBPRINT_SHORTEST_FIRST=1优先打印页数少的任务
+SCHEDULER_FAIR_SHARE = os.environ.get('WEBPRINT_FAIR_SHARE', '1') != '0'
+SCHEDULER_SHORTEST_FIRST = os.environ.get('WEBPRINT_SHORTEST_FIRST', '0') == '1'
+print_scheduler = Scheduler(fair=SCHEDULER_FAIR_SHARE, shortest_first=SCHEDULER_SHORTEST_FIRST)
+# 任务优先级由服务器按客户端地址决定：WEBPRINT_CLIENT_PRIORITIES为逗号分隔的“地址或网段=优先级”，
+# 如"10.0.5.0/24=high"；其他客户端最高为normal，请求更高的优先级时按normal处理
+priority_policy = PriorityPolicy.parse(os.environ.get('WEBPRINT_CLIENT_PRIORITIES', ''))
+# 各阶段之间的有界队列；队列越短，离开调度器后不能再被高优先级任务超越的任务越少
+PREPARED_JOBS_PER_PRINTER = 1
+convert_queue = Queue(maxsize=1)
+# 已准备好、等待空闲打印机的任务
+print_queue = Queue(maxsize=PREPARED_JOBS_PER_PRINTER * len(PRINTER_NAMES))
+# 把待打印队列中的任务分派给空闲打印机的唯一线程，调度进程中由start_dispatcher创建
+dispatcher = None
+# 小任务合并打印（WEBPRINT_BATCH=1开启）：窗口时间内连续的小PDF/图片任务合并为一个文档，
+# 每批只有一次打印机准备时间；WEBPRINT_BATCH_SEPARATOR=1时在文档之间插入空白分隔页
+BATCH_MODE = os.environ.get('WEBPRINT_BATCH', '0') == '1'
+BATCH_WINDOW = float(os.environ.get('WEBPRINT_BATCH_WINDOW', 2.0))
+BATCH_SEPARATOR_PAGES = os.environ.get('WEBPRINT_BATCH_SEPARATOR', '0') == '1'
+# 可以合并的任务的最大页数，以及每批的最大任务数和页数
+BATCH_MAX_JOB_PAGES = 5
+BATCH_MAX_JOBS = 20
+BATCH_MAX_PAGES = 50
+batch_queue = Queue(maxsize=1)
+# 已离开调度器、尚未交给打印机的任务（文件ID -> 任务信息），在持有queue_lock时修改
+pipeline_jobs = OrderedDict()
+# 流水线阶段，由调度进程创建
+pipeline_stages = []
+
+# 上传准入控制：排队任务数、正在上传的数据量、磁盘剩余空间和每个客户端的令牌桶，
+# 超出限制的新上传返回503/429及Retry-After；多进程模式下每个进程分别统计上传量和令牌桶
+MAX_QUEUE_JOBS = int(os.environ.get('WEBPRINT_MAX_QUEUE_JOBS', 500))
+MAX_INFLIGHT_UPLOAD_BYTES = int(os.environ.get('WEBPRINT_MAX_INFLIGHT_BYTES', 1024 * 1024 * 1024))
+MIN_FREE_DISK_BYTES = int(os.environ.get('WEBPRINT_MIN_FREE_DISK', 512 * 1024 * 1024))
+CLIENT_UPLOAD_RATE = int(os.environ.get('WEBPRINT_CLIENT_UPLOAD_RATE', 10 * 1024 * 1024))
+CLIENT_UPLOAD_BURST = int(os.environ.get('WEBPRINT_CLIENT_UPLOAD_BURST', 200 * 1024 * 1024))
+CLIENT_JOBS_PER_MINUTE = float(os.environ.get('WEBPRINT_CLIENT_JOBS_PER_MINUTE', 60))
+CLIENT_JOBS_BURST = int(os.environ.get('WEBPRINT_CLIENT_JOBS_BURST', 20))
+ADMISSION_RETRY_AFTER = 10
+
+def queue_depth():
+    """等待打印的任务数，非调度进程读取共享的队列状态"""
+    if not is_dispatcher:
+        return shared_queue_state['queue_size']
+    return print_scheduler.qsize() + len(pipeline_jobs)
+
+admission = AdmissionController(UPLOAD_FOLDER, queue_depth, MAX_QUEUE_JOBS, MAX_INFLIGHT_UPLOAD_BYTES,
+                                MIN_FREE_DISK_BYTES, CLIENT_UPLOAD_RATE, CLIENT_UPLOAD_BURST,
+                                CLIENT_JOBS_PER_MINUTE / 60, CLIENT_JOBS_BURST, ADMISSION_RETRY_AFTER)
+admission_rejected = metrics.counter('webprint_admission_rejected_total', '准入控制拒绝的上传数', ('reason',))
+metrics.gauge('webprint_inflight_upload_bytes', '正在进行的上传预留的字节数', lambda: admission.inflight_bytes)
 
 # 导入模拟打印模块
 def import_mock_printer():
@@ -78,165 +276,769 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'pdf', 'jpg', 'jpeg', 'png', 'docx'}
 
-def print_file(file_info):
-    """打印文件"""
-    global currently_printing
-    
+def print_file(file_info, printer):
+    """在指定打印机上打印文件，阻塞直到打印结束"""
     file_id = file_info['id']
     filepath = file_info['path']
     filename = file_info['name']
     
-    logger.info(f"准备打印文件: {filename} (ID: {file_id}), 路径: {filepath}")
+    logger.info(f"准备打印文件: {filename} (ID: {file_id}), 路径: {filepath}, 打印机: {printer.name}")
     
     # 检查文件是否存在
     if not os.path.exists(filepath):
         logger.error(f"文件不存在: {filepath}")
-        update_status(file_id, 'error')
-        with queue_lock:
-            currently_printing = False
-        process_next_print_job()
+        update_job_status(file_info, 'error')
         return False
     
+    start_time = time.time()
     try:
         logger.info(f"开始打印文件: {filename}")
-        update_status(file_id, 'printing')
-        
-        if USE_MOCK_PRINTER:
-            # 使用模拟打印机
-            if mock_printer:
-                # 定义回调函数处理打印完成事件
-                def print_complete_callback(success):
-                    try:
-                        logger.info(f"收到打印完成回调: {filename}, 结果: {success}")
-                        if success:
-                            logger.info(f"模拟打印成功: {filename}")
-                            update_status(file_id, 'completed')
-                        else:
-                            logger.error(f"模拟打印失败: {filename}")
-                            update_status(file_id, 'error')
-                    except Exception as e:
-                        logger.error(f"处理打印回调时出错: {str(e)}")
-                    finally:
-                        # 清理工作
-                        try:
-                            if os.path.exists(filepath):
-                                logger.info(f"删除已打印的文件: {filepath}")
-                                os.remove(filepath)
-                            else:
-                                logger.warning(f"打印后找不到文件: {filepath}")
-                        except Exception as e:
-                            logger.error(f"删除文件失败: {str(e)}")
-                        
-                        # 重置打印状态并处理下一个打印任务
-                        with queue_lock:
-                            global currently_printing
-                            currently_printing = False
-                            logger.info(f"重置打印状态并处理下一个打印任务")
-                        process_next_print_job()
-                
-                # 检查是否支持回调函数版本
-                if hasattr(mock_printer, 'print_file'):
-                    # 使用带回调的接口
-                    logger.info(f"使用带回调的模拟打印接口")
-                    success = mock_printer.print_file(filepath, print_complete_callback)
-                    
-                    if not success:
-                        logger.error(f"启动模拟打印失败: {filename}")
-                        raise Exception("启动模拟打印失败")
-                    
-                    # 打印机将在后台处理，通过回调通知结果
-                    # 这里直接返回，不执行finally块中的代码
-                    return True
-                else:
-                    # 使用旧版接口
-                    logger.info(f"使用传统的模拟打印接口")
-                    success = mock_printer.mock_print(filepath)
-                    if not success:
-                        raise Exception("模拟打印失败")
-            else:
-                raise Exception("模拟打印机模块不可用")
-        else:
-            # 根据文件类型调用不同的打印命令
-            if filepath.endswith(('.pdf')):
-                subprocess.run(['lpr', filepath], check=True)
-            elif filepath.endswith(('.jpg', '.jpeg', '.png')):
-                subprocess.run(['lpr', filepath], check=True)
-            elif filepath.endswith('.docx'):
-                # 对于docx文件，首先转换为PDF
-                logger.info(f"转换DOCX文件: {filename}")
-                subprocess.run(['soffice', '--headless', '--convert-to', 'pdf', filepath, '--outdir', UPLOAD_FOLDER], check=True)
-                pdf_path = os.path.join(UPLOAD_FOLDER, os.path.splitext(filename)[0] + '.pdf')
-                subprocess.run(['lpr', pdf_path], check=True)
-                
-                # 删除临时PDF文件
-                try:
-                    os.remove(pdf_path)
-                except:
-                    pass
-                
-        update_status(file_id, 'completed')
+        update_job_status(file_info, 'printing')
+        
+        if printer.backend is None:
+            raise Exception("打印机后端不可用")
+        # DOCX和大图片在转换阶段已生成可打印的文件；后端在打印机报告结束后才返回
+        printer.backend.print_document(file_info.get('print_path', filepath), filename,
+                                       estimate_job_seconds(file_info))
+        
+        record_timing(file_info, 'print', time.time() - start_time)
+        update_job_status(file_info, 'completed')
         logger.info(f"文件打印完成: {filename}")
         return True
     except Exception as e:
         logger.error(f"打印错误: {str(e)}")
-        update_status(file_id, 'error')
+        update_job_status(file_info, 'error')
         return False
     finally:
-        # 如果使用的是带回调的接口，则不在此处理清理工作
-        if not (USE_MOCK_PRINTER and mock_printer and hasattr(mock_printer, 'print_file')):
-            logger.info(f"在finally块中处理清理工作")
-            # 删除原始上传文件
-            try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                else:
-                    logger.warning(f"文件不存在，无法删除: {filepath}")
-            except Exception as e:
-                logger.error(f"删除文件失败: {str(e)}")
-            
-            # 重置打印状态
-            with queue_lock:
-                currently_printing = False
-            
-            # 检查队列中是否还有文件待打印
-            process_next_print_job()
+        remove_job_files(file_info)
+
+def update_job_status(file_info, status):
+    """更新任务状态，合并打印的批次逐个更新其中的任务"""
+    for job in file_info.get('batch', [file_info]):
+        if status in FINISHED_STATES:
+            # 结束前保存各阶段耗时
+            job_store.update_info(job)
+            jobs_finished.inc(status)
+        update_status(job['id'], status)
+
+def record_timing(file_info, stage, seconds):
+    """记录任务在某阶段的耗时，保存在任务信息的timeline中并计入阶段耗时统计"""
+    job_stage_seconds.observe(seconds, stage)
+    for job in file_info.get('batch', [file_info]):
+        job.setdefault('timeline', {})[stage] = round(seconds, 3)
+
+def remove_job_files(file_info):
+    """删除原始上传文件及转换生成的临时文件"""
+    for job in file_info.get('batch', []):
+        remove_job_files(job)
+    download_index.pop(file_info['id'], None)
+    filepath = file_info['path']
+    try:
+        if os.path.exists(filepath):
+            logger.info(f"删除已打印的文件: {filepath}")
+            os.remove(filepath)
+        else:
+            logger.warning(f"文件不存在，无法删除: {filepath}")
+    except Exception as e:
+        logger.error(f"删除文件失败: {str(e)}")
+    if file_info.get('work_dir'):
+        shutil.rmtree(file_info['work_dir'], ignore_errors=True)
+
+def release_pipeline_job(file_id):
+    """任务离开流水线（交给打印机或处理失败）"""
+    with queue_lock:
+        pipeline_jobs.pop(file_id, None)
+
+def fail_pipeline_job(file_info, error):
+    """流水线阶段处理任务出错时任务失败：离开流水线、更新状态并删除文件"""
+    for job in file_info.get('batch', [file_info]):
+        release_pipeline_job(job['id'])
+    update_job_status(file_info, 'error')
+    remove_job_files(file_info)
+    with queue_lock:
+        publish_queue_state_locked()
+
+def ingest_job(file_info):
+    """接收阶段：检查上传的文件是否可以处理"""
+    with queue_lock:
+        pipeline_jobs[file_info['id']] = file_info
+    if 'scheduled_at' in file_info:
+        record_timing(file_info, 'queue_wait', time.time() - file_info['scheduled_at'])
+    filepath = file_info['path']
+    if not os.path.exists(filepath):
+        logger.error(f"文件不存在: {filepath}")
+        release_pipeline_job(file_info['id'])
+        update_job_status(file_info, 'error')
+        return None
+    if not allowed_file(file_info['name']):
+        logger.error(f"不支持的文件类型: {file_info['name']}")
+        release_pipeline_job(file_info['id'])
+        update_job_status(file_info, 'error')
+        remove_job_files(file_info)
+        return None
+    return file_info
+
+def needs_conversion(file_info):
+    """真实打印时DOCX需要先转换为PDF，模拟打印机直接接收原文件"""
+    return not USE_MOCK_PRINTER and file_info['path'].endswith('.docx')
+
+def needs_normalization(file_info):
+    """图片超过打印机分辨率下纸张可容纳的尺寸时需要缩小"""
+    estimate = file_info.get('estimate') or {}
+    if not estimate.get('width') or not estimate.get('height'):
+        return False
+    return target_size(estimate['width'], estimate['height'], PRINTER_DPI, PAPER_SIZE) is not None
+
+def convert_job(file_info):
+    """转换阶段：生成可直接发送到打印机的文件"""
+    if not needs_conversion(file_info) and not needs_normalization(file_info):
+        return file_info
+    start_time = time.time()
+    result = prepare_job(file_info)
+    if result is not None:
+        record_timing(result, 'convert', time.time() - start_time)
+    return result
+
+def prepare_job(file_info):
+    """按文件类型转换DOCX或缩小图片"""
+    if needs_conversion(file_info):
+        output_name = os.path.splitext(os.path.basename(file_info['path']))[0] + '.pdf'
+        return prepare_print_file(file_info, DOCX_CONVERSION_OPTIONS, output_name, converter_pool.convert)
+    if needs_normalization(file_info):
+        output_name = os.path.basename(file_info['path'])
+        grayscale = not file_info['estimate'].get('color', True)
+        
+        def normalize(src, out_dir):
+            return normalize_image(src, os.path.join(out_dir, output_name), PRINTER_DPI, PAPER_SIZE, grayscale)
+        
+        return prepare_print_file(file_info, IMAGE_NORMALIZE_OPTIONS, output_name, normalize)
+    return file_info
+
+def prepare_print_file(file_info, options, output_name, produce):
+    """生成任务的打印文件并记录为print_path，相同内容和参数的结果从缓存中获取
+
+    Args:
+        options: 处理参数，与内容哈希一起作为缓存键
+        output_name: 生成的文件名
+        produce: 生成函数 produce(原文件路径, 输出目录)，返回生成的文件路径
+    """
+    file_id = file_info['id']
+    logger.info(f"转换文件: {file_info['name']} (ID: {file_id}), 参数: {options}")
+    update_status(file_id, 'converting')
+    # 每个任务使用独立的输出目录，并发转换不会互相覆盖
+    file_info['work_dir'] = tempfile.mkdtemp(prefix=f'{file_id}-', dir=CONVERT_FOLDER)
+    # 相同内容已转换过时直接使用缓存的结果
+    cache_key = None
+    if file_info.get('hash'):
+        cache_key = derived_key(file_info['hash'], options)
+        cached_path = os.path.join(file_info['work_dir'], output_name)
+        if conversion_cache.get(cache_key, cached_path):
+            logger.info(f"使用缓存的转换结果: {file_info['name']} (ID: {file_id})")
+            file_info['print_path'] = cached_path
+            update_status(file_id, 'queued')
+            return file_info
+    try:
+        file_info['print_path'] = produce(file_info['path'], file_info['work_dir'])
+    except Exception as e:
+        logger.error(f"转换错误: {str(e)}")
+        release_pipeline_job(file_id)
+        update_job_status(file_info, 'error')
+        remove_job_files(file_info)
+        return None
+    if cache_key is not None:
+        conversion_cache.put(cache_key, file_info['print_path'])
+    update_status(file_id, 'queued')
+    return file_info
+
+def is_batchable(file_info):
+    """页数少的PDF和图片任务可以合并打印"""
+    path = file_info.get('print_path', file_info['path']).lower()
+    return job_cost(file_info) <= BATCH_MAX_JOB_PAGES and path.endswith(('.pdf', '.jpg', '.jpeg', '.png'))
+
+def make_batch(jobs):
+    """把多个任务合并为一个PDF，返回代表整个批次的任务"""
+    work_dir = tempfile.mkdtemp(prefix='batch-', dir=CONVERT_FOLDER)
+    try:
+        paths = []
+        for i, file_info in enumerate(jobs):
+            path = file_info.get('print_path', file_info['path'])
+            if not path.lower().endswith('.pdf'):
+                dpi = (file_info.get('estimate') or {}).get('dpi')
+                path = image_to_pdf(path, os.path.join(work_dir, f'{i}.pdf'), dpi, PAPER_SIZE)
+            paths.append(path)
+        merged_path = merge_pdfs(paths, os.path.join(work_dir, 'batch.pdf'), BATCH_SEPARATOR_PAGES)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    pages = sum(job_cost(file_info) for file_info in jobs)
+    color = any((file_info.get('estimate') or {}).get('color') for file_info in jobs)
+    if BATCH_SEPARATOR_PAGES:
+        pages += len(jobs) - 1
+    logger.info(f"合并 {len(jobs)} 个任务为一个打印文档，共 {pages} 页")
+    return {
+        'id': f"batch-{uuid.uuid4()}",
+        'name': f"合并打印({len(jobs)}个文件)",
+        'path': merged_path,
+        'work_dir': work_dir,
+        'batch': jobs,
+        'pages': pages,
+        'estimate': {'pages': pages, 'color': color, 'seconds': estimate_print_seconds(pages, color)}
+    }
+
+def enqueue_prepared_job(file_info):
+    """把准备好的任务放入待打印队列，队列满时阻塞直到分派线程取走任务"""
+    file_info['prepared_at'] = time.time()
+    print_queue.put(file_info)
+    with queue_lock:
+        publish_queue_state_locked()
+
+def on_printer_idle(printer):
+    """打印机完成任务后释放该打印机，由分派线程分派下一个任务"""
+    with queue_lock:
+        printer.current_job = None
+        logger.info(f"打印机 {printer.name} 空闲，处理下一个打印任务")
+        dispatcher.printer_idle()
+        publish_queue_state_locked()
 
 def update_status(file_id, status):
     """更新文件打印状态"""
+    job_store.set_state(file_id, status)
     with queue_lock:
-        print_status[file_id] = status
         logger.info(f"文件 {file_id} 状态更新为: {status}")
+        # 多进程模式下由各进程读取任务存储中的状态变化后通知
+        if not MULTI_WORKER:
+            notify_status_changed_locked(file_id, status)
+
+def notify_status_changed_locked(file_id, status):
+    """通知长轮询和推送订阅者任务状态已变化，调用者必须持有queue_lock"""
+    global status_version
+    status_version += 1
+    recent_status_changes.append((status_version, file_id))
+    # 唤醒等待状态变化的长轮询请求
+    status_changed.notify_all()
+    event_broker.publish('status', {'file_id': file_id, 'status': status}, file_id)
 
 def get_status(file_id):
     """获取文件打印状态"""
+    return job_store.get_state(file_id) or 'unknown'
+
+def get_queue_state():
+    """获取队列状态；只在queue_lock内复制流水线任务和打印机状态，调度顺序和预计开始时间在锁外计算"""
+    if not is_dispatcher:
+        return shared_queue_state
     with queue_lock:
-        return print_status.get(file_id, 'unknown')
+        pipeline = list(pipeline_jobs.values())
+        printers = [(printer.to_dict(), printer.current_job, printer.started_at) for printer in printer_registry.all()]
+    # 调度器有自己的锁，ordered()复制队列后在锁外排序
+    waiting = print_scheduler.ordered()
+    # 打印机正在打印的任务ID不对外公开
+    for info, _, _ in printers:
+        info.pop('file_id', None)
+    return {
+        'queue_size': len(pipeline) + len(waiting),
+        'is_printing': any(current_job is not None for _, current_job, _ in printers),
+        'printers': [info for info, _, _ in printers],
+        'stages': [stage.to_dict() for stage in pipeline_stages],
+        # 流水线中的任务已经离开调度器，排在所有等待调度的任务之前
+        'jobs': estimate_queue_jobs(pipeline + waiting, printers)
+    }
 
-def process_next_print_job():
-    """处理队列中的下一个打印任务"""
-    global currently_printing
-    
+def scope_queue_state(queue_state, file_ids):
+    """只保留客户端自己的任务；知道任务ID即可下载文件，其他客户端的任务ID不能公开"""
+    watched = set(file_ids)
+    return dict(queue_state, jobs=[job for job in queue_state['jobs'] if job['file_id'] in watched])
+
+def estimate_job_seconds(file_info):
+    """任务的预计打印耗时（秒）"""
+    if file_info.get('estimate'):
+        return file_info['estimate']['seconds']
+    return estimate_print_seconds(job_cost(file_info))
+
+def attach_estimate(file_info):
+    """读取文件的页数等信息并估算打印耗时，保存在任务信息中"""
+    file_info['estimate'] = estimate_job(file_info['path'])
+    file_info['pages'] = file_info['estimate']['pages']
+
+def estimate_queue_jobs(jobs, printers):
+    """按预计打印顺序返回等待中的任务及其位置和预计开始时间
+
+    Args:
+        jobs: 按打印顺序排列的任务
+        printers: 各打印机的 (状态, 当前任务, 开始时间)
+    """
+    now = time.time()
+    # 各打印机预计空闲的时间
+    free_at = [max(now, started_at + estimate_job_seconds(current_job)) if current_job is not None else now
+               for _, current_job, started_at in printers] or [now]
+    heapq.heapify(free_at)
+    result = []
+    for position, file_info in enumerate(jobs, 1):
+        start = heapq.heappop(free_at)
+        result.append({
+            'file_id': file_info['id'],
+            'priority': file_info.get('priority', DEFAULT_PRIORITY),
+            'pages': job_cost(file_info),
+            'position': position,
+            'estimated_start': round(start, 1)
+        })
+        heapq.heappush(free_at, start + estimate_job_seconds(file_info))
+    return result
+
+def publish_queue_state_locked():
+    """标记队列状态已变化，调用者必须持有queue_lock；完整状态由推送线程在锁外生成"""
+    queue_state_changed.set()
+
+def run_queue_state_publisher():
+    """队列状态变化后生成并推送完整状态，生成期间的多次变化合并为一次推送
+
+    多进程模式下保存到任务存储，由各进程读取后推送；单进程模式下没有推送订阅者时不生成。
+    """
+    while True:
+        queue_state_changed.wait()
+        queue_state_changed.clear()
+        try:
+            if MULTI_WORKER:
+                job_store.put_shared('queue', get_queue_state())
+            elif event_broker.subscriber_count() > 0:
+                event_broker.publish('queue', get_queue_state())
+        except Exception as e:
+            logger.error(f"推送队列状态失败: {str(e)}")
+
+def get_statuses(file_ids, known=None, timeout=0):
+    """批量获取文件打印状态
+
+    如果提供了known（文件ID -> 客户端已知状态），则阻塞直到其中任一文件的状态
+    与已知状态不同，或等待超过timeout秒，然后返回所有文件的当前状态。
+    """
+    # 先记录版本号再读取状态，避免读取后、等待前发生的变化被遗漏
     with queue_lock:
-        if print_queue.empty() or currently_printing:
-            return
-        
-        currently_printing = True
-        next_file = print_queue.get()
-    
-    # 在新线程中执行打印任务
-    print_thread = threading.Thread(target=print_file, args=(next_file,))
-    print_thread.daemon = True
-    print_thread.start()
+        version = status_version
+    statuses = job_store.get_states(file_ids)
+    if known is None or timeout <= 0:
+        return statuses
+    if any(statuses[file_id] != known.get(file_id) for file_id in file_ids):
+        return statuses
+
+    watched = set(file_ids)
+
+    def changed():
+        if status_version == version:
+            return False
+        # 变化记录已被覆盖，无法判断是否相关，直接返回让客户端重新比较
+        if recent_status_changes[0][0] > version + 1:
+            return True
+        return any(v > version and file_id in watched for v, file_id in recent_status_changes)
+
+    with status_changed:
+        if not status_changed.wait_for(changed, timeout):
+            return statuses
+    return job_store.get_states(file_ids)
+
+def on_job_dispatched(next_file, printer):
+    """分派线程把任务交给打印机后调用，调用者持有queue_lock"""
+    for job in next_file.get('batch', [next_file]):
+        pipeline_jobs.pop(job['id'], None)
+    if 'prepared_at' in next_file:
+        record_timing(next_file, 'printer_wait', time.time() - next_file['prepared_at'])
+    logger.info(f"分派文件 {next_file['name']} (ID: {next_file['id']}) 到打印机 {printer.name}")
+    publish_queue_state_locked()
+
+def is_drained():
+    """已接收的任务是否都已处理完（调度器、流水线、待打印队列和打印机都为空）"""
+    with queue_lock:
+        return (print_scheduler.qsize() == 0 and not pipeline_jobs and print_queue.empty()
+                and not printer_registry.any_busy())
+
+def shutdown(timeout=None):
+    """停止接收新任务，等待已接收的任务打印完成后停止分派线程和打印机
+
+    超过timeout秒（默认DRAIN_TIMEOUT）仍未完成的任务保留在任务存储中，下次启动时恢复。
+    已在其他线程中开始关闭时等待其完成。
+    """
+    timeout = DRAIN_TIMEOUT if timeout is None else timeout
+    if shutting_down.is_set():
+        shutdown_complete.wait(timeout)
+        return
+    shutting_down.set()
+    try:
+        drain(timeout)
+    finally:
+        if event_server is not None:
+            event_server.close()
+        shutdown_complete.set()
+
+def drain(timeout):
+    """关闭过程，由shutdown调用"""
+    logger.info("服务正在关闭，停止接收新任务")
+    # 尚未开始的合并在重启后恢复
+    assemble_executor.shutdown(wait=False, cancel_futures=True)
+    if not is_dispatcher:
+        return
+    deadline = time.time() + timeout
+    while not is_drained() and time.time() < deadline:
+        time.sleep(DRAIN_POLL_INTERVAL)
+    if not is_drained():
+        logger.warning(f"等待 {timeout} 秒后仍有未完成的任务，将在下次启动时恢复")
+    dispatcher.stop(max(0, deadline - time.time()))
+    for printer in printer_registry.all():
+        printer.stop(max(0, deadline - time.time()))
+    converter_pool.shutdown()
+    # 多进程模式下由其他进程立即接管调度
+    dispatcher_lock.release()
+    logger.info("调度已停止")
+
+def start_shutdown():
+    """在后台线程中开始关闭，关闭期间服务器继续处理请求（新任务返回503），返回该线程"""
+    thread = threading.Thread(target=shutdown, name='shutdown', daemon=True)
+    thread.start()
+    return thread
+
+def handle_sigterm(signum, frame):
+    """开发服务器收到SIGTERM后排空已接收的任务，完成后结束服务器循环"""
+    def stop_server():
+        start_shutdown().join()
+        # 主线程中的服务器循环收到KeyboardInterrupt后退出
+        os.kill(os.getpid(), signal.SIGINT)
+    threading.Thread(target=stop_server, daemon=True).start()
 
 def add_to_print_queue(file_info):
     """添加文件到打印队列"""
+    # 页数和预计耗时用于调度和估算开始时间，只在任务进入队列时计算一次
+    if 'estimate' not in file_info:
+        attach_estimate(file_info)
+    # 分块上传的任务在合并阶段已经登记
+    if job_store.get_state(file_info['id']) is None:
+        job_store.add_job(file_info, 'queued')
+    else:
+        job_store.update_info(file_info)
+        job_store.set_state(file_info['id'], 'queued')
+    download_index[file_info['id']] = file_info
+    if MULTI_WORKER:
+        # 由调度进程从任务存储中取出
+        job_store.submit(file_info['id'])
+        logger.info(f"文件 {file_info['name']} (ID: {file_info['id']}) 已提交到打印队列")
+        return
+    schedule_job(file_info)
+
+def schedule_job(file_info):
+    """把任务交给调度器，只在调度进程中调用"""
+    file_info['scheduled_at'] = time.time()
     with queue_lock:
-        print_queue.put(file_info)
-        print_status[file_info['id']] = 'queued'
+        print_scheduler.put(file_info)
         logger.info(f"文件 {file_info['name']} (ID: {file_info['id']}) 已添加到打印队列")
+        if not MULTI_WORKER:
+            notify_status_changed_locked(file_info['id'], 'queued')
+        publish_queue_state_locked()
+
+def request_job_options(data):
+    """从请求中读取调度相关的任务信息：客户端标识和优先级，优先级不超过该客户端允许的值"""
+    client = request.remote_addr or ''
+    return {
+        'client': client,
+        'priority': priority_policy.resolve(client, data.get('priority') if data else None)
+    }
+
+def queue_known_content(filename, file_hash, options):
+    """内容已在内容存储中时直接创建打印任务，返回文件ID；否则返回None，准入控制拒绝时抛出AdmissionError"""
+    file_id = str(uuid.uuid4())
+    filepath = os.path.join(UPLOAD_FOLDER, f"{file_id}_{filename}")
+    if not blob_store.get(file_hash, filepath):
+        return None
+    try:
+        # 无需上传数据，只计入客户端的任务数
+        admission.charge(options['client'])
+    except AdmissionError:
+        os.remove(filepath)
+        raise
+    
+    logger.info(f"内容已存在，无需上传: {filename} (ID: {file_id})")
+    file_info = {
+        'id': file_id,
+        'name': filename,
+        'path': filepath,
+        'hash': file_hash,
+        'timestamp': time.time()
+    }
+    file_info.update(options)
+    add_to_print_queue(file_info)
+    return file_id
+
+def admission_rejected_response(error):
+    """准入控制拒绝上传时的响应，Retry-After告诉客户端多久之后重试"""
+    admission_rejected.inc(error.reason)
+    logger.warning(f"拒绝上传({error.reason}): 客户端 {request.remote_addr}, {error.retry_after}秒后重试")
+    response = jsonify({'error': str(error), 'retryAfter': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
+def discard_chunk_upload(upload):
+    """关闭分块上传并删除分块目录，释放准入控制的预留"""
+    chunk_uploads.discard(upload.file_id)
+    admission.release(('chunk', upload.file_id))
+    try:
+        shutil.rmtree(upload.chunk_dir)
+    except Exception as e:
+        logger.warning(f"清理分块目录失败，将继续处理: {str(e)}")
+
+def assemble_chunked_upload(file_info, upload):
+    """合并已接收的分块并加入打印队列，其他线程或进程正在合并同一上传时直接返回"""
+    lock = FileLock(upload.path(ASSEMBLE_LOCK_FILENAME))
+    try:
+        if not lock.acquire(blocking=False):
+            return
+    except FileNotFoundError:
+        # 分块目录已被删除，上传已经合并完成
+        return
+    try:
+        assemble_chunks(file_info, upload)
+    finally:
+        lock.release()
+
+def assemble_chunks(file_info, upload):
+    """合并分块，调用者持有合并锁；直接写入模式下分块已在目标文件中，只需重命名"""
+    file_id = file_info['id']
+    filepath = file_info['path']
+    metadata = upload.metadata
+    start_time = time.time()
+    try:
+        if metadata.get('mode') == 'direct':
+            part_path = upload.path(PART_FILENAME)
+            # 重命名后被中断的合并，文件已在上传目录中
+            if os.path.exists(part_path) or not os.path.exists(filepath):
+                os.rename(part_path, filepath)
+            size = os.path.getsize(filepath)
+        else:
+            chunk_paths = [upload.path(f'chunk_{i}') for i in range(metadata['totalChunks'])]
+            size = concat_files(chunk_paths, filepath)
+    except Exception as e:
+        logger.error(f"合并文件错误: {str(e)}")
+        update_job_status(file_info, 'error')
+        try:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        except Exception as remove_error:
+            logger.error(f"删除文件失败: {str(remove_error)}")
+        return
     
-    # 如果没有正在打印的文件，开始处理队列
-    process_next_print_job()
+    # 检查合并后的文件大小
+    if size != metadata['fileSize']:
+        logger.warning(f"合并后文件大小不匹配: 预期{metadata['fileSize']}字节，实际{size}字节")
+    
+    # 清理分块
+    discard_chunk_upload(upload)
+    
+    # 校验内容后保存到内容存储
+    file_hash = file_sha256(filepath)
+    if metadata.get('fileHash') not in (None, file_hash):
+        logger.error(f"文件校验失败: {file_info['name']} (ID: {file_id})")
+        update_job_status(file_info, 'error')
+        os.remove(filepath)
+        return
+    file_info['hash'] = file_hash
+    blob_store.put(file_hash, filepath)
+    
+    logger.info(f"合并完成: {file_info['name']} (ID: {file_id}), 大小: {size}字节, 耗时: {time.time() - start_time:.2f}秒")
+    record_timing(file_info, 'assemble', time.time() - start_time)
+    add_to_print_queue(file_info)
+
+def create_printer_backend(name):
+    """按配置创建打印机后端，模拟打印机模块不可用时返回None"""
+    if USE_MOCK_PRINTER:
+        if not mock_printer:
+            return None
+        # 每台打印机对应一个独立的模拟设备
+        return MockBackend(mock_printer.MockPrinterDevice(name, seed=MOCK_PRINTER_SEED), MOCK_PRINT_TIME_SCALE)
+    if PRINTER_BACKEND == 'ipp':
+        return IppBackend(IPP_URI_TEMPLATE.format(name=name), timeout=IPP_JOB_TIMEOUT)
+    # DEFAULT_PRINTER表示系统默认打印机
+    return LprBackend(None if name == DEFAULT_PRINTER else name)
+
+def create_printers():
+    """按配置创建打印机并启动各自的工作线程"""
+    for name in PRINTER_NAMES:
+        printer = Printer(name, print_file, on_printer_idle, create_printer_backend(name))
+        printer_registry.add(printer)
+        printer.start()
+    logger.info(f"已启动 {len(printer_registry)} 台打印机: {', '.join(PRINTER_NAMES)}")
+
+def restore_print_queue():
+    """重启后恢复未完成的打印任务，打印中断的任务重新排队"""
+    restored = 0
+    # 多进程模式下已提交的任务同样在这里恢复，先清空提交队列；
+    # 清空之后、读取之前提交的任务会被恢复两次，记录下来在取出时跳过
+    submitted = {info['id'] for info in job_store.take_submitted()} if MULTI_WORKER else set()
+    for file_info in job_store.jobs_in_states(('queued', 'converting', 'printing')):
+        if os.path.exists(file_info['path']):
+            job_store.set_state(file_info['id'], 'queued')
+            # 转换结果不保存，重新经过整个流水线
+            if 'estimate' not in file_info:
+                attach_estimate(file_info)
+                job_store.update_info(file_info)
+            download_index[file_info['id']] = file_info
+            if MULTI_WORKER and file_info['id'] not in submitted:
+                restored_job_ids.add(file_info['id'])
+            print_scheduler.put(file_info)
+            restored += 1
+        else:
+            logger.warning(f"恢复任务时找不到文件: {file_info['path']}")
+            update_job_status(file_info, 'error')
+    # 分块仍在时重新合并被中断的分块上传
+    for file_info in job_store.jobs_in_states(('assembling',)):
+        upload = chunk_uploads.get(file_info['id'])
+        if upload is None:
+            logger.warning(f"无法恢复被中断的分块合并: {file_info['name']} (ID: {file_info['id']})")
+            update_job_status(file_info, 'error')
+            continue
+        assemble_executor.submit(assemble_chunked_upload, file_info, upload)
+    if restored:
+        logger.info(f"已恢复 {restored} 个未完成的打印任务")
+
+def create_pipeline():
+    """创建并启动打印前的流水线阶段，最后一个阶段把任务交给打印机"""
+    stages = [Stage('ingest', ingest_job, print_scheduler, workers=1, emit=convert_queue.put,
+                    on_error=fail_pipeline_job)]
+    if BATCH_MODE:
+        # 转换后的任务先经过合并阶段
+        stages.append(Stage('convert', convert_job, convert_queue, workers=CONVERTER_POOL_SIZE, emit=batch_queue.put,
+                            on_error=fail_pipeline_job))
+        stages.append(Batcher(batch_queue, enqueue_prepared_job, is_batchable, make_batch, BATCH_WINDOW,
+                              BATCH_MAX_JOBS, BATCH_MAX_PAGES))
+    else:
+        stages.append(Stage('convert', convert_job, convert_queue, workers=CONVERTER_POOL_SIZE, emit=enqueue_prepared_job,
+                            on_error=fail_pipeline_job))
+    for stage in stages:
+        stage.start()
+    return stages
+
+# 输出指标时读取的当前状态
+metrics.gauge('webprint_dispatcher', '本进程是否运行打印机和流水线', lambda: int(is_dispatcher))
+metrics.gauge('webprint_queue_jobs', '等待调度和流水线中的任务数', queue_depth)
+metrics.gauge('webprint_printers_busy', '正在打印的打印机数', lambda: sum(printer.busy for printer in printer_registry.all()))
+metrics.gauge('webprint_conversion_cache_hits', '转换缓存命中次数', lambda: conversion_cache.stats()['hits'])
+metrics.gauge('webprint_conversion_cache_misses', '转换缓存未命中次数', lambda: conversion_cache.stats()['misses'])
+# Linux上ru_maxrss以KB为单位
+metrics.gauge('webprint_process_peak_rss_bytes', '进程的峰值常驻内存', lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+def start_dispatcher():
+    """启动打印机、分派线程和流水线，恢复未完成的任务"""
+    global pipeline_stages, is_dispatcher, dispatcher
+    create_printers()
+    dispatcher = Dispatcher(printer_registry, print_queue, queue_lock, on_job_dispatched)
+    dispatcher.start()
+    pipeline_stages = create_pipeline()
+    is_dispatcher = True
+    threading.Thread(target=run_queue_state_publisher, name='queue-state', daemon=True).start()
+    restore_print_queue()
+    # 真实打印时在后台预热DOCX转换进程
+    if not USE_MOCK_PRINTER:
+        threading.Thread(target=converter_pool.start, daemon=True).start()
+
+def run_dispatcher_election():
+    """多进程模式下等待成为调度进程，之后持续取出各进程提交的任务
+
+    调度进程退出时内核释放flock，其他进程在DISPATCHER_RETRY_INTERVAL内接管，
+    被中断的任务按重启的方式恢复。
+    """
+    while not dispatcher_lock.acquire(blocking=False):
+        if shutting_down.wait(DISPATCHER_RETRY_INTERVAL):
+            return
+    if shutting_down.is_set():
+        dispatcher_lock.release()
+        return
+    logger.info(f"进程 {os.getpid()} 成为调度进程")
+    start_dispatcher()
+    while not shutting_down.is_set():
+        jobs = []
+        try:
+            jobs = job_store.take_submitted()
+            for file_info in jobs:
+                if file_info['id'] in restored_job_ids:
+                    restored_job_ids.discard(file_info['id'])
+                    continue
+                schedule_job(file_info)
+        except Exception as e:
+            logger.error(f"读取提交的任务失败: {str(e)}")
+        if not jobs:
+            shutting_down.wait(SHARED_POLL_INTERVAL)
+
+def follow_shared_state():
+    """多进程模式下读取任务存储中的状态变化和队列状态，通知本进程的长轮询和推送订阅者"""
+    global shared_queue_state
+    last_change = job_store.last_change()
+    queue_version = 0
+    while not shutting_down.is_set():
+        changes = []
+        try:
+            changes = job_store.changes_since(last_change)
+            version, queue_state = job_store.get_shared('queue')
+            with queue_lock:
+                for seq, file_id, status in changes:
+                    last_change = seq
+                    notify_status_changed_locked(file_id, status)
+                    # 由其他进程打印完成的任务，文件已被删除
+                    if status in FINISHED_STATES:
+                        download_index.pop(file_id, None)
+                if version != queue_version and queue_state is not None:
+                    queue_version = version
+                    shared_queue_state = queue_state
+                    event_broker.publish('queue', queue_state)
+        except Exception as e:
+            logger.error(f"读取共享状态失败: {str(e)}")
+        if not changes:
+            shutting_down.wait(SHARED_POLL_INTERVAL)
+
+def start_background():
+    """启动调度（多进程模式下为调度选举和状态同步线程），只在处理请求的进程中调用一次
+
+    开发服务器开启重载时监视文件的主进程也会导入本模块，导入时启动调度会把恢复的任务打印两次。
+    """
+    global background_started
+    if background_started:
+        return
+    background_started = True
+    if MULTI_WORKER:
+        threading.Thread(target=follow_shared_state, name='shared-state', daemon=True).start()
+        threading.Thread(target=run_dispatcher_election, name='dispatcher-election', daemon=True).start()
+    else:
+        start_dispatcher()
+    if EVENTS_BIND:
+        start_event_server()
+    atexit.register(shutdown)
+
+def start_event_server():
+    """启动推送服务器，多进程模式下各进程监听同一端口"""
+    global event_server
+    host, _, port = EVENTS_BIND.rpartition(':')
+    event_server = EventServer(event_broker, (host.strip('[]') or '0.0.0.0', int(port)), open_event_stream,
+                               max_streams=MAX_EVENT_CONNECTIONS, heartbeat=SSE_HEARTBEAT_INTERVAL,
+                               retry_after=EVENT_STREAM_RETRY_AFTER)
+    event_server.start()
+
+chunk_uploads.load_all()
+# 重启前未完成的分块上传仍会继续，重新预留其大小
+for pending_upload in chunk_uploads.all():
+    admission.reserve(('chunk', pending_upload.file_id), pending_upload.metadata['fileSize'])
+
+# 创建新任务的接口，服务关闭期间拒绝
+SUBMIT_ENDPOINTS = {'upload_file', 'dedup_upload', 'init_chunked_upload', 'upload_chunk', 'complete_chunked_upload'}
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.time()
+
+@app.before_request
+def reject_while_shutting_down():
+    if shutting_down.is_set() and request.endpoint in SUBMIT_ENDPOINTS:
+        response = jsonify({'error': '服务正在关闭，请稍后重试'})
+        response.headers['Retry-After'] = str(int(DRAIN_TIMEOUT))
+        return response, 503
+
+@app.after_request
+def observe_request(response):
+    # 静态文件等未匹配API路由的请求统一记为other，避免标签数量随路径增长
+    endpoint = request.endpoint if request.path.startswith('/api/') and request.endpoint else 'other'
+    request_seconds.observe(time.time() - g.request_start, endpoint, request.method, response.status_code)
+    return response
 
 @app.route('/')
 def index():
@@ -248,71 +1050,133 @@ def catch_all(path):
         return {'error': 'API not found'}, 404
     return app.send_static_file('index.html')
 
+def multipart_boundary():
+    """返回multipart请求的边界，不是multipart请求时返回None"""
+    if request.mimetype != 'multipart/form-data':
+        return None
+    return request.mimetype_params.get('boundary')
+
 @app.route('/api/print', methods=['POST'])
 def upload_file():
-    """处理文件上传请求（普通上传方式）"""
+    """处理文件上传请求（普通上传方式），文件数据从请求流直接写入上传目录"""
+    # 生成唯一ID
+    file_id = str(uuid.uuid4())
     try:
-        if 'file' not in request.files:
+        boundary = multipart_boundary()
+        if not boundary:
             return jsonify({'error': '没有上传文件'}), 400
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': '未选择文件'}), 400
+        # 请求没有Content-Length时按最大请求大小预留
+        admission.admit(('plain', file_id), request.remote_addr or '',
+                        request.content_length or app.config['MAX_CONTENT_LENGTH'])
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            
-            # 生成唯一ID
-            file_id = str(uuid.uuid4())
-            
-            # 确保上传目录存在
-            if not os.path.exists(UPLOAD_FOLDER):
-                os.makedirs(UPLOAD_FOLDER)
-            
+        # 确保上传目录存在
+        if not os.path.exists(UPLOAD_FOLDER):
+            os.makedirs(UPLOAD_FOLDER)
+        
+        received = {}
+        
+        def open_file(name, filename, fields):
+            # 只接收第一个file字段，不支持的文件类型不写入磁盘
+            if name != 'file' or 'filename' in received:
+                return None
+            received['filename'] = filename
+            if filename == '' or not allowed_file(filename):
+                return None
             # 保存文件到带有ID的路径，以避免名称冲突
-            filepath = os.path.join(UPLOAD_FOLDER, f"{file_id}_{filename}")
-            file.save(filepath)
-            
-            logger.info(f"文件上传成功: {filename} (ID: {file_id})")
-            
-            # 将文件信息添加到打印队列
-            file_info = {
-                'id': file_id,
-                'name': filename,
-                'path': filepath,
-                'timestamp': time.time()
-            }
-            
-            add_to_print_queue(file_info)
-            
-            return jsonify({
-                'message': '文件已加入打印队列',
-                'file_id': file_id,
-                'status': 'queued'
-            })
+            received['name'] = secure_filename(filename)
+            return FileSink(os.path.join(UPLOAD_FOLDER, f"{file_id}_{received['name']}"))
+        
+        form, sinks = parse_multipart(request.stream, boundary, open_file)
+        if 'filename' not in received:
+            return jsonify({'error': '没有上传文件'}), 400
+        if received['filename'] == '':
+            return jsonify({'error': '未选择文件'}), 400
+        if not sinks:
+            return jsonify({'error': '不支持的文件类型'}), 400
+        
+        sink = sinks[0]
+        filename = received['name']
+        logger.info(f"文件上传成功: {filename} (ID: {file_id}), 大小: {sink.size}字节")
+        upload_bytes.inc('plain', amount=sink.size)
+        
+        # 保存到内容存储，之后重复打印同一文件时无需再上传
+        file_hash = sink.hexdigest()
+        blob_store.put(file_hash, sink.path)
+        
+        # 将文件信息添加到打印队列
+        file_info = {
+            'id': file_id,
+            'name': filename,
+            'path': sink.path,
+            'hash': file_hash,
+            'timestamp': time.time()
+        }
+        file_info.update(request_job_options(form))
+        record_timing(file_info, 'upload', time.time() - g.request_start)
+        
+        add_to_print_queue(file_info)
         
-        return jsonify({'error': '不支持的文件类型'}), 400
+        return jsonify({
+            'message': '文件已加入打印队列',
+            'file_id': file_id,
+            'status': 'queued'
+        })
+    except AdmissionError as e:
+        return admission_rejected_response(e)
+    except UploadError as e:
+        logger.warning(f"上传数据无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': '文件大小超过限制'}), 413
     except Exception as e:
         logger.error(f"文件上传处理错误: {str(e)}")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+    finally:
+        admission.release(('plain', file_id))
+
+@app.route('/api/dedup', methods=['POST'])
+def dedup_upload():
+    """服务器已有相同内容时直接创建打印任务，客户端无需上传文件
+
+    请求体: {"filename": 文件名, "fileHash": 文件内容的SHA-256}
+    """
+    try:
+        data = request.json
+        if not data or 'filename' not in data or not is_valid_hash(data.get('fileHash')):
+            return jsonify({'error': '缺少必要参数'}), 400
+        
+        filename = secure_filename(data['filename'])
+        if not allowed_file(filename):
+            return jsonify({'error': '不支持的文件类型'}), 400
+        
+        file_id = queue_known_content(filename, data['fileHash'], request_job_options(data))
+        if file_id is None:
+            return jsonify({'deduplicated': False})
+        
+        return jsonify({
+            'message': '文件已加入打印队列',
+            'file_id': file_id,
+            'status': 'queued',
+            'deduplicated': True
+        })
+    except AdmissionError as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        logger.error(f"重复内容检查错误: {str(e)}")
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
 @app.route('/api/chunk/init', methods=['POST'])
 def init_chunked_upload():
     """初始化分块上传"""
     try:
         data = request.json
-        if not data or 'filename' not in data or 'totalChunks' not in data or 'fileSize' not in data:
+        if not data or 'filename' not in data or 'fileSize' not in data:
             return jsonify({'error': '缺少必要参数'}), 400
         
         filename = secure_filename(data['filename'])
-        total_chunks = int(data['totalChunks'])
         file_size = int(data['fileSize'])
         
-        # 验证分块数量和文件大小
-        if total_chunks <= 0 or total_chunks > 1000:
-            logger.warning(f"无效的分块数量: {total_chunks}")
-            return jsonify({'error': '无效的分块数量'}), 400
-            
         if file_size <= 0 or file_size > 100 * 1024 * 1024:  # 最大100MB
             logger.warning(f"无效的文件大小: {file_size}")
             return jsonify({'error': '文件大小超过限制'}), 400
@@ -321,102 +1185,235 @@ def init_chunked_upload():
             logger.warning(f"不支持的文件类型: {filename}")
             return jsonify({'error': '不支持的文件类型'}), 400
         
+        file_hash = data.get('fileHash')
+        if file_hash is not None and not is_valid_hash(file_hash):
+            return jsonify({'error': '无效的文件哈希'}), 400
+        
+        # 根据当前进行中的上传数量推荐分块大小和并行数
+        recommended_chunk_size, max_parallel = recommend_upload_params(file_size, len(chunk_uploads))
+        
+        admission.check_queue()
+        
+        if file_hash is not None:
+            # 服务器已有相同内容，无需上传
+            file_id = queue_known_content(filename, file_hash, request_job_options(data))
+            if file_id is not None:
+                return jsonify({
+                    'message': '文件已加入打印队列',
+                    'file_id': file_id,
+                    'status': 'queued',
+                    'deduplicated': True
+                })
+            
+            # 相同内容的上传尚未完成（例如中断后重试），续传缺少的分块
+            upload = chunk_uploads.find_by_hash(file_hash, file_size)
+            if upload is not None and upload.metadata.get('mode') == 'direct':
+                received_chunks = upload.bitmap.received()
+                logger.info(f"续传分块上传: {filename} (ID: {upload.file_id}), 已接收 {len(received_chunks)}/{upload.metadata['totalChunks']} 块")
+                return jsonify({
+                    'message': '继续之前的分块上传',
+                    'file_id': upload.file_id,
+                    'chunkSize': upload.metadata['chunkSize'],
+                    'totalChunks': upload.metadata['totalChunks'],
+                    'maxParallel': max_parallel,
+                    'receivedChunks': received_chunks
+                })
+        
+        # 客户端提供分块大小时，分块直接写入预分配的目标文件；
+        # 只提供分块数量时使用旧的分块文件模式；都不提供时使用推荐的分块大小
+        chunk_size = data.get('chunkSize')
+        if chunk_size is None and 'totalChunks' not in data:
+            chunk_size = recommended_chunk_size
+        if chunk_size is not None:
+            chunk_size = int(chunk_size)
+            if chunk_size <= 0:
+                logger.warning(f"无效的分块大小: {chunk_size}")
+                return jsonify({'error': '无效的分块大小'}), 400
+        
+        if 'totalChunks' in data:
+            total_chunks = int(data['totalChunks'])
+        else:
+            total_chunks = -(-file_size // chunk_size)
+        
+        # 验证分块数量
+        if total_chunks <= 0 or total_chunks > MAX_CHUNKS:
+            logger.warning(f"无效的分块数量: {total_chunks}")
+            return jsonify({'error': '无效的分块数量'}), 400
+        
+        if chunk_size is not None and total_chunks != -(-file_size // chunk_size):
+            logger.warning(f"分块大小与分块数量不匹配: {chunk_size}, 总块数: {total_chunks}")
+            return jsonify({'error': '无效的分块大小'}), 400
+        
         # 生成唯一ID
         file_id = str(uuid.uuid4())
         
-        # 确保分块目录存在
-        chunk_dir = os.path.join(CHUNKS_FOLDER, file_id)
-        if not os.path.exists(chunk_dir):
-            os.makedirs(chunk_dir)
-        
-        # 保存上传信息到metadata文件
+        # 保存上传信息到metadata文件，已接收的分块记录在位图中
         metadata = {
             'filename': filename,
             'id': file_id,
             'totalChunks': total_chunks,
             'fileSize': file_size,
-            'receivedChunks': [],
             'timestamp': time.time()
         }
+        if chunk_size is not None:
+            metadata['mode'] = 'direct'
+            metadata['chunkSize'] = chunk_size
+        if file_hash is not None:
+            metadata['fileHash'] = file_hash
+        metadata.update(request_job_options(data))
+        
+        # 顺带清理已放弃的分块上传
+        for stale_upload in chunk_uploads.expired(CHUNK_UPLOAD_TTL, time.time()):
+            logger.info(f"清理已放弃的分块上传: {stale_upload.file_id}")
+            discard_chunk_upload(stale_upload)
         
-        with open(os.path.join(chunk_dir, 'metadata.json'), 'w') as f:
-            json.dump(metadata, f)
+        # 上传结束（完成或放弃）时在discard_chunk_upload中释放；
+        # 多进程模式下上传可能由其他进程完成，分块目录已删除的预留在这里释放
+        admission.release_where(lambda key: key[0] == 'chunk' and not os.path.exists(os.path.join(CHUNKS_FOLDER, key[1])))
+        admission.admit(('chunk', file_id), request.remote_addr or '', file_size)
+        upload = chunk_uploads.create(metadata)
+        if chunk_size is not None:
+            preallocate(upload.path(PART_FILENAME), file_size)
         
         logger.info(f"初始化分块上传: {filename} (ID: {file_id}), 总块数: {total_chunks}, 文件大小: {file_size}字节")
         
         return jsonify({
             'message': '分块上传初始化成功',
-            'file_id': file_id
+            'file_id': file_id,
+            'chunkSize': chunk_size,
+            'totalChunks': total_chunks,
+            'maxParallel': max_parallel,
+            'receivedChunks': []
         })
+    except AdmissionError as e:
+        return admission_rejected_response(e)
     except Exception as e:
         logger.error(f"初始化分块上传错误: {str(e)}")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
+def resolve_chunk(fields):
+    """校验分块上传的参数，返回 (分块上传, 分块索引, 分块哈希)；参数无效时抛出UploadError"""
+    if 'chunkIndex' not in fields or 'fileId' not in fields:
+        raise UploadError('缺少必要参数')
+    
+    try:
+        chunk_index = int(fields['chunkIndex'])
+    except ValueError:
+        logger.warning(f"无效的分块索引: {fields['chunkIndex']}")
+        raise UploadError('分块索引必须是整数')
+    
+    # 确认分块上传存在
+    file_id = fields['fileId']
+    upload = chunk_uploads.get(file_id)
+    if upload is None:
+        logger.warning(f"分块上传不存在: {file_id}")
+        raise UploadError('无效的文件ID')
+    metadata = upload.metadata
+    
+    # 验证分块索引
+    if chunk_index < 0 or chunk_index >= metadata['totalChunks']:
+        logger.warning(f"分块索引越界: {chunk_index}, 总块数: {metadata['totalChunks']}")
+        raise UploadError('分块索引越界')
+    
+    # 客户端可以提供分块的SHA-256用于校验
+    chunk_hash = fields.get('chunkHash')
+    if chunk_hash is not None and not is_valid_hash(chunk_hash):
+        raise UploadError('无效的分块哈希')
+    return upload, chunk_index, chunk_hash
+
+def chunk_target(upload, chunk_index):
+    """返回分块的写入位置 (文件, 偏移, 预期大小)，偏移为None表示写入新的临时文件"""
+    metadata = upload.metadata
+    if metadata.get('mode') == 'direct':
+        # 直接写入目标文件中该分块的位置
+        offset = chunk_index * metadata['chunkSize']
+        return upload.path(PART_FILENAME), offset, min(metadata['chunkSize'], metadata['fileSize'] - offset)
+    # 先写入临时文件再重命名，避免同一分块并发上传时读到不完整的数据
+    chunk_path = upload.path(f'chunk_{chunk_index}')
+    return f"{chunk_path}.{uuid.uuid4().hex}.tmp", None, None
+
 @app.route('/api/chunk/upload', methods=['POST'])
 def upload_chunk():
-    """上传单个文件块"""
+    """上传单个文件块，分块数据从请求流直接写入分块目录或目标文件"""
+    received = {}
     try:
-        if 'file' not in request.files or 'chunkIndex' not in request.form or 'fileId' not in request.form:
+        boundary = multipart_boundary()
+        if not boundary:
             return jsonify({'error': '缺少必要参数'}), 400
         
-        file = request.files['file']
-        
-        # 检查是否有有效的文件内容
-        if not file.content_length or file.content_length <= 0:
-            return jsonify({'error': '空的文件分块'}), 400
-            
-        try:
-            chunk_index = int(request.form['chunkIndex'])
-        except ValueError:
-            logger.warning(f"无效的分块索引: {request.form['chunkIndex']}")
-            return jsonify({'error': '分块索引必须是整数'}), 400
-            
-        file_id = request.form['fileId']
-        
-        # 确认分块目录存在
-        chunk_dir = os.path.join(CHUNKS_FOLDER, file_id)
-        if not os.path.exists(chunk_dir):
-            logger.warning(f"分块目录不存在: {chunk_dir}")
-            return jsonify({'error': '无效的文件ID'}), 400
-        
-        # 加载元数据
-        try:
-            with open(os.path.join(chunk_dir, 'metadata.json'), 'r') as f:
-                metadata = json.load(f)
-                
-            # 验证分块索引
-            if chunk_index < 0 or chunk_index >= metadata['totalChunks']:
-                logger.warning(f"分块索引越界: {chunk_index}, 总块数: {metadata['totalChunks']}")
-                return jsonify({'error': f'分块索引越界'}), 400
-                
-        except Exception as e:
-            logger.error(f"读取元数据失败: {str(e)}")
-            return jsonify({'error': '无法加载文件元数据'}), 500
+        def open_file(name, filename, fields):
+            if name != 'file' or 'sink' in received:
+                return None
+            spool = False
+            try:
+                received['chunk'] = resolve_chunk(fields)
+                upload, chunk_index, chunk_hash = received['chunk']
+                path, offset, limit = chunk_target(upload, chunk_index)
+                # 未标记为已接收的区域可以直接覆盖，校验失败时不标记，客户端重传即可；
+                # 重传已接收的分块时先写入临时文件，校验通过后才写入，避免损坏已接收的数据
+                spool = offset is not None and upload.bitmap.is_set(chunk_index)
+            except UploadError:
+                # 参数在文件数据之后发送时先写入临时文件，解析完成后再移到分块位置
+                spool = True
+            if spool:
+                path, offset, limit = os.path.join(CHUNKS_FOLDER, f"{uuid.uuid4().hex}.tmp"), None, None
+                received['spooled'] = True
+            received['sink'] = FileSink(path, offset, limit)
+            return received['sink']
         
-        # 保存分块
-        chunk_path = os.path.join(chunk_dir, f'chunk_{chunk_index}')
-        file.save(chunk_path)
+        form, _ = parse_multipart(request.stream, boundary, open_file)
+        sink = received.get('sink')
+        if sink is None:
+            return jsonify({'error': '缺少必要参数'}), 400
+        upload, chunk_index, chunk_hash = received['chunk'] if 'chunk' in received else resolve_chunk(form)
+        metadata = upload.metadata
+        file_id = upload.file_id
+        path, offset, expected_size = chunk_target(upload, chunk_index)
         
-        # 更新元数据
-        if chunk_index not in metadata['receivedChunks']:
-            metadata['receivedChunks'].append(chunk_index)
+        if offset is not None:
+            written = sink.size + 1 if sink.overflow else sink.size
+            if written != expected_size:
+                logger.warning(f"分块大小不正确: {chunk_index}, 预期{expected_size}字节，实际{written}字节")
+                return jsonify({'error': '分块大小不正确'}), 400
+            if chunk_hash is not None and sink.hexdigest() != chunk_hash:
+                logger.warning(f"分块校验失败: {chunk_index} (文件ID: {file_id})")
+                return jsonify({'error': '分块校验失败'}), 400
+            if received.get('spooled'):
+                with open(sink.path, 'rb') as f:
+                    pwrite_stream(path, f, offset, expected_size)
+        else:
+            # 检查是否有有效的文件内容
+            if sink.size <= 0:
+                return jsonify({'error': '空的文件分块'}), 400
+            if chunk_hash is not None and sink.hexdigest() != chunk_hash:
+                logger.warning(f"分块校验失败: {chunk_index} (文件ID: {file_id})")
+                return jsonify({'error': '分块校验失败'}), 400
+            os.replace(sink.path, upload.path(f'chunk_{chunk_index}'))
         
-        with open(os.path.join(chunk_dir, 'metadata.json'), 'w') as f:
-            json.dump(metadata, f)
+        # 分块数据写入后才标记为已接收
+        upload.bitmap.mark(chunk_index)
+        upload_bytes.inc('chunk', amount=sink.size)
         
         logger.info(f"接收到分块: {chunk_index}/{metadata['totalChunks']} (文件ID: {file_id})")
         
-        # 检查是否所有分块都已接收
-        all_received = len(metadata['receivedChunks']) == metadata['totalChunks']
-        
         return jsonify({
             'message': '分块上传成功',
             'chunkIndex': chunk_index,
-            'allReceived': all_received
+            'allReceived': upload.bitmap.all_set()
         })
+    except UploadError as e:
+        logger.warning(f"分块上传数据无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': '分块大小超过限制'}), 413
     except Exception as e:
         logger.error(f"分块上传错误: {str(e)}")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+    finally:
+        # 未移到分块位置的临时文件
+        sink = received.get('sink')
+        if sink is not None and sink.offset is None:
+            sink.discard()
 
 @app.route('/api/chunk/complete', methods=['POST'])
 def complete_chunked_upload():
@@ -428,80 +1425,63 @@ def complete_chunked_upload():
         
         file_id = data['fileId']
         
-        # 确认分块目录存在
-        chunk_dir = os.path.join(CHUNKS_FOLDER, file_id)
-        if not os.path.exists(chunk_dir):
-            logger.warning(f"分块目录不存在: {chunk_dir}")
-            return jsonify({'error': '无效的文件ID'}), 400
+        # 重复的完成请求直接返回当前状态，避免重复合并
+        current_status = job_store.get_state(file_id)
+        if current_status is not None:
+            return jsonify({
+                'message': '文件已在处理中',
+                'file_id': file_id,
+                'status': current_status
+            })
         
-        # 加载元数据
-        try:
-            with open(os.path.join(chunk_dir, 'metadata.json'), 'r') as f:
-                metadata = json.load(f)
-        except Exception as e:
-            logger.error(f"读取元数据失败: {str(e)}")
-            return jsonify({'error': '无法加载文件元数据'}), 500
+        # 确认分块上传存在
+        upload = chunk_uploads.get(file_id)
+        if upload is None:
+            logger.warning(f"分块上传不存在: {file_id}")
+            return jsonify({'error': '无效的文件ID'}), 400
+        metadata = upload.metadata
         
         # 检查是否所有分块都已接收
-        missing_chunks = []
-        for i in range(metadata['totalChunks']):
-            if i not in metadata['receivedChunks']:
-                missing_chunks.append(i)
-                
+        missing_chunks = upload.bitmap.missing()
         if missing_chunks:
             logger.warning(f"文件不完整，缺少分块: {missing_chunks}")
             return jsonify({
                 'error': f'文件不完整，缺少分块索引: {missing_chunks}'
             }), 400
         
+        # 并发的完成请求只处理一次
+        if not upload.claim():
+            return jsonify({
+                'message': '文件已在处理中',
+                'file_id': file_id,
+                'status': 'assembling'
+            })
+        
         # 确保上传目录存在
         if not os.path.exists(UPLOAD_FOLDER):
             os.makedirs(UPLOAD_FOLDER)
         
-        # 合并文件
         filename = metadata['filename']
         filepath = os.path.join(UPLOAD_FOLDER, f"{file_id}_{filename}")
-        
-        try:
-            with open(filepath, 'wb') as outfile:
-                for i in range(metadata['totalChunks']):
-                    chunk_path = os.path.join(chunk_dir, f'chunk_{i}')
-                    if os.path.exists(chunk_path):
-                        with open(chunk_path, 'rb') as infile:
-                            outfile.write(infile.read())
-                    else:
-                        logger.error(f"找不到分块文件: {chunk_path}")
-                        return jsonify({'error': f'找不到分块{i}'}), 500
-        except Exception as e:
-            logger.error(f"合并文件错误: {str(e)}")
-            return jsonify({'error': f'合并文件错误: {str(e)}'}), 500
-        
-        # 检查合并后的文件大小
-        if os.path.getsize(filepath) != metadata['fileSize']:
-            logger.warning(f"合并后文件大小不匹配: 预期{metadata['fileSize']}字节，实际{os.path.getsize(filepath)}字节")
-        
-        # 清理分块
-        try:
-            shutil.rmtree(chunk_dir)
-        except Exception as e:
-            logger.warning(f"清理分块目录失败，将继续处理: {str(e)}")
-        
-        logger.info(f"合并完成: {filename} (ID: {file_id}), 大小: {os.path.getsize(filepath)}字节")
-        
-        # 将文件添加到打印队列
         file_info = {
             'id': file_id,
             'name': filename,
             'path': filepath,
-            'timestamp': time.time()
+            'timestamp': time.time(),
+            'client': metadata.get('client', ''),
+            'priority': metadata.get('priority', DEFAULT_PRIORITY)
         }
+        # 从初始化到完成请求的时间
+        record_timing(file_info, 'upload', file_info['timestamp'] - metadata['timestamp'])
         
-        add_to_print_queue(file_info)
+        # 在后台合并文件（直接写入模式下只需重命名）并计算哈希，客户端通过状态查询得知何时进入打印队列
+        job_store.add_job(file_info, 'assembling')
+        assemble_executor.submit(assemble_chunked_upload, file_info, upload)
         
         return jsonify({
-            'message': '文件已组装并加入打印队列',
+            'message': '文件正在组装，完成后将加入打印队列',
             'file_id': file_id,
-            'status': 'queued'
+            'status': 'assembling'
         })
     except Exception as e:
         logger.error(f"完成分块上传错误: {str(e)}")
@@ -520,33 +1500,194 @@ def check_status(file_id):
         logger.error(f"获取状态错误: {str(e)}")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
+# 任务记录中只在服务器内部使用的字段
+PRIVATE_JOB_FIELDS = ('path', 'print_path', 'work_dir', 'client', 'hash')
+
+@app.route('/api/jobs/<file_id>', methods=['GET'])
+def get_job(file_id):
+    """获取打印任务详情及状态历史"""
+    try:
+        job = job_store.get_job(file_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        # 不向客户端暴露服务器上的文件路径、提交者的地址和内容哈希（通过/api/dedup可凭哈希提交相同内容）
+        for field in PRIVATE_JOB_FIELDS:
+            job.pop(field, None)
+        return jsonify(job)
+    except Exception as e:
+        logger.error(f"获取任务详情错误: {str(e)}")
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+@app.route('/api/status/batch', methods=['POST'])
+def check_status_batch():
+    """批量检查文件打印状态，支持长轮询
+
+    请求体: {"fileIds": [...], "known": {文件ID: 状态}, "timeout": 秒}
+    提供known时，服务器会等待直到某个文件的状态发生变化或超时。
+    """
+    try:
+        data = request.json
+        if not data or not isinstance(data.get('fileIds'), list):
+            return jsonify({'error': '缺少文件ID列表'}), 400
+
+        file_ids = [str(file_id) for file_id in data['fileIds']]
+        if len(file_ids) > MAX_BATCH_STATUS_IDS:
+            return jsonify({'error': f'一次最多查询{MAX_BATCH_STATUS_IDS}个文件'}), 400
+
+        known = data.get('known')
+        if known is not None and not isinstance(known, dict):
+            return jsonify({'error': 'known必须是对象'}), 400
+
+        try:
+            timeout = float(data.get('timeout', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'timeout必须是数字'}), 400
+        timeout = max(0, min(timeout, MAX_LONG_POLL_TIMEOUT))
+
+        statuses = get_statuses(file_ids, known, timeout)
+        return jsonify({'statuses': statuses})
+    except Exception as e:
+        logger.error(f"批量获取状态错误: {str(e)}")
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+def parse_file_ids(text):
+    """逗号分隔的文件ID"""
+    return [file_id for file_id in text.split(',') if file_id]
+
+def request_file_ids():
+    """查询参数ids中逗号分隔的文件ID"""
+    return parse_file_ids(request.args.get('ids', ''))
+
+def event_snapshot(file_ids):
+    """推送连接建立时发送的任务状态和队列状态"""
+    statuses = job_store.get_states(file_ids)
+    events = [format_sse('status', {'file_id': file_id, 'status': status})
+              for file_id, status in statuses.items()]
+    events.append(format_sse('queue', scope_queue_state(get_queue_state(), file_ids)))
+    return ''.join(events)
+
+def encode_event(file_ids, event):
+    """编码推送给某个连接的事件，队列事件只包含该连接订阅的任务"""
+    event_id, event_type, data = event
+    if event_type == 'queue':
+        data = scope_queue_state(data, file_ids)
+    return format_sse(event_type, data, event_id)
+
+def open_event_stream(query):
+    """推送服务器收到连接时调用，返回 (订阅的任务ID, 快照函数, 事件编码函数)"""
+    file_ids = parse_file_ids(','.join(query.get('ids', [])))
+    if len(file_ids) > MAX_BATCH_STATUS_IDS:
+        raise StreamRejected(400, {'error': f'一次最多订阅{MAX_BATCH_STATUS_IDS}个文件'})
+    return file_ids, lambda: event_snapshot(file_ids), lambda event: encode_event(file_ids, event)
+
+def event_server_url():
+    """浏览器访问推送服务器的地址，保留请求的查询参数"""
+    url = EVENTS_URL
+    if not url:
+        host = urlsplit(request.host_url).hostname
+        if ':' in host:
+            host = f'[{host}]'
+        url = f"{request.scheme}://{host}:{event_server.address[1]}/api/events"
+    query = request.query_string.decode('latin-1')
+    return f"{url}?{query}" if query else url
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """通过Server-Sent Events推送任务状态和队列变化
+
+    查询参数ids（逗号分隔的文件ID）指定要接收哪些任务的状态事件，队列事件中也只包含这些任务；
+    不提供ids时只推送队列长度和打印机状态。
+    连接建立（包括断线重连）时先推送一次当前快照，客户端无需再轮询。
+    配置了推送服务器时重定向到推送服务器，不占用WSGI工作线程。
+    """
+    if event_server is not None:
+        return redirect(event_server_url(), code=307)
+    file_ids = request_file_ids()
+    if len(file_ids) > MAX_BATCH_STATUS_IDS:
+        return jsonify({'error': f'一次最多订阅{MAX_BATCH_STATUS_IDS}个文件'}), 400
+
+    # 先订阅再取快照，避免两者之间的状态变化丢失
+    sub = event_broker.subscribe(file_ids, limit=MAX_EVENT_STREAMS)
+    if sub is None:
+        logger.warning(f"推送连接数已达上限({MAX_EVENT_STREAMS})，客户端 {request.remote_addr} 改用轮询")
+        response = jsonify({'error': '推送连接数已满，请使用长轮询', 'fallback': 'poll'})
+        response.headers['Retry-After'] = str(EVENT_STREAM_RETRY_AFTER)
+        return response, 503
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            yield event_snapshot(file_ids)
+            while True:
+                events = sub.get(timeout=SSE_HEARTBEAT_INTERVAL)
+                if sub.overflowed:
+                    # 客户端太慢导致事件丢失，重新发送完整快照
+                    sub.overflowed = False
+                    yield event_snapshot(file_ids)
+                    continue
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                yield ''.join(encode_event(file_ids, event) for event in events)
+        finally:
+            event_broker.unsubscribe(sub)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 客户端在开始推送前断开时generate不会执行，同样释放连接名额
+    response.call_on_close(lambda: event_broker.unsubscribe(sub))
+    return response
+
 @app.route('/api/queue', methods=['GET'])
 def get_queue():
-    """获取打印队列状态"""
+    """获取打印队列状态，jobs中只包含查询参数ids指定的任务"""
+    try:
+        return jsonify(scope_queue_state(get_queue_state(), request_file_ids()))
+    except Exception as e:
+        logger.error(f"获取队列状态错误: {str(e)}")
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """以Prometheus文本格式输出运行指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """获取上传内容缓存和转换结果缓存的统计（条目数、大小、命中/未命中次数）"""
     try:
-        with queue_lock:
-            queue_size = print_queue.qsize()
-            is_printing = currently_printing
-        
         return jsonify({
-            'queue_size': queue_size,
-            'is_printing': is_printing
+            'uploads': blob_store.stats(),
+            'conversions': conversion_cache.stats()
         })
     except Exception as e:
-        logger.error(f"获取队列状态错误: {str(e)}")
+        logger.error(f"获取缓存统计错误: {str(e)}")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
 @app.route('/api/download/<file_id>', methods=['GET'])
 def download_file(file_id):
     """下载文件"""
     try:
-        # 获取文件路径
-        for filename in os.listdir(UPLOAD_FOLDER):
-            if filename.startswith(f"{file_id}_"):
-                logger.info(f"找到文件: {filename}")
-                return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
+        # 等待打印的文件直接从索引中查找
+        file_info = download_index.get(file_id)
+        filepath = file_info['path'] if file_info else None
+        if filepath is None or not os.path.exists(filepath):
+            # 其他进程接收的文件从任务记录中查找；已打印的文件已被删除，不再提供下载
+            file_info = job_store.get_job(file_id)
+            filepath = None
+            if file_info and os.path.exists(file_info['path']):
+                filepath = file_info['path']
+        if filepath is None:
+            logger.warning(f"找不到文件ID: {file_id}")
+            return jsonify({'error': '文件不存在'}), 404
         
-        logger.warning(f"找不到文件ID: {file_id}")
+        # 相对路径会被Flask按应用目录解析；conditional=True支持Range请求和If-None-Match/If-Modified-Since
+        return send_file(os.path.abspath(filepath), as_attachment=True, download_name=file_info['name'],
+                         etag=file_info.get('hash', True), conditional=True)
+    except FileNotFoundError:
+        logger.warning(f"文件已被删除: {file_id}")
         return jsonify({'error': '文件不存在'}), 404
     except Exception as e:
         logger.error(f"下载文件错误: {str(e)}")
@@ -554,5 +1695,8 @@ def download_file(file_id):
 
 if __name__ == '__main__':
     logger.info("Web打印服务启动")
-    # 更改端口，避免与系统服务冲突（特别是macOS的AirPlay服务）
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    start_background()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # 更改端口，避免与系统服务冲突（特别是macOS的AirPlay服务）；
+    # 不使用重载器：重载器会替换SIGTERM处理函数，其主进程也会导入本模块
+    app.run(debug=True, host='0.0.0.0', port=5001, use_reloader=False) 
\ No newline at end of file
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+小任务合并打印
+把短时间内连续到达的小PDF/图片任务合并成一个文档发送到打印机，
+每个任务只需要一次打印机准备时间
+"""
+
+import logging
+import threading
+import time
+from queue import Empty
+
+from PIL import Image
+from PyPDF2 import PdfWriter
+
+from imaging import PAPER_SIZES
+
+logger = logging.getLogger("web-printer.batching")
+
+# PDF的默认分辨率（点/英寸）
+_PDF_POINTS_PER_INCH = 72
+
+
+def image_to_pdf(src, dst, dpi=None, paper='A4'):
+    """把图片保存为单页PDF，分辨率保证图片不超过纸张尺寸"""
+    short_inches, long_inches = PAPER_SIZES[paper]
+    with Image.open(src) as img:
+        img = img.convert('RGB') if img.mode not in ('RGB', 'L') else img
+        short_side, long_side = sorted(img.size)
+        resolution = max(dpi or _PDF_POINTS_PER_INCH, short_side / short_inches, long_side / long_inches)
+        img.save(dst, 'PDF', resolution=resolution)
+    return dst
+
+
+def merge_pdfs(paths, dst, separator_pages=False):
+    """按顺序把多个PDF合并为一个文件，可选在文档之间插入空白分隔页"""
+    writer = PdfWriter()
+    for i, path in enumerate(paths):
+        if i > 0 and separator_pages:
+            last_page = writer.pages[-1]
+            writer.add_blank_page(last_page.mediabox.width, last_page.mediabox.height)
+        writer.append(path)
+    with open(dst, 'wb') as f:
+        writer.write(f)
+    return dst
+
+
+class Batcher:
+    """流水线中合并小任务的阶段
+
+    从输入队列取任务：小任务在窗口时间内与后续的小任务合并为一个批次，
+    其他任务原样输出。
+
+    Args:
+        inbox: 输入队列
+        emit: 输出函数，接收单个任务或合并后的批次
+        is_small: 判断任务能否合并 is_small(file_info)
+        make_batch: 合并函数 make_batch(任务列表)，返回批次任务；失败时抛出异常
+        window: 第一个小任务到达后等待后续任务的时间（秒）
+        max_jobs: 每个批次的最大任务数
+        max_pages: 每个批次的最大页数
+    """
+
+    def __init__(self, inbox, emit, is_small, make_batch, window=2.0, max_jobs=20, max_pages=50):
+        self.name = 'batch'
+        self.inbox = inbox
+        self.window = window
+        self.max_jobs = max_jobs
+        self.max_pages = max_pages
+        self.processed = 0
+        self.batches = 0
+        self._emit = emit
+        self._is_small = is_small
+        self._make_batch = make_batch
+        self._collecting = 0
+        self._thread = threading.Thread(target=self._run, name='batcher', daemon=True)
+
+    @property
+    def busy(self):
+        return self._collecting
+
+    def start(self):
+        self._thread.start()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'workers': 1,
+            'pending': self.inbox.qsize(),
+            'busy': self.busy,
+            'processed': self.processed,
+            'batches': self.batches
+        }
+
+    def _run(self):
+        carry = None
+        while True:
+            file_info = carry if carry is not None else self.inbox.get()
+            carry = None
+            if not self._is_small(file_info):
+                self._output([file_info])
+                continue
+            batch = [file_info]
+            pages = file_info.get('pages', 1)
+            deadline = time.time() + self.window
+            while len(batch) < self.max_jobs:
+                self._collecting = len(batch)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    next_info = self.inbox.get(timeout=remaining)
+                except Empty:
+                    break
+                if not self._is_small(next_info) or pages + next_info.get('pages', 1) > self.max_pages:
+                    # 不能加入当前批次，作为下一轮的第一个任务
+                    carry = next_info
+                    break
+                batch.append(next_info)
+                pages += next_info.get('pages', 1)
+            self._output(batch)
+
+    def _output(self, jobs):
+        count = len(jobs)
+        self._collecting = count
+        try:
+            if len(jobs) > 1:
+                try:
+                    jobs = [self._make_batch(jobs)]
+                    self.batches += 1
+                except Exception as e:
+                    logger.error(f"合并任务失败，逐个打印: {str(e)}")
+            for job in jobs:
+                self._emit(job)
+        except Exception as e:
+            logger.error(f"输出合并任务出错: {str(e)}")
+        finally:
+            self.processed += count
+            self._collecting = 0
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+负载和基准测试脚本
+模拟多个客户端并发上传PDF（普通上传或分块上传）并轮询任务状态，
+统计上传吞吐量、每分钟完成的任务数、延迟百分位和峰值内存，结果以JSON输出。
+
+进程内运行（默认，在临时目录中启动应用并使用N台模拟打印机）：
+    python benchmark.py --clients 8 --jobs 20 --printers 4 --sizes 64K,1M,8M --chunked 0.5
+
+对运行中的服务运行（打印机数量等由服务的环境变量决定）：
+    python benchmark.py --url http://127.0.0.1:5000 --clients 8 --jobs 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from sample_documents import make_pdf
+
+logger = logging.getLogger("benchmark")
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 * 1024}
+FINISHED_STATES = ('completed', 'error')
+# 准入控制拒绝时返回的状态码，客户端按Retry-After等待后重试
+RETRY_STATUSES = (429, 503)
+
+
+def parse_size(text):
+    """解析 64K、8M 形式的文件大小"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def encode_multipart(fields, filename, data):
+    """编码multipart请求体，表单字段放在文件数据之前，返回 (请求体, Content-Type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n'.encode())
+    parts.append(data)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def summarize(values):
+    """延迟统计（秒）：次数、平均值、p50、p90、p99和最大值"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(p):
+        # 最近秩法
+        return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 6),
+        'p50': round(percentile(50), 6),
+        'p90': round(percentile(90), 6),
+        'p99': round(percentile(99), 6),
+        'max': round(ordered[-1], 6)
+    }
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存（Linux上ru_maxrss以KB为单位）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class InProcessClient:
+    """通过Flask测试客户端在进程内调用应用，每个模拟客户端使用不同的来源地址"""
+
+    def __init__(self, app, remote_addr='127.0.0.1'):
+        self._client = app.test_client()
+        self.remote_addr = remote_addr
+
+    def request(self, method, path, body=None, content_type=None):
+        response = self._client.open(path, method=method, data=body, content_type=content_type,
+                                     environ_base={'REMOTE_ADDR': self.remote_addr})
+        return response.status_code, response.get_data(), response.headers
+
+
+class HttpClient:
+    """通过HTTP调用运行中的服务"""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, content_type=None):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            req.add_header('Content-Type', content_type)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+
+class BenchmarkClient:
+    """一个模拟客户端：依次上传计划中的文件，同时按固定间隔批量查询自己任务的状态"""
+
+    def __init__(self, transport, plan, args, start_event):
+        self.transport = transport
+        self.plan = plan
+        self.args = args
+        self.start_event = start_event
+        self.upload_latencies = []
+        self.upload_bytes = 0
+        self.upload_failures = 0
+        self.deferrals = 0
+        self.poll_latencies = []
+        self.job_latencies = []
+        self.final_states = {}
+        self.last_finished_at = None
+        # 文件ID -> 上传开始时间
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._uploads_done = threading.Event()
+
+    def _request(self, method, path, body, content_type):
+        """发送请求，被准入控制拒绝时按Retry-After等待后重试"""
+        for _ in range(self.args.max_retries + 1):
+            status, data, headers = self.transport.request(method, path, body, content_type)
+            if status not in RETRY_STATUSES or 'Retry-After' not in headers:
+                break
+            self.deferrals += 1
+            time.sleep(float(headers['Retry-After']))
+        return status, json.loads(data) if data else {}
+
+    def _json(self, method, path, payload=None):
+        body = None if payload is None else json.dumps(payload).encode()
+        return self._request(method, path, body, 'application/json' if body else None)
+
+    def _post_file(self, path, fields, filename, data):
+        body, content_type = encode_multipart(fields, filename, data)
+        return self._request('POST', path, body, content_type)
+
+    def upload_plain(self, filename, data):
+        status, result = self._post_file('/api/print', {'client': self.args.client_prefix}, filename, data)
+        return result.get('file_id') if status == 200 else None
+
+    def upload_chunked(self, filename, data):
+        status, result = self._json('POST', '/api/chunk/init', {
+            'filename': filename,
+            'fileSize': len(data),
+            'chunkSize': self.args.chunk_size,
+            'client': self.args.client_prefix
+        })
+        if status != 200:
+            return None
+        file_id = result['file_id']
+        chunk_size = result['chunkSize']
+        for index in range(result['totalChunks']):
+            chunk = data[index * chunk_size:(index + 1) * chunk_size]
+            status, _ = self._post_file('/api/chunk/upload', {'chunkIndex': index, 'fileId': file_id},
+                                        filename, chunk)
+            if status != 200:
+                return None
+        status, _ = self._json('POST', '/api/chunk/complete', {'fileId': file_id})
+        return file_id if status == 200 else None
+
+    def run_uploads(self):
+        self.start_event.wait()
+        try:
+            for filename, data, chunked in self.plan:
+                start = time.perf_counter()
+                try:
+                    file_id = self.upload_chunked(filename, data) if chunked else self.upload_plain(filename, data)
+                except Exception as e:
+                    logger.warning(f"上传失败: {str(e)}")
+                    file_id = None
+                if file_id is None:
+                    self.upload_failures += 1
+                    continue
+                self.upload_latencies.append(time.perf_counter() - start)
+                self.upload_bytes += len(data)
+                with self._pending_lock:
+                    self._pending[file_id] = start
+                if self.args.think_time:
+                    time.sleep(self.args.think_time)
+        finally:
+            self._uploads_done.set()
+
+    def run_polls(self, deadline):
+        self.start_event.wait()
+        while time.monotonic() < deadline:
+            with self._pending_lock:
+                file_ids = list(self._pending)
+            if not file_ids:
+                if self._uploads_done.is_set():
+                    return
+                time.sleep(self.args.poll_interval)
+                continue
+            start = time.perf_counter()
+            try:
+                status, result = self._json('POST', '/api/status/batch', {'fileIds': file_ids})
+            except Exception as e:
+                logger.warning(f"状态查询失败: {str(e)}")
+                status, result = None, {}
+            now = time.perf_counter()
+            self.poll_latencies.append(now - start)
+            if status == 200:
+                with self._pending_lock:
+                    for file_id, state in result['statuses'].items():
+                        if state in FINISHED_STATES and file_id in self._pending:
+                            # 完成时间的精度受查询间隔限制
+                            self.job_latencies.append(now - self._pending.pop(file_id))
+                            self.final_states[file_id] = state
+                            self.last_finished_at = now
+            time.sleep(self.args.poll_interval)
+
+    @property
+    def unfinished(self):
+        with self._pending_lock:
+            return len(self._pending)
+
+
+def build_plans(args):
+    """按随机种子预先生成每个客户端要上传的文件，保证多次运行的负载相同"""
+    plans = []
+    for client_index in range(args.clients):
+        rng = random.Random(args.seed * 1000 + client_index)
+        plan = []
+        for job_index in range(args.jobs):
+            size = rng.choice(args.sizes)
+            pages = rng.randint(1, args.max_pages)
+            chunked = rng.random() < args.chunked
+            plan.append((f'bench_{client_index}_{job_index}.pdf', make_pdf(rng, pages, size), chunked))
+        plans.append(plan)
+    return plans
+
+
+def start_in_process_app(args, work_dir):
+    """在临时目录中导入应用，使用args.printers台模拟打印机"""
+    os.environ['WEBPRINT_PRINTERS'] = ','.join(f'bench{i + 1}' for i in range(args.printers))
+    os.environ['WEBPRINT_MOCK_TIME_SCALE'] = str(args.time_scale)
+    # 固定模拟打印机的成功/失败序列
+    os.environ['WEBPRINT_MOCK_SEED'] = str(args.seed)
+    # 应用使用相对于工作目录的上传和数据目录
+    os.chdir(work_dir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as webprint_app
+    webprint_app.start_background()
+    return webprint_app.app
+
+
+def server_peak_rss(transport):
+    """从服务的/metrics读取峰值内存，读取失败时返回None"""
+    try:
+        status, data, _ = transport.request('GET', '/metrics')
+    except Exception:
+        return None
+    if status != 200:
+        return None
+    for line in data.decode().splitlines():
+        if line.startswith('webprint_process_peak_rss_bytes '):
+            return int(float(line.split()[1]))
+    return None
+
+
+def run_benchmark(args, transport):
+    plans = build_plans(args)
+    start_event = threading.Event()
+    clients = [BenchmarkClient(transport(index), plan, args, start_event) for index, plan in enumerate(plans)]
+    deadline = time.monotonic() + args.timeout
+    threads = []
+    for client in clients:
+        threads.append(threading.Thread(target=client.run_uploads, daemon=True))
+        threads.append(threading.Thread(target=client.run_polls, args=(deadline,), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    start_event.set()
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    end = time.perf_counter()
+
+    upload_latencies = [value for client in clients for value in client.upload_latencies]
+    job_latencies = [value for client in clients for value in client.job_latencies]
+    poll_latencies = [value for client in clients for value in client.poll_latencies]
+    final_states = [state for client in clients for state in client.final_states.values()]
+    finished_at = [client.last_finished_at for client in clients if client.last_finished_at is not None]
+    jobs_elapsed = (max(finished_at) - start) if finished_at else 0
+    uploads_elapsed = end - start
+
+    return {
+        'config': {
+            'transport': 'http' if args.url else 'in-process',
+            'url': args.url,
+            'clients': args.clients,
+            'jobs_per_client': args.jobs,
+            'sizes': args.sizes,
+            'max_pages': args.max_pages,
+            'chunked_ratio': args.chunked,
+            'chunk_size': args.chunk_size,
+            'poll_interval': args.poll_interval,
+            'think_time': args.think_time,
+            'printers': None if args.url else args.printers,
+            'time_scale': None if args.url else args.time_scale,
+            'seed': args.seed
+        },
+        'duration_seconds': round(end - start, 3),
+        'uploads': {
+            'succeeded': len(upload_latencies),
+            'failed': sum(client.upload_failures for client in clients),
+            'deferred': sum(client.deferrals for client in clients),
+            'bytes': sum(client.upload_bytes for client in clients),
+            'per_second': round(len(upload_latencies) / uploads_elapsed, 3) if uploads_elapsed else 0,
+            'latency_seconds': summarize(upload_latencies)
+        },
+        'jobs': {
+            'completed': final_states.count('completed'),
+            'error': final_states.count('error'),
+            'unfinished': sum(client.unfinished for client in clients),
+            'per_minute': round(len(final_states) / jobs_elapsed * 60, 3) if jobs_elapsed else 0,
+            'latency_seconds': summarize(job_latencies)
+        },
+        'polls': {
+            'latency_seconds': summarize(poll_latencies)
+        },
+        'peak_rss_bytes': {
+            'benchmark': peak_rss_bytes(),
+            'server': None if not args.url else server_peak_rss(transport(0))
+        }
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='WebPrint 负载和基准测试')
+    parser.add_argument('--url', help='运行中的服务地址，不指定时在进程内启动应用')
+    parser.add_argument('--clients', type=int, default=4, help='并发客户端数')
+    parser.add_argument('--jobs', type=int, default=10, help='每个客户端上传的文件数')
+    parser.add_argument('--sizes', default='64K,1M', help='文件大小，逗号分隔，每个文件随机选择一个')
+    parser.add_argument('--max-pages', type=int, default=5, help='每个文件的最大页数')
+    parser.add_argument('--chunked', type=float, default=0.0, help='使用分块上传的文件比例（0-1）')
+    parser.add_argument('--chunk-size', type=parse_size, default='1M', help='分块上传的分块大小')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='每个客户端查询状态的间隔（秒）')
+    parser.add_argument('--think-time', type=float, default=0.0, help='客户端两次上传之间的间隔（秒）')
+    parser.add_argument('--printers', type=int, default=2, help='模拟打印机数量（仅进程内运行）')
+    parser.add_argument('--time-scale', type=float, default=0.01, help='模拟打印耗时的缩放比例（仅进程内运行）')
+    parser.add_argument('--max-retries', type=int, default=20, help='请求被准入控制拒绝后的最大重试次数')
+    parser.add_argument('--timeout', type=float, default=600, help='等待所有任务结束的最长时间（秒）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--client-prefix', default='bench', help='上传时使用的客户端标识')
+    parser.add_argument('--output', help='结果写入的JSON文件，不指定时输出到标准输出')
+    parser.add_argument('--verbose', action='store_true', help='输出应用日志')
+    args = parser.parse_args(argv)
+    args.sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stderr)
+        ]
+    )
+
+    with tempfile.TemporaryDirectory(prefix='webprint-bench-') as work_dir:
+        # transport(客户端序号) 返回该客户端使用的连接
+        if args.url:
+            http_client = HttpClient(args.url)
+            transport = lambda index: http_client
+        else:
+            app = start_in_process_app(args, work_dir)
+            transport = lambda index: InProcessClient(app, f"10.0.{index // 250}.{index % 250 + 1}")
+            if not args.verbose:
+                # 只保留基准测试自身的日志
+                logging.getLogger().setLevel(logging.WARNING)
+                logger.setLevel(logging.INFO)
+
+        logger.info(f"开始基准测试: {args.clients} 个客户端，每个上传 {args.jobs} 个文件")
+        result = run_benchmark(args, transport)
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    logger.info(f"上传 {result['uploads']['per_second']}/秒，完成任务 {result['jobs']['per_minute']}/分钟，"
+                f"任务延迟p99 {result['jobs']['latency_seconds'].get('p99')}秒")
+    return 0 if result['jobs']['unfinished'] == 0 and result['uploads']['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
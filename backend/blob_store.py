@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按内容哈希寻址的文件存储
+保存已上传文件的副本（硬链接），总大小超过上限时按最近最少使用顺序淘汰；
+多个进程可以共享同一存储目录
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from process_lock import FileLock
+
+logger = logging.getLogger("web-printer.blobs")
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# 保存和淘汰时持有的锁文件（位于存储目录中），多个进程共享同一存储
+_LOCK_FILENAME = 'store.lock'
+# 计算哈希时的读取缓冲区大小
+_HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def is_valid_hash(value):
+    """检查是否为小写十六进制的SHA-256值"""
+    return isinstance(value, str) and bool(_HASH_RE.match(value))
+
+
+def file_sha256(path):
+    """计算文件的SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(_HASH_BUFFER_SIZE)
+            if not buf:
+                break
+            hasher.update(buf)
+    return hasher.hexdigest()
+
+
+def derived_key(content_hash, options):
+    """由原文件内容哈希和处理参数生成处理结果（如转换后的PDF）的存储键"""
+    return hashlib.sha256(f"{content_hash}:{options}".encode('utf-8')).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """优先创建硬链接，跨文件系统等情况下退回复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class BlobStore:
+    """有容量上限的LRU内容存储
+
+    磁盘上的文件就是索引：多个进程共享同一目录，一个进程保存的内容其他进程立即可以取出；
+    使用时间记录在文件的修改时间中，保存和淘汰通过目录中的文件锁在进程之间互斥，
+    淘汰时按磁盘上所有文件的总大小计算，上限不随进程数增加。
+
+    Args:
+        root: 存储目录
+        max_bytes: 所有文件的总大小上限
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if not os.path.exists(root):
+            os.makedirs(root)
+        entries = self._scan()
+        if entries:
+            logger.info(f"存储中有 {len(entries)} 个文件，共 {sum(size for _, _, size in entries)} 字节")
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _scan(self):
+        """读取磁盘上的所有内容，返回按最近使用时间从旧到新排列的 (使用时间, 键, 大小)"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not is_valid_hash(name):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    # 其他进程刚刚淘汰
+                    continue
+                entries.append((max(st.st_atime, st.st_mtime), name, st.st_size))
+        entries.sort()
+        return entries
+
+    def _touch(self, path):
+        """更新使用时间，其他进程淘汰时按修改时间排序；显式传入当前时间，不使用精度较低的文件系统时钟"""
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key, dst):
+        """把内容复制（硬链接）到dst，命中返回True"""
+        path = self._path(key)
+        try:
+            # 与其他进程的淘汰同时发生时，已创建的硬链接或已打开的文件不受删除影响
+            link_or_copy(path, dst)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        self._touch(path)
+        return True
+
+    def lookup(self, key):
+        """返回内容的文件路径并更新使用时间，不存在时返回None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def put(self, key, src):
+        """把src的内容以key保存（已存在时只更新使用时间）"""
+        size = os.path.getsize(src)
+        if size > self.max_bytes:
+            return False
+        path = self._path(key)
+        with self._lock, FileLock(os.path.join(self.root, _LOCK_FILENAME)):
+            if os.path.exists(path):
+                self._touch(path)
+                return True
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            link_or_copy(src, tmp_path)
+            os.replace(tmp_path, path)
+            # 硬链接保留了原文件的修改时间
+            self._touch(path)
+            self._evict_locked()
+        return True
+
+    def _evict_locked(self):
+        """按磁盘上的总大小淘汰最久未使用的内容，调用者持有文件锁"""
+        entries = self._scan()
+        total_bytes = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            logger.info(f"淘汰缓存文件: {key} ({size}字节)")
+
+    def stats(self):
+        entries = self._scan()
+        with self._lock:
+            return {
+                'entries': len(entries),
+                'bytes': sum(size for _, _, size in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
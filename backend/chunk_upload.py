@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分块上传状态跟踪
+元数据只在初始化时写入一次；已接收的分块记录在与文件映射（mmap）的位图中，
+每个分块占一个字节，标记分块只需一次单字节写入，并发上传无需加锁也不会丢失记录
+"""
+
+import json
+import mmap
+import os
+import threading
+import uuid
+
+METADATA_FILENAME = 'metadata.json'
+BITMAP_FILENAME = 'received.bitmap'
+# 进入完成阶段的标记文件，多个进程收到同一上传的完成请求时只有一个能创建
+CLAIM_FILENAME = 'claimed'
+
+# 每个上传的最大分块数
+MAX_CHUNKS = 1000
+# 推荐分块大小的范围
+MIN_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# 单个上传的最大并行分块数，以及所有进行中的上传共享的并行分块总数
+MAX_PARALLEL_PER_UPLOAD = 6
+MAX_PARALLEL_TOTAL = 32
+
+
+class ChunkBitmap:
+    """与文件共享映射的分块接收位图，多个线程或进程可以同时标记"""
+
+    def __init__(self, path, total_chunks):
+        self.path = path
+        self.total_chunks = total_chunks
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < total_chunks:
+                os.ftruncate(fd, total_chunks)
+            self._mm = mmap.mmap(fd, total_chunks, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+    def mark(self, index):
+        self._mm[index] = 1
+
+    def is_set(self, index):
+        return self._mm[index] == 1
+
+    def all_set(self):
+        return self._mm.find(b'\x00') == -1
+
+    def count(self):
+        return self.total_chunks - self._mm[:].count(b'\x00')
+
+    def missing(self):
+        """返回所有未接收的分块索引"""
+        data = self._mm[:]
+        missing = []
+        index = data.find(b'\x00')
+        while index != -1:
+            missing.append(index)
+            index = data.find(b'\x00', index + 1)
+        return missing
+
+    def received(self):
+        """返回所有已接收的分块索引"""
+        data = self._mm[:]
+        return [i for i in range(self.total_chunks) if data[i]]
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+
+
+class ChunkUpload:
+    """一次分块上传：元数据、分块目录和接收位图"""
+
+    def __init__(self, chunk_dir, metadata):
+        self.chunk_dir = chunk_dir
+        self.metadata = metadata
+        self.bitmap = ChunkBitmap(os.path.join(chunk_dir, BITMAP_FILENAME), metadata['totalChunks'])
+        self._lock = threading.Lock()
+        self._claimed = False
+
+    @property
+    def file_id(self):
+        return self.metadata['id']
+
+    def path(self, name):
+        return os.path.join(self.chunk_dir, name)
+
+    @property
+    def claimed(self):
+        with self._lock:
+            return self._claimed or os.path.exists(self.path(CLAIM_FILENAME))
+
+    def claim(self):
+        """标记上传进入完成阶段，只有第一次调用返回True（包括其他进程的调用）"""
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            try:
+                os.close(os.open(self.path(CLAIM_FILENAME), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+            except FileExistsError:
+                return False
+            return True
+
+    def close(self):
+        self.bitmap.close()
+
+
+class ChunkUploadRegistry:
+    """缓存打开的分块上传，避免每个分块都重新读取元数据"""
+
+    def __init__(self, chunks_folder):
+        self.chunks_folder = chunks_folder
+        self._lock = threading.Lock()
+        self._uploads = {}
+
+    def create(self, metadata):
+        """创建分块目录并写入元数据"""
+        chunk_dir = os.path.join(self.chunks_folder, metadata['id'])
+        if not os.path.exists(chunk_dir):
+            os.makedirs(chunk_dir)
+        with open(os.path.join(chunk_dir, METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f)
+        upload = ChunkUpload(chunk_dir, metadata)
+        with self._lock:
+            self._uploads[metadata['id']] = upload
+        return upload
+
+    def get(self, file_id):
+        """获取分块上传，不存在或ID无效时返回None"""
+        with self._lock:
+            upload = self._uploads.get(file_id)
+            if upload is not None:
+                return upload
+            if not is_valid_file_id(file_id):
+                return None
+            # 服务重启后或由其他进程初始化的上传，从磁盘加载
+            chunk_dir = os.path.join(self.chunks_folder, file_id)
+            try:
+                with open(os.path.join(chunk_dir, METADATA_FILENAME), 'r') as f:
+                    metadata = json.load(f)
+            except FileNotFoundError:
+                return None
+            upload = ChunkUpload(chunk_dir, metadata)
+            self._uploads[file_id] = upload
+            return upload
+
+    def discard(self, file_id):
+        """从缓存中移除并关闭分块上传（不删除磁盘文件）"""
+        with self._lock:
+            upload = self._uploads.pop(file_id, None)
+        if upload is not None:
+            upload.close()
+
+    def load_all(self):
+        """加载磁盘上所有未完成的分块上传（服务重启后用于断点续传）"""
+        if not os.path.exists(self.chunks_folder):
+            return 0
+        loaded = 0
+        for name in os.listdir(self.chunks_folder):
+            if self.get(name) is not None:
+                loaded += 1
+        return loaded
+
+    def find_by_hash(self, file_hash, file_size):
+        """查找内容哈希和大小相同、尚未完成的上传，包括其他进程初始化的上传"""
+        self.load_all()
+        for upload in self.all():
+            if not os.path.exists(upload.chunk_dir):
+                # 已由其他进程完成或清理
+                self.discard(upload.file_id)
+                continue
+            metadata = upload.metadata
+            if (metadata.get('fileHash') == file_hash and metadata['fileSize'] == file_size
+                    and not upload.claimed):
+                return upload
+        return None
+
+    def all(self):
+        with self._lock:
+            return list(self._uploads.values())
+
+    def expired(self, max_age, now):
+        """返回缓存中创建时间早于max_age秒之前的上传"""
+        with self._lock:
+            return [upload for upload in self._uploads.values()
+                    if now - upload.metadata['timestamp'] > max_age]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._uploads)
+
+
+def recommend_upload_params(file_size, active_uploads):
+    """根据服务器负载推荐分块大小和并行分块数
+
+    进行中的上传越多，每个上传分到的并行数越少，分块也越大以减少请求数；
+    空闲时使用较小的分块让多个并行流都有足够的分块可传。
+
+    Returns:
+        (分块大小, 最大并行分块数)
+    """
+    max_parallel = max(1, min(MAX_PARALLEL_PER_UPLOAD, MAX_PARALLEL_TOTAL // (active_uploads + 1)))
+    # 每个并行流大约分到4个分块
+    chunk_size = -(-file_size // (max_parallel * 4))
+    chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, chunk_size))
+    # 按MiB向上取整，并保证分块数不超过上限
+    chunk_size = -(-chunk_size // MIN_CHUNK_SIZE) * MIN_CHUNK_SIZE
+    chunk_size = max(chunk_size, -(-file_size // MAX_CHUNKS))
+    return chunk_size, max_parallel
+
+
+def is_valid_file_id(file_id):
+    """文件ID必须是UUID，防止通过ID访问分块目录以外的路径"""
+    try:
+        return str(uuid.UUID(file_id)) == file_id
+    except (ValueError, TypeError, AttributeError):
+        return False
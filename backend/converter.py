@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+DOCX转PDF转换器池
+维护若干常驻的LibreOffice进程，每个进程使用独立的用户配置目录和监听端口，
+通过UNO接口复用进程完成转换，避免每个文档都冷启动soffice
+
+LibreOffice的Python UNO模块（uno）不可用时，退回到每次调用
+soffice --convert-to，但仍使用每个工作槽独立且已初始化的用户配置目录，
+并限制同时进行的转换数量
+"""
+
+import logging
+import os
+import pathlib
+import socket
+import subprocess
+import threading
+import time
+from queue import Queue, Empty
+
+logger = logging.getLogger("web-printer.converter")
+
+# 可选依赖：LibreOffice自带的Python UNO模块
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+
+class ConversionError(Exception):
+    """文档转换失败"""
+
+
+def _file_url(path):
+    return pathlib.Path(os.path.abspath(path)).as_uri()
+
+
+class SofficeWorker:
+    """单个转换工作槽，对应一个soffice进程及其用户配置目录"""
+
+    def __init__(self, index, work_dir, soffice='soffice', port=None, timeout=120, max_jobs=200):
+        self.index = index
+        self.soffice = soffice
+        self.port = port
+        self.timeout = timeout
+        # 处理一定数量的文档后重启进程，避免长期运行的内存泄漏
+        self.max_jobs = max_jobs
+        self.profile_dir = os.path.join(work_dir, f'profile-{index}')
+        self.jobs_done = 0
+        self.process = None
+        self._desktop = None
+
+    @property
+    def uses_uno(self):
+        return uno is not None and self.port is not None
+
+    def _base_args(self):
+        return [self.soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+                f'-env:UserInstallation={_file_url(self.profile_dir)}']
+
+    def start(self):
+        """启动常驻进程（仅UNO模式）"""
+        if not self.uses_uno:
+            return
+        args = self._base_args() + [
+            f'--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext'
+        ]
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._desktop = None
+        self.jobs_done = 0
+        # 等待监听端口就绪
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise ConversionError(f"soffice进程启动失败，退出码: {self.process.returncode}")
+            if self._port_open():
+                logger.info(f"转换进程 {self.index} 已启动，端口: {self.port}")
+                return
+            time.sleep(0.2)
+        self.stop()
+        raise ConversionError("等待soffice监听端口超时")
+
+    def stop(self):
+        self._desktop = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def _port_open(self):
+        try:
+            with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def healthy(self):
+        """检查进程是否存活且可以连接"""
+        if not self.uses_uno:
+            return True
+        return self.process is not None and self.process.poll() is None and self._port_open()
+
+    def ensure_ready(self):
+        """健康检查失败或达到处理上限时重启进程"""
+        if not self.uses_uno:
+            return
+        if self.jobs_done >= self.max_jobs or not self.healthy():
+            if self.process is not None:
+                logger.warning(f"重启转换进程 {self.index}，已处理 {self.jobs_done} 个文档")
+            self.stop()
+            self.start()
+
+    def convert(self, src_path, out_dir):
+        """把src_path转换为PDF并保存到out_dir，返回PDF路径"""
+        pdf_path = os.path.join(out_dir, os.path.splitext(os.path.basename(src_path))[0] + '.pdf')
+        if self.uses_uno:
+            self._convert_uno(src_path, pdf_path)
+        else:
+            self._convert_cli(src_path, out_dir)
+        self.jobs_done += 1
+        if not os.path.exists(pdf_path):
+            raise ConversionError(f"转换后找不到PDF文件: {pdf_path}")
+        return pdf_path
+
+    def _connect(self):
+        if self._desktop is None:
+            local_ctx = uno.getComponentContext()
+            resolver = local_ctx.ServiceManager.createInstanceWithContext(
+                'com.sun.star.bridge.UnoUrlResolver', local_ctx)
+            ctx = resolver.resolve(
+                f'uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext')
+            self._desktop = ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+        return self._desktop
+
+    def _convert_uno(self, src_path, pdf_path):
+        def prop(name, value):
+            p = PropertyValue()
+            p.Name = name
+            p.Value = value
+            return p
+
+        # UNO调用没有超时，文档导致soffice卡住时由看门狗结束进程，阻塞中的调用随连接断开而返回
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            self._kill()
+
+        watchdog = threading.Timer(self.timeout, kill)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            desktop = self._connect()
+            doc = desktop.loadComponentFromURL(_file_url(src_path), '_blank', 0, (prop('Hidden', True),))
+            if doc is None:
+                raise ConversionError(f"无法打开文档: {src_path}")
+            try:
+                doc.storeToURL(_file_url(pdf_path), (prop('FilterName', 'writer_pdf_Export'),))
+            finally:
+                doc.close(True)
+        except Exception as e:
+            # 连接可能已失效，下次使用前重新检查
+            self._desktop = None
+            if timed_out.is_set():
+                raise ConversionError(f"转换超过 {self.timeout} 秒未完成: {src_path}")
+            if isinstance(e, ConversionError):
+                raise
+            raise ConversionError(f"UNO转换失败: {str(e)}")
+        finally:
+            watchdog.cancel()
+
+    def _kill(self):
+        """强制结束卡住的进程，下次使用前由ensure_ready重新启动"""
+        process = self.process
+        if process is not None and process.poll() is None:
+            logger.warning(f"转换进程 {self.index} 超过 {self.timeout} 秒未完成转换，强制结束")
+            process.kill()
+
+    def _convert_cli(self, src_path, out_dir):
+        args = self._base_args() + ['--convert-to', 'pdf', '--outdir', out_dir, src_path]
+        try:
+            subprocess.run(args, check=True, timeout=self.timeout,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            raise ConversionError(f"soffice转换失败: {str(e)}")
+
+
+class ConverterPool:
+    """固定大小的转换工作槽池
+
+    Args:
+        size: 工作槽数量，即同时进行的最大转换数
+        work_dir: 存放各工作槽用户配置目录的目录
+        soffice: soffice可执行文件
+        base_port: UNO监听端口的起始值，第i个工作槽使用base_port+i；为None时不启动常驻进程
+        timeout: 单次转换或进程启动的超时时间（秒）
+    """
+
+    def __init__(self, size, work_dir, soffice='soffice', base_port=2002, timeout=120):
+        self.size = size
+        self.work_dir = work_dir
+        self.timeout = timeout
+        self._workers = [SofficeWorker(i, work_dir, soffice, None if base_port is None else base_port + i, timeout)
+                         for i in range(size)]
+        self._idle = Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        if uno is None:
+            logger.info("未找到UNO模块，DOCX转换将为每个文档启动soffice")
+
+    def start(self):
+        """预先启动所有常驻进程（可选，否则在首次使用时启动）"""
+        for worker in self._workers:
+            try:
+                worker.ensure_ready()
+            except ConversionError as e:
+                logger.error(f"启动转换进程 {worker.index} 失败: {str(e)}")
+
+    def convert(self, src_path, out_dir):
+        """使用空闲的工作槽把文档转换为PDF，返回PDF路径"""
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except Empty:
+            raise ConversionError("等待空闲转换进程超时")
+        try:
+            worker.ensure_ready()
+            start_time = time.time()
+            pdf_path = worker.convert(src_path, out_dir)
+            logger.info(f"转换完成: {os.path.basename(src_path)}, 耗时: {time.time() - start_time:.2f}秒")
+            return pdf_path
+        except ConversionError:
+            # 转换失败时重启进程，避免卡死的进程影响后续任务
+            worker.stop()
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'uno': uno is not None,
+            'workers': [{'index': w.index, 'healthy': w.healthy(), 'jobs_done': w.jobs_done}
+                        for w in self._workers]
+        }
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文档信息提取
+读取待打印文件的页数、是否彩色以及图片分辨率，供调度器和耗时估算使用。
+PDF通过打开的文件对象按需读取，只解析页面树和少量页面的内容，不会把整个文件读入内存。
+"""
+
+import logging
+import re
+import zipfile
+
+import docx
+from docx.shared import RGBColor
+from PIL import Image
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger("web-printer.documents")
+
+# 判断是否彩色时最多检查的PDF页数
+MAX_SAMPLED_PAGES = 5
+# 无法读取页数时，按每页字符数估算DOCX的页数
+DOCX_CHARS_PER_PAGE = 1800
+# 判断图片是否彩色时缩小到的尺寸，及彩色像素的通道差阈值和比例
+_IMAGE_SAMPLE_SIZE = (64, 64)
+_IMAGE_COLOR_THRESHOLD = 24
+_IMAGE_COLOR_RATIO = 0.01
+
+# DOCX的docProps/app.xml中由Word保存的页数
+_DOCX_PAGES_RE = re.compile(rb'<(?:\w+:)?Pages>(\d+)</(?:\w+:)?Pages>')
+# PDF内容流中设置RGB/CMYK颜色的操作
+_PDF_RGB_RE = re.compile(rb'([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+(?:rg|RG)\b')
+_PDF_CMYK_RE = re.compile(rb'([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+[\d.]+\s+(?:k|K)\b')
+# 彩色的PDF颜色空间
+_PDF_COLOR_SPACES = {'/DeviceRGB', '/DeviceCMYK', '/CalRGB', '/Lab', '/Separation', '/DeviceN'}
+_GRAY_MODES = {'1', 'L', 'LA', 'I', 'F', 'I;16'}
+
+
+def inspect_document(path):
+    """返回文件的页数、是否彩色，图片还包括宽高（像素）和分辨率（dpi）
+
+    无法读取时按一页黑白处理。
+    """
+    lower = path.lower()
+    try:
+        if lower.endswith('.pdf'):
+            return _inspect_pdf(path)
+        if lower.endswith('.docx'):
+            return _inspect_docx(path)
+        if lower.endswith(('.jpg', '.jpeg', '.png')):
+            return _inspect_image(path)
+    except Exception as e:
+        logger.warning(f"无法读取文档信息: {path}, {str(e)}")
+    return {'pages': 1, 'color': False}
+
+
+def _inspect_pdf(path):
+    with open(path, 'rb') as f:
+        reader = PdfReader(f, strict=False)
+        pages = len(reader.pages)
+        color = any(_pdf_page_has_color(reader.pages[i]) for i in range(min(pages, MAX_SAMPLED_PAGES)))
+    return {'pages': max(1, pages), 'color': color}
+
+
+def _pdf_color_space_is_color(space):
+    space = space.get_object() if hasattr(space, 'get_object') else space
+    if isinstance(space, list):
+        if not space:
+            return False
+        name = space[0]
+        if name == '/ICCBased':
+            # ICC颜色空间的通道数为3或4时是彩色
+            return space[1].get_object().get('/N', 1) >= 3
+        if name == '/Indexed':
+            return _pdf_color_space_is_color(space[1])
+        return name in _PDF_COLOR_SPACES
+    return space in _PDF_COLOR_SPACES
+
+
+def _pdf_page_has_color(page):
+    try:
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        color_spaces = resources.get('/ColorSpace')
+        if color_spaces is not None:
+            if any(_pdf_color_space_is_color(space) for space in color_spaces.get_object().values()):
+                return True
+        xobjects = resources.get('/XObject')
+        if xobjects is not None:
+            for xobject in xobjects.get_object().values():
+                xobject = xobject.get_object()
+                if xobject.get('/Subtype') == '/Image' and '/ColorSpace' in xobject:
+                    if _pdf_color_space_is_color(xobject['/ColorSpace']):
+                        return True
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b''
+        for match in _PDF_RGB_RE.finditer(data):
+            values = [float(v) for v in match.groups()]
+            if max(values) - min(values) > 0.01:
+                return True
+        for match in _PDF_CMYK_RE.finditer(data):
+            if any(float(v) > 0.01 for v in match.groups()):
+                return True
+    except Exception as e:
+        logger.warning(f"无法判断PDF页面是否彩色: {str(e)}")
+    return False
+
+
+def _inspect_docx(path):
+    pages = None
+    with zipfile.ZipFile(path) as archive:
+        try:
+            match = _DOCX_PAGES_RE.search(archive.read('docProps/app.xml'))
+            if match:
+                pages = int(match.group(1))
+        except KeyError:
+            pass
+    document = docx.Document(path)
+    if not pages:
+        chars = sum(len(paragraph.text) for paragraph in document.paragraphs)
+        page_breaks = document.element.xml.count('w:type="page"')
+        pages = max(-(-chars // DOCX_CHARS_PER_PAGE), page_breaks + 1)
+    # 包含图片或非黑色文字时视为彩色
+    color = len(document.inline_shapes) > 0
+    if not color:
+        for paragraph in document.paragraphs:
+            for run in paragraph.runs:
+                try:
+                    rgb = run.font.color.rgb
+                except Exception:
+                    continue
+                if rgb is not None and rgb != RGBColor(0, 0, 0):
+                    color = True
+                    break
+            if color:
+                break
+    return {'pages': max(1, pages), 'color': color}
+
+
+def _inspect_image(path):
+    with Image.open(path) as img:
+        width, height = img.size
+        dpi = img.info.get('dpi')
+        if img.mode in _GRAY_MODES:
+            color = False
+        else:
+            # JPEG可以直接以缩小的尺寸解码
+            img.draft('RGB', _IMAGE_SAMPLE_SIZE)
+            sample = img.convert('RGB')
+            sample.thumbnail(_IMAGE_SAMPLE_SIZE)
+            pixels = list(sample.getdata())
+            colored = sum(1 for r, g, b in pixels if max(r, g, b) - min(r, g, b) > _IMAGE_COLOR_THRESHOLD)
+            color = colored > len(pixels) * _IMAGE_COLOR_RATIO
+    return {
+        'pages': 1,
+        'color': color,
+        'width': width,
+        'height': height,
+        'dpi': int(round(dpi[0])) if dpi else None
+    }
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+打印耗时估算
+根据页数、是否彩色和图片像素数估算任务在打印机上的耗时，
+用于排队位置的预计开始时间和模拟打印机的打印时长
+"""
+
+from documents import inspect_document
+
+# 打印机速度模型（页/分钟）
+MONO_PAGES_PER_MINUTE = 30
+COLOR_PAGES_PER_MINUTE = 20
+# 每个任务的固定开销（接收、预热、出纸），秒
+JOB_OVERHEAD_SECONDS = 5
+# 打印机处理大图片的速度（百万像素/秒）
+RASTER_MEGAPIXELS_PER_SECOND = 8
+
+
+def estimate_print_seconds(pages, color=False, megapixels=0):
+    """估算打印耗时（秒）"""
+    pages_per_minute = COLOR_PAGES_PER_MINUTE if color else MONO_PAGES_PER_MINUTE
+    seconds = JOB_OVERHEAD_SECONDS + pages * 60 / pages_per_minute
+    return round(seconds + megapixels / RASTER_MEGAPIXELS_PER_SECOND, 1)
+
+
+def estimate_job(path):
+    """读取文件信息并估算打印耗时
+
+    Returns:
+        文档信息（pages、color，图片另有width、height、dpi）加上预计耗时seconds
+    """
+    estimate = inspect_document(path)
+    megapixels = estimate.get('width', 0) * estimate.get('height', 0) / 1e6
+    estimate['seconds'] = estimate_print_seconds(estimate['pages'], estimate['color'], megapixels)
+    return estimate
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SSE推送服务器
+一个线程以非阻塞方式（selectors）服务所有推送连接：空闲连接只占用一个文件描述符和很小的缓冲区，
+不占用WSGI工作线程，单个进程可以保持数千个连接。
+多个工作进程通过SO_REUSEPORT监听同一端口，由内核分配连接；每个进程都会收到所有任务的状态变化。
+"""
+
+import http
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger("web-printer.events")
+
+# 请求头的最大长度
+MAX_REQUEST_BYTES = 8192
+# 连接后发送完请求头的最长时间（秒）
+REQUEST_TIMEOUT = 10
+# 客户端接收太慢、待发送的数据超过该大小时断开，客户端重连后重新获取快照
+MAX_PENDING_BYTES = 256 * 1024
+# 事件循环的最长等待时间（秒），同时是检查心跳和超时的间隔
+LOOP_INTERVAL = 1
+# 推送连接之外需要的文件描述符数（上传文件、数据库、打印机连接等）
+RESERVED_FDS = 256
+
+_STREAM_HEADERS = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/event-stream; charset=utf-8\r\n'
+    'Cache-Control: no-cache\r\n'
+    'X-Accel-Buffering: no\r\n'
+    'Access-Control-Allow-Origin: *\r\n'
+    'Connection: close\r\n'
+    '\r\n'
+)
+
+
+class StreamRejected(Exception):
+    """拒绝推送请求
+
+    Args:
+        status: HTTP状态码
+        body: 响应的JSON内容
+        headers: 附加的响应头
+    """
+
+    def __init__(self, status, body, headers=None):
+        super().__init__(body.get('error', ''))
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+def raise_fd_limit(wanted):
+    """把本进程的文件描述符软上限提高到wanted（不超过硬上限），返回调整后的软上限"""
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError) as e:
+            logger.warning(f"无法提高文件描述符上限: {str(e)}")
+    return soft
+
+
+class _Connection:
+    """一个客户端连接：先读取请求头，之后持续推送事件"""
+
+    def __init__(self, sock, now):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.opened_at = now
+        self.last_write = now
+        # 推送开始后设置
+        self.sub = None
+        self.snapshot = None
+        self.encode = None
+        # 是否在等待可写
+        self.writing = False
+        # 发送完剩余数据后关闭
+        self.closing = False
+        self.closed = False
+
+
+class EventServer:
+    """在独立线程的事件循环中服务SSE推送连接
+
+    Args:
+        broker: 事件分发中心
+        address: 监听地址 (主机, 端口)，端口为0时自动分配
+        open_stream: open_stream(查询参数) 返回 (任务ID列表, snapshot, encode)；
+            snapshot()返回连接建立和缓冲区溢出时发送的完整状态，encode(事件)返回一条事件的文本；
+            参数无效时抛出StreamRejected
+        max_streams: 最大推送连接数
+        heartbeat: 没有事件时发送心跳的间隔（秒）
+        retry_after: 连接数已满时建议客户端等待的时间（秒）
+    """
+
+    def __init__(self, broker, address, open_stream, max_streams=10000, heartbeat=15, retry_after=60):
+        self.broker = broker
+        self.open_stream = open_stream
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.retry_after = retry_after
+        raise_fd_limit(max_streams + RESERVED_FDS)
+        family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+        self._listener = socket.create_server(address, family=family, backlog=1024,
+                                              reuse_port=hasattr(socket, 'SO_REUSEPORT'))
+        self._listener.setblocking(False)
+        self.address = self._listener.getsockname()[:2]
+        self._selector = selectors.DefaultSelector()
+        # 发布事件的线程通过该socket唤醒事件循环
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        # 有新事件的订阅者，由发布线程添加、事件循环取出
+        self._ready = set()
+        self._ready_lock = threading.Lock()
+        self._connections = set()
+        # 订阅者 -> 连接
+        self._streams = {}
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='event-server', daemon=True)
+        self._thread.start()
+        logger.info(f"推送服务器监听 {self.address[0]}:{self.address[1]}")
+
+    def close(self, timeout=5):
+        """断开所有连接并停止事件循环"""
+        self._stopping = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stream_count(self):
+        return len(self._streams)
+
+    def _wake(self):
+        try:
+            self._wake_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # 缓冲区已满说明事件循环已被唤醒；已关闭时无需唤醒
+            pass
+
+    def _notify(self, sub):
+        """订阅者有新事件，在发布事件的线程中调用"""
+        with self._ready_lock:
+            wake = not self._ready
+            self._ready.add(sub)
+        if wake:
+            self._wake()
+
+    def _run(self):
+        selector = self._selector
+        selector.register(self._listener, selectors.EVENT_READ, 'accept')
+        selector.register(self._wake_recv, selectors.EVENT_READ, 'wake')
+        last_tick = time.time()
+        try:
+            while not self._stopping:
+                for key, mask in selector.select(LOOP_INTERVAL):
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        self._drain_wake()
+                    else:
+                        conn = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._read(conn)
+                        if mask & selectors.EVENT_WRITE and not conn.closed:
+                            self._flush(conn)
+                self._deliver()
+                now = time.time()
+                if now - last_tick >= LOOP_INTERVAL:
+                    last_tick = now
+                    self._tick(now)
+        except Exception as e:
+            logger.error(f"推送服务器出错: {str(e)}")
+        finally:
+            for conn in list(self._connections):
+                self._close(conn)
+            selector.close()
+            self._listener.close()
+            self._wake_recv.close()
+            self._wake_send.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # 文件描述符耗尽等情况，连接留在监听队列中，稍后再接受
+                logger.warning(f"接受推送连接失败: {str(e)}")
+                time.sleep(0.1)
+                return
+            sock.setblocking(False)
+            conn = _Connection(sock, time.time())
+            self._connections.add(conn)
+            self._selector.register(sock, selectors.EVENT_READ, conn)
+
+    def _drain_wake(self):
+        try:
+            while self._wake_recv.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+        if not data:
+            self._close(conn)
+            return
+        # 推送开始后客户端发送的数据忽略
+        if conn.sub is not None or conn.closing:
+            return
+        conn.inbuf += data
+        end = conn.inbuf.find(b'\r\n\r\n')
+        if end == -1:
+            if len(conn.inbuf) > MAX_REQUEST_BYTES:
+                self._reject(conn, StreamRejected(431, {'error': '请求头过长'}))
+            return
+        self._open(conn, bytes(conn.inbuf[:end]))
+        conn.inbuf = bytearray()
+
+    def _open(self, conn, head):
+        """解析请求并开始推送"""
+        parts = head.split(b'\r\n', 1)[0].decode('latin-1').split()
+        if len(parts) != 3 or parts[0] != 'GET':
+            self._reject(conn, StreamRejected(405, {'error': '只支持GET请求'}))
+            return
+        try:
+            file_ids, snapshot, encode = self.open_stream(parse_qs(urlsplit(parts[1]).query))
+        except StreamRejected as e:
+            self._reject(conn, e)
+            return
+        sub = self.broker.subscribe(file_ids, limit=self.max_streams, notify=self._notify)
+        if sub is None:
+            logger.warning(f"推送连接数已达上限({self.max_streams})，客户端改用轮询")
+            self._reject(conn, StreamRejected(503, {'error': '推送连接数已满，请使用长轮询', 'fallback': 'poll'},
+                                              {'Retry-After': str(self.retry_after)}))
+            return
+        # 先订阅再取快照，避免两者之间的状态变化丢失
+        conn.sub = sub
+        conn.snapshot = snapshot
+        conn.encode = encode
+        self._streams[sub] = conn
+        try:
+            text = snapshot()
+        except Exception as e:
+            logger.error(f"生成推送快照失败: {str(e)}")
+            self._close(conn)
+            return
+        self._send(conn, _STREAM_HEADERS + 'retry: 3000\n\n' + text)
+
+    def _reject(self, conn, error):
+        body = json.dumps(error.body, ensure_ascii=False).encode('utf-8')
+        lines = [f'HTTP/1.1 {error.status} {http.HTTPStatus(error.status).phrase}',
+                 'Content-Type: application/json; charset=utf-8',
+                 f'Content-Length: {len(body)}',
+                 'Access-Control-Allow-Origin: *',
+                 'Connection: close']
+        lines += [f'{name}: {value}' for name, value in error.headers.items()]
+        conn.closing = True
+        conn.outbuf += ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+        self._flush(conn)
+
+    def _send(self, conn, text):
+        conn.outbuf += text.encode('utf-8')
+        if len(conn.outbuf) > MAX_PENDING_BYTES:
+            # 客户端接收太慢，断开后由EventSource重连并重新获取快照
+            logger.warning("推送连接接收太慢，断开连接")
+            self._close(conn)
+            return
+        self._flush(conn)
+
+    def _flush(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._close(conn)
+            return
+        if sent:
+            del conn.outbuf[:sent]
+            conn.last_write = time.time()
+        if not conn.outbuf and conn.closing:
+            self._close(conn)
+            return
+        writing = bool(conn.outbuf)
+        if writing != conn.writing:
+            conn.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(conn.sock, events, conn)
+
+    def _deliver(self):
+        """把新事件发送给对应的连接"""
+        with self._ready_lock:
+            ready, self._ready = self._ready, set()
+        for sub in ready:
+            conn = self._streams.get(sub)
+            if conn is None:
+                continue
+            events = sub.get(timeout=0)
+            try:
+                if sub.overflowed:
+                    # 事件积压导致丢失，重新发送完整快照
+                    sub.overflowed = False
+                    text = conn.snapshot()
+                else:
+                    text = ''.join(conn.encode(event) for event in events)
+            except Exception as e:
+                logger.error(f"生成推送事件失败: {str(e)}")
+                self._close(conn)
+                continue
+            if text:
+                self._send(conn, text)
+
+    def _tick(self, now):
+        """断开未及时发送请求的连接，给空闲的推送连接发送心跳"""
+        for conn in list(self._connections):
+            if conn.sub is None:
+                if now - conn.opened_at > REQUEST_TIMEOUT:
+                    self._close(conn)
+            elif not conn.outbuf and now - conn.last_write >= self.heartbeat:
+                self._send(conn, ': keepalive\n\n')
+
+    def _close(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        self._connections.discard(conn)
+        if conn.sub is not None:
+            self._streams.pop(conn.sub, None)
+            self.broker.unsubscribe(conn.sub)
+        try:
+            self._selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+事件推送模块
+将打印任务状态和队列变化分发给订阅者（Server-Sent Events 连接）
+"""
+
+import json
+import threading
+from collections import deque
+
+
+class Subscription:
+    """单个订阅者，持有一个有界的待发送事件缓冲区
+
+    Args:
+        file_ids: 关心的任务ID，None表示接收所有任务事件
+        max_pending: 缓冲区大小
+        notify: 有新事件时调用notify(订阅者)，用于在事件循环中等待事件，不需要为每个订阅者阻塞一个线程
+    """
+
+    def __init__(self, file_ids=None, max_pending=100, notify=None):
+        self.file_ids = set(file_ids) if file_ids is not None else None
+        self._events = deque(maxlen=max_pending)
+        self._cond = threading.Condition()
+        self._notify = notify
+        # 缓冲区溢出后需要客户端重新同步
+        self.overflowed = False
+
+    def wants(self, file_id):
+        """判断订阅者是否关心该任务"""
+        return file_id is None or self.file_ids is None or file_id in self.file_ids
+
+    def push(self, event):
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.overflowed = True
+            self._events.append(event)
+            self._cond.notify()
+        if self._notify is not None:
+            self._notify(self)
+
+    def get(self, timeout=None):
+        """取出所有待发送事件，没有事件时最多等待timeout秒，超时返回空列表"""
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class EventBroker:
+    """事件分发中心，发布者不会因为慢速订阅者而阻塞"""
+
+    def __init__(self, max_pending=100):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._max_pending = max_pending
+        self._next_id = 0
+
+    def subscribe(self, file_ids=None, limit=None, notify=None):
+        """添加订阅者；订阅者已达到limit个时返回None"""
+        sub = Subscription(file_ids, self._max_pending, notify)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data, file_id=None):
+        """发布事件；file_id不为空时只发给关心该任务的订阅者"""
+        with self._lock:
+            self._next_id += 1
+            event = (self._next_id, event_type, data)
+            subscribers = [sub for sub in self._subscribers if sub.wants(file_id)]
+        for sub in subscribers:
+            sub.push(event)
+
+
+def format_sse(event_type, data, event_id=None):
+    """按照Server-Sent Events格式编码一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
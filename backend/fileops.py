@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文件操作工具
+优先使用copy_file_range/sendfile在内核中复制数据，避免数据经过Python内存
+"""
+
+import errno
+import os
+
+# 内核复制不可用时回退到普通复制的错误码
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+# 单次系统调用复制的最大字节数
+_MAX_COPY_BYTES = 64 * 1024 * 1024
+# 普通复制的缓冲区大小
+_BUFFER_SIZE = 1024 * 1024
+
+
+def _copy_fd_kernel(copy_func, in_fd, out_fd, count):
+    """用给定的内核复制函数复制count字节，返回实际复制的字节数"""
+    copied = 0
+    while copied < count:
+        n = copy_func(in_fd, out_fd, min(count - copied, _MAX_COPY_BYTES))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_file_range(in_fd, out_fd, count):
+    return os.copy_file_range(in_fd, out_fd, count)
+
+
+def _sendfile(in_fd, out_fd, count):
+    return os.sendfile(out_fd, in_fd, None, count)
+
+
+def copy_fd(in_fd, out_fd, count):
+    """从in_fd的当前位置复制count字节到out_fd的当前位置，返回实际复制的字节数"""
+    copied = 0
+    for name, copy_func in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile)):
+        if not hasattr(os, name):
+            continue
+        try:
+            copied += _copy_fd_kernel(copy_func, in_fd, out_fd, count)
+        except OSError as e:
+            # 文件系统或平台不支持时在第一次调用就会失败，换下一种方式
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            continue
+        return copied
+
+    # 内核复制都不可用，分块读写
+    while copied < count:
+        buf = os.read(in_fd, min(count - copied, _BUFFER_SIZE))
+        if not buf:
+            break
+        view = memoryview(buf)
+        while view:
+            written = os.write(out_fd, view)
+            view = view[written:]
+        copied += len(buf)
+    return copied
+
+
+def concat_files(src_paths, dst_path):
+    """把多个文件按顺序拼接成目标文件，返回目标文件大小"""
+    total = 0
+    with open(dst_path, 'wb') as outfile:
+        out_fd = outfile.fileno()
+        for path in src_paths:
+            with open(path, 'rb') as infile:
+                size = os.fstat(infile.fileno()).st_size
+                copied = copy_fd(infile.fileno(), out_fd, size)
+                if copied != size:
+                    raise IOError(f"复制文件不完整: {path}, 预期{size}字节，实际{copied}字节")
+                total += copied
+    return total
+
+
+def preallocate(path, size):
+    """创建指定大小的稀疏文件，供分块按偏移直接写入"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def pwrite_stream(path, stream, offset, limit, hasher=None):
+    """把stream中的数据写入文件的offset处，最多写入limit字节
+
+    返回写入的字节数；stream中还有超出limit的数据时返回limit+1，由调用者拒绝该分块。
+    提供hasher时，写入的数据同时用于更新哈希。
+    """
+    fd = os.open(path, os.O_WRONLY)
+    written = 0
+    try:
+        while written < limit:
+            buf = stream.read(min(limit - written, _BUFFER_SIZE))
+            if not buf:
+                break
+            if hasher is not None:
+                hasher.update(buf)
+            view = memoryview(buf)
+            while view:
+                n = os.pwrite(fd, view, offset + written)
+                view = view[n:]
+                written += n
+        if written == limit and stream.read(1):
+            return limit + 1
+    finally:
+        os.close(fd)
+    return written
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+gunicorn配置，在backend目录下运行: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+import signal
+import sys
+
+# 上传目录和任务数据库使用相对路径，工作目录固定为backend
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.environ.get('WEBPRINT_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEBPRINT_WEB_WORKERS', multiprocessing.cpu_count()))
+# 长轮询请求在等待期间占用一个线程，使用多线程工作进程
+worker_class = 'gthread'
+threads = int(os.environ.get('WEBPRINT_WEB_THREADS', 16))
+# SSE连接由各工作进程中的推送服务器以非阻塞方式服务，不占用上面的线程；
+# /api/events重定向到该端口，各进程通过SO_REUSEPORT共享监听
+os.environ.setdefault('WEBPRINT_EVENTS_BIND', '0.0.0.0:5002')
+timeout = 120
+# 工作进程退出前等待已接收的任务打印完成（最长WEBPRINT_DRAIN_TIMEOUT秒），之后才会被强制结束
+graceful_timeout = float(os.environ.get('WEBPRINT_DRAIN_TIMEOUT', 30)) + 10
+# 不能预加载应用：调度线程和flock必须在各工作进程中创建
+preload_app = False
+
+
+def start_shutdown():
+    # 应用模块由wsgi.py在工作进程中导入
+    app = sys.modules.get('app')
+    if app is not None:
+        app.start_shutdown()
+
+
+def post_worker_init(worker):
+    """工作进程收到SIGTERM（正常关闭）时立即开始排空，gunicorn处理完进行中的请求之前上传接口返回503"""
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        start_shutdown()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_int(worker):
+    """SIGINT/SIGQUIT（快速关闭）时同样开始排空"""
+    start_shutdown()
+
+
+def worker_exit(server, worker):
+    """工作进程退出前等待排空完成"""
+    app = sys.modules.get('app')
+    if app is not None:
+        app.shutdown()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片规范化
+把上传的图片缩小到打印机分辨率下纸张可容纳的尺寸，去掉EXIF等元数据后重新编码，
+减小发送到打印机的数据量。JPEG使用缩小解码（draft），内存占用与目标尺寸相关而非原图尺寸。
+"""
+
+import logging
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("web-printer.imaging")
+
+# 纸张尺寸（英寸，短边 x 长边）
+PAPER_SIZES = {
+    'A4': (8.27, 11.69),
+    'A5': (5.83, 8.27),
+    'Letter': (8.5, 11.0)
+}
+JPEG_QUALITY = 85
+
+
+def target_size(width, height, dpi, paper='A4'):
+    """返回缩小后的尺寸；图片已不超过纸张在该分辨率下的像素数时返回None
+
+    长边对应纸张长边，横向和纵向图片都按打印时旋转后的方向计算。
+    """
+    short_inches, long_inches = PAPER_SIZES[paper]
+    scale = min(long_inches * dpi / max(width, height), short_inches * dpi / min(width, height))
+    if scale >= 1:
+        return None
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _flatten(img):
+    """去掉透明通道，透明部分按白纸处理"""
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB' if img.mode == 'RGBA' else 'L', img.size, 'white')
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    if img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def normalize_image(src, dst, dpi, paper='A4', grayscale=False):
+    """把src缩小并重新编码保存到dst，格式由dst的扩展名决定
+
+    Returns:
+        dst路径
+    """
+    with Image.open(src) as img:
+        icc_profile = img.info.get('icc_profile')
+        original_size = img.size
+        size = target_size(img.width, img.height, dpi, paper)
+        if size is not None:
+            # thumbnail会先用draft按2的幂缩小解码JPEG，再精确缩放
+            img.thumbnail(size, Image.LANCZOS, reducing_gap=3.0)
+        # 元数据去掉之前按EXIF方向旋转
+        img = ImageOps.exif_transpose(img)
+        img = _flatten(img)
+        if grayscale and img.mode != 'L':
+            img = img.convert('L')
+        options = {'dpi': (dpi, dpi)}
+        if icc_profile and img.mode == 'RGB':
+            options['icc_profile'] = icc_profile
+        if dst.lower().endswith(('.jpg', '.jpeg')):
+            img.save(dst, 'JPEG', quality=JPEG_QUALITY, optimize=True, **options)
+        else:
+            img.save(dst, 'PNG', optimize=True, **options)
+    logger.info(f"图片规范化: {original_size[0]}x{original_size[1]} -> {img.width}x{img.height}")
+    return dst
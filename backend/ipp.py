@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+IPP/1.1客户端（RFC 8010/8011）
+只实现打印所需的操作：Print-Job提交文档，Get-Job-Attributes查询任务状态。
+同一打印机的请求复用一个HTTP keep-alive连接，文档按块从文件流式发送。
+"""
+
+import http.client
+import itertools
+import logging
+import os
+import struct
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger("web-printer.ipp")
+
+IPP_VERSION = (1, 1)
+
+# 操作
+PRINT_JOB = 0x0002
+GET_JOB_ATTRIBUTES = 0x0009
+GET_PRINTER_ATTRIBUTES = 0x000B
+# 只读的操作，连接断开后可以重发；Print-Job发出文档后连接断开时打印机可能已经收到，重发会重复打印
+IDEMPOTENT_OPERATIONS = (GET_JOB_ATTRIBUTES, GET_PRINTER_ATTRIBUTES)
+
+# 属性组标签
+OPERATION_ATTRIBUTES = 0x01
+JOB_ATTRIBUTES = 0x02
+END_OF_ATTRIBUTES = 0x03
+PRINTER_ATTRIBUTES = 0x04
+UNSUPPORTED_ATTRIBUTES = 0x05
+
+# 值标签
+INTEGER = 0x21
+BOOLEAN = 0x22
+ENUM = 0x23
+TEXT = 0x41
+NAME = 0x42
+KEYWORD = 0x44
+URI = 0x45
+CHARSET = 0x47
+NATURAL_LANGUAGE = 0x48
+MIME_MEDIA_TYPE = 0x49
+
+_INTEGER_TAGS = (INTEGER, ENUM)
+_STRING_TAGS = (TEXT, NAME, KEYWORD, URI, CHARSET, NATURAL_LANGUAGE, MIME_MEDIA_TYPE, 0x46, 0x4A)
+
+# 任务状态（job-state）
+JOB_PENDING = 3
+JOB_PENDING_HELD = 4
+JOB_PROCESSING = 5
+JOB_PROCESSING_STOPPED = 6
+JOB_CANCELED = 7
+JOB_ABORTED = 8
+JOB_COMPLETED = 9
+JOB_FINISHED_STATES = (JOB_CANCELED, JOB_ABORTED, JOB_COMPLETED)
+
+# 状态码0x0000-0x00FF表示成功
+STATUS_OK = 0x0000
+
+_DOCUMENT_FORMATS = {
+    '.pdf': 'application/pdf',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png'
+}
+_SEND_BUFFER_SIZE = 256 * 1024
+
+
+class IPPError(Exception):
+    """IPP请求失败或打印机返回错误状态"""
+
+
+def document_format(path):
+    """按扩展名返回文档的MIME类型"""
+    return _DOCUMENT_FORMATS.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+def _encode_value(value_tag, value):
+    if value_tag in _INTEGER_TAGS:
+        return struct.pack('>i', value)
+    if value_tag == BOOLEAN:
+        return b'\x01' if value else b'\x00'
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+def encode_message(code, request_id, groups, version=IPP_VERSION):
+    """编码IPP消息（请求或响应）
+
+    Args:
+        code: 请求的操作或响应的状态码
+        groups: [(属性组标签, [(值标签, 属性名, 值或值列表), ...]), ...]
+    """
+    parts = [struct.pack('>BBHi', version[0], version[1], code, request_id)]
+    for group_tag, attributes in groups:
+        parts.append(struct.pack('>B', group_tag))
+        for value_tag, name, values in attributes:
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for i, value in enumerate(values):
+                # 多值属性的后续值属性名为空
+                name_bytes = name.encode('utf-8') if i == 0 else b''
+                value_bytes = _encode_value(value_tag, value)
+                parts.append(struct.pack('>BH', value_tag, len(name_bytes)) + name_bytes)
+                parts.append(struct.pack('>H', len(value_bytes)) + value_bytes)
+    parts.append(struct.pack('>B', END_OF_ATTRIBUTES))
+    return b''.join(parts)
+
+
+def _decode_value(value_tag, data):
+    if value_tag in _INTEGER_TAGS and len(data) == 4:
+        return struct.unpack('>i', data)[0]
+    if value_tag == BOOLEAN and len(data) == 1:
+        return data != b'\x00'
+    if value_tag in _STRING_TAGS:
+        return data.decode('utf-8', errors='replace')
+    return data
+
+
+def decode_message(data):
+    """解码IPP消息
+
+    Returns:
+        (操作或状态码, 请求ID, 属性组列表, 属性之后的文档数据起始偏移)
+        属性组列表元素为 (属性组标签, {属性名: [值, ...]})
+    """
+    if len(data) < 9:
+        raise IPPError("IPP消息不完整")
+    _, _, code, request_id = struct.unpack('>BBHi', data[:8])
+    groups = []
+    offset = 8
+    current = None
+    name = None
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        if tag == END_OF_ATTRIBUTES:
+            return code, request_id, groups, offset
+        if tag < 0x10:
+            current = {}
+            groups.append((tag, current))
+            continue
+        if current is None or offset + 4 > len(data):
+            raise IPPError("IPP属性格式错误")
+        name_length = struct.unpack('>H', data[offset:offset + 2])[0]
+        offset += 2
+        if name_length:
+            name = data[offset:offset + name_length].decode('utf-8', errors='replace')
+            current.setdefault(name, [])
+        offset += name_length
+        value_length = struct.unpack('>H', data[offset:offset + 2])[0]
+        offset += 2
+        value = _decode_value(tag, data[offset:offset + value_length])
+        offset += value_length
+        if name is not None:
+            current[name].append(value)
+    raise IPPError("IPP消息缺少属性结束标签")
+
+
+def find_attribute(groups, group_tag, name, default=None):
+    """返回指定属性组中属性的第一个值"""
+    for tag, attributes in groups:
+        if tag == group_tag and attributes.get(name):
+            return attributes[name][0]
+    return default
+
+
+class IPPClient:
+    """与一台IPP打印机通信的客户端，请求之间复用同一个HTTP连接
+
+    Args:
+        printer_uri: 打印机URI，如 ipp://host:631/printers/office
+        timeout: 网络超时时间（秒）
+        user: requesting-user-name
+    """
+
+    def __init__(self, printer_uri, timeout=30, user='webprint'):
+        self.printer_uri = printer_uri
+        self.timeout = timeout
+        self.user = user
+        parsed = urlparse(printer_uri)
+        self._secure = parsed.scheme in ('ipps', 'https')
+        self._host = parsed.hostname
+        self._port = parsed.port or (443 if parsed.scheme == 'https' else 631)
+        self._path = parsed.path or '/'
+        self._conn = None
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        # 建立的连接数，用于确认连接被复用
+        self.connections_opened = 0
+
+    def _connection(self):
+        if self._conn is None:
+            conn_class = http.client.HTTPSConnection if self._secure else http.client.HTTPConnection
+            self._conn = conn_class(self._host, self._port, timeout=self.timeout)
+            self.connections_opened += 1
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _operation_attributes(self):
+        return [
+            (CHARSET, 'attributes-charset', 'utf-8'),
+            (NATURAL_LANGUAGE, 'attributes-natural-language', 'en'),
+            (URI, 'printer-uri', self.printer_uri),
+            (NAME, 'requesting-user-name', self.user)
+        ]
+
+    def request(self, operation, attributes, document_path=None):
+        """发送请求并返回 (状态码, 属性组列表)；提供document_path时在属性之后流式发送文档"""
+        request_id = next(self._request_ids)
+        header = encode_message(operation, request_id, [(OPERATION_ATTRIBUTES, attributes)])
+        length = len(header) + (os.path.getsize(document_path) if document_path else 0)
+        # 开始发送请求体的次数，请求头发送失败时请求体还没有发出
+        body_started = []
+
+        def body():
+            body_started.append(True)
+            yield header
+            if document_path:
+                with open(document_path, 'rb') as f:
+                    while True:
+                        buf = f.read(_SEND_BUFFER_SIZE)
+                        if not buf:
+                            break
+                        yield buf
+
+        with self._lock:
+            # 服务器可能已关闭空闲的keep-alive连接，失败时重新连接重试一次；
+            # 非只读的操作只在请求体还没有发出时重试
+            for attempt in range(2):
+                reused = self._conn is not None
+                del body_started[:]
+                try:
+                    conn = self._connection()
+                    conn.request('POST', self._path, body=body(), headers={
+                        'Content-Type': 'application/ipp',
+                        'Content-Length': str(length)
+                    })
+                    response = conn.getresponse()
+                    data = response.read()
+                    break
+                except (http.client.HTTPException, OSError) as e:
+                    if self._conn is not None:
+                        self._conn.close()
+                        self._conn = None
+                    retryable = operation in IDEMPOTENT_OPERATIONS or not body_started
+                    if attempt == 1 or not reused or not retryable:
+                        raise IPPError(f"IPP请求失败: {str(e)}")
+                    logger.info(f"IPP连接已断开，重新连接: {self.printer_uri}")
+        if response.status != 200:
+            raise IPPError(f"IPP请求失败，HTTP状态: {response.status}")
+        status, _, groups, _ = decode_message(data)
+        return status, groups
+
+    def print_job(self, path, job_name):
+        """提交文档，返回打印机分配的任务ID"""
+        attributes = self._operation_attributes() + [
+            (NAME, 'job-name', job_name),
+            (MIME_MEDIA_TYPE, 'document-format', document_format(path))
+        ]
+        status, groups = self.request(PRINT_JOB, attributes, document_path=path)
+        if status > 0x00FF:
+            message = find_attribute(groups, OPERATION_ATTRIBUTES, 'status-message', '')
+            raise IPPError(f"打印机拒绝任务，状态码: 0x{status:04x} {message}")
+        job_id = find_attribute(groups, JOB_ATTRIBUTES, 'job-id')
+        if job_id is None:
+            raise IPPError("打印机响应中缺少job-id")
+        return job_id
+
+    def job_state(self, job_id):
+        """查询任务状态，返回 (job-state, job-state-reasons列表)"""
+        attributes = self._operation_attributes() + [
+            (INTEGER, 'job-id', job_id),
+            (KEYWORD, 'requested-attributes', ['job-state', 'job-state-reasons'])
+        ]
+        status, groups = self.request(GET_JOB_ATTRIBUTES, attributes)
+        if status > 0x00FF:
+            raise IPPError(f"查询任务状态失败，状态码: 0x{status:04x}")
+        reasons = []
+        for tag, group in groups:
+            if tag == JOB_ATTRIBUTES:
+                reasons = group.get('job-state-reasons', [])
+        return find_attribute(groups, JOB_ATTRIBUTES, 'job-state'), reasons
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+打印任务存储
+保存任务信息、当前状态和状态历史，并按保留时间清理已结束的任务
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 已结束的任务状态，超过保留时间后会被清理
+FINISHED_STATES = ('completed', 'error')
+
+
+class MemoryJobStore:
+    """内存任务存储，重启后数据丢失，适合测试和开发环境"""
+
+    def __init__(self, retention_seconds=24 * 3600, evict_interval=60):
+        self.retention_seconds = retention_seconds
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._history = {}
+        self._last_evict = 0
+
+    def add_job(self, file_info, state):
+        """新增任务（已存在时覆盖）并记录初始状态"""
+        now = time.time()
+        with self._lock:
+            self._jobs[file_info['id']] = {
+                'info': dict(file_info),
+                'state': state,
+                'created_at': now,
+                'updated_at': now
+            }
+            self._history[file_info['id']] = [(state, now)]
+
+    def update_info(self, file_info):
+        """更新任务信息（不改变状态），任务不存在时返回False"""
+        with self._lock:
+            job = self._jobs.get(file_info['id'])
+            if job is None:
+                return False
+            job['info'] = dict(file_info)
+        return True
+
+    def set_state(self, file_id, state):
+        """更新任务状态，任务不存在时返回False"""
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(file_id)
+            if job is None:
+                return False
+            job['state'] = state
+            job['updated_at'] = now
+            self._history[file_id].append((state, now))
+        if state in FINISHED_STATES:
+            self._maybe_evict(now)
+        return True
+
+    def get_state(self, file_id):
+        with self._lock:
+            job = self._jobs.get(file_id)
+            return job['state'] if job else None
+
+    def get_states(self, file_ids):
+        """批量获取任务状态，不存在的任务为'unknown'"""
+        with self._lock:
+            return {file_id: self._jobs[file_id]['state'] if file_id in self._jobs else 'unknown'
+                    for file_id in file_ids}
+
+    def get_job(self, file_id):
+        """获取任务信息及状态历史，不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(file_id)
+            if job is None:
+                return None
+            return _job_record(job['info'], job['state'], job['created_at'], job['updated_at'],
+                               self._history.get(file_id, []))
+
+    def jobs_in_states(self, states):
+        """按创建时间顺序返回处于指定状态的任务信息"""
+        with self._lock:
+            jobs = sorted((job for job in self._jobs.values() if job['state'] in states),
+                          key=lambda job: job['created_at'])
+            return [dict(job['info']) for job in jobs]
+
+    def active_states(self):
+        """返回所有未结束任务的状态"""
+        with self._lock:
+            return {file_id: job['state'] for file_id, job in self._jobs.items()
+                    if job['state'] not in FINISHED_STATES}
+
+    def evict_expired(self, now=None):
+        """清理超过保留时间的已结束任务，返回清理数量"""
+        cutoff = (now or time.time()) - self.retention_seconds
+        with self._lock:
+            expired = [file_id for file_id, job in self._jobs.items()
+                       if job['state'] in FINISHED_STATES and job['updated_at'] < cutoff]
+            for file_id in expired:
+                del self._jobs[file_id]
+                self._history.pop(file_id, None)
+        return len(expired)
+
+    def count(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def close(self):
+        pass
+
+    def _maybe_evict(self, now):
+        # 清理是顺带进行的，最多每evict_interval秒一次
+        if now - self._last_evict >= self.evict_interval:
+            self._last_evict = now
+            self.evict_expired(now)
+
+
+class SQLiteJobStore(MemoryJobStore):
+    """SQLite任务存储（WAL模式），重启后可以恢复排队中的任务
+
+    每个线程使用独立的数据库连接，WAL模式下读操作不会被写操作阻塞。
+    多进程部署时各进程共享同一个数据库：HTTP进程提交任务，调度进程取出任务；
+    状态历史同时作为状态变化的通知来源。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            info TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, updated_at);
+        CREATE TABLE IF NOT EXISTS job_history (
+            job_id TEXT NOT NULL,
+            state TEXT NOT NULL,
+            at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_job_history_job ON job_history (job_id, at);
+        CREATE TABLE IF NOT EXISTS submitted_jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS shared_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path, retention_seconds=24 * 3600, evict_interval=60):
+        super().__init__(retention_seconds, evict_interval)
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add_job(self, file_info, state):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM job_history WHERE job_id = ?', (file_info['id'],))
+            conn.execute('INSERT OR REPLACE INTO jobs (id, state, info, created_at, updated_at) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (file_info['id'], state, json.dumps(file_info), now, now))
+            conn.execute('INSERT INTO job_history (job_id, state, at) VALUES (?, ?, ?)',
+                         (file_info['id'], state, now))
+
+    def update_info(self, file_info):
+        with self._connect() as conn:
+            cursor = conn.execute('UPDATE jobs SET info = ? WHERE id = ?',
+                                  (json.dumps(file_info), file_info['id']))
+            return cursor.rowcount > 0
+
+    def set_state(self, file_id, state):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute('UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?',
+                                  (state, now, file_id))
+            if cursor.rowcount == 0:
+                return False
+            conn.execute('INSERT INTO job_history (job_id, state, at) VALUES (?, ?, ?)',
+                         (file_id, state, now))
+        if state in FINISHED_STATES:
+            self._maybe_evict(now)
+        return True
+
+    def get_state(self, file_id):
+        row = self._connect().execute('SELECT state FROM jobs WHERE id = ?', (file_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_states(self, file_ids):
+        statuses = {file_id: 'unknown' for file_id in file_ids}
+        if not statuses:
+            return statuses
+        placeholders = ','.join('?' * len(statuses))
+        rows = self._connect().execute(f'SELECT id, state FROM jobs WHERE id IN ({placeholders})',
+                                       list(statuses))
+        for file_id, state in rows:
+            statuses[file_id] = state
+        return statuses
+
+    def get_job(self, file_id):
+        conn = self._connect()
+        row = conn.execute('SELECT info, state, created_at, updated_at FROM jobs WHERE id = ?',
+                           (file_id,)).fetchone()
+        if row is None:
+            return None
+        history = conn.execute('SELECT state, at FROM job_history WHERE job_id = ? ORDER BY at',
+                               (file_id,)).fetchall()
+        return _job_record(json.loads(row[0]), row[1], row[2], row[3], history)
+
+    def jobs_in_states(self, states):
+        placeholders = ','.join('?' * len(states))
+        rows = self._connect().execute(f'SELECT info FROM jobs WHERE state IN ({placeholders}) '
+                                       'ORDER BY created_at', list(states))
+        return [json.loads(row[0]) for row in rows]
+
+    def active_states(self):
+        placeholders = ','.join('?' * len(FINISHED_STATES))
+        rows = self._connect().execute(f'SELECT id, state FROM jobs WHERE state NOT IN ({placeholders})',
+                                       FINISHED_STATES)
+        return dict(rows.fetchall())
+
+    def evict_expired(self, now=None):
+        cutoff = (now or time.time()) - self.retention_seconds
+        placeholders = ','.join('?' * len(FINISHED_STATES))
+        condition = f'state IN ({placeholders}) AND updated_at < ?'
+        params = list(FINISHED_STATES) + [cutoff]
+        with self._connect() as conn:
+            conn.execute(f'DELETE FROM job_history WHERE job_id IN (SELECT id FROM jobs WHERE {condition})',
+                         params)
+            cursor = conn.execute(f'DELETE FROM jobs WHERE {condition}', params)
+            return cursor.rowcount
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def submit(self, file_id):
+        """提交排队中的任务，等待调度进程取出"""
+        with self._connect() as conn:
+            conn.execute('INSERT INTO submitted_jobs (job_id) VALUES (?)', (file_id,))
+
+    def take_submitted(self):
+        """取出所有已提交的任务，按提交顺序返回其中仍在排队的任务信息"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            last_seq = conn.execute('SELECT MAX(seq) FROM submitted_jobs').fetchone()[0]
+            if last_seq is None:
+                return []
+            rows = conn.execute('SELECT jobs.info FROM submitted_jobs JOIN jobs ON jobs.id = submitted_jobs.job_id '
+                                'WHERE submitted_jobs.seq <= ? AND jobs.state = ? ORDER BY submitted_jobs.seq',
+                                (last_seq, 'queued')).fetchall()
+            conn.execute('DELETE FROM submitted_jobs WHERE seq <= ?', (last_seq,))
+        return [json.loads(row[0]) for row in rows]
+
+    def last_change(self):
+        """返回最新状态变化的序号"""
+        return self._connect().execute('SELECT MAX(rowid) FROM job_history').fetchone()[0] or 0
+
+    def changes_since(self, seq, limit=1000):
+        """返回序号大于seq的状态变化 [(序号, 任务ID, 状态), ...]"""
+        return self._connect().execute('SELECT rowid, job_id, state FROM job_history WHERE rowid > ? '
+                                       'ORDER BY rowid LIMIT ?', (seq, limit)).fetchall()
+
+    def put_shared(self, name, value):
+        """保存供其他进程读取的数据，每次保存版本号加一"""
+        with self._connect() as conn:
+            conn.execute('INSERT INTO shared_state (name, value, version) VALUES (?, ?, 1) '
+                         'ON CONFLICT (name) DO UPDATE SET value = excluded.value, version = version + 1',
+                         (name, json.dumps(value)))
+
+    def get_shared(self, name):
+        """返回 (版本号, 数据)，不存在时返回 (0, None)"""
+        row = self._connect().execute('SELECT version, value FROM shared_state WHERE name = ?',
+                                      (name,)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], json.loads(row[1])
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _job_record(info, state, created_at, updated_at, history):
+    record = dict(info)
+    record.update({
+        'state': state,
+        'created_at': created_at,
+        'updated_at': updated_at,
+        'history': [{'state': s, 'at': at} for s, at in history]
+    })
+    return record
+
+
+def create_job_store(backend, db_path=None, **options):
+    """根据配置创建任务存储，backend可选'sqlite'或'memory'"""
+    if backend == 'memory':
+        return MemoryJobStore(**options)
+    if backend == 'sqlite':
+        return SQLiteJobStore(db_path, **options)
+    raise ValueError(f"未知的任务存储类型: {backend}")
@@ -13,13 +13,48 @@ import sys
 import random
 import threading
 import logging
+import heapq
+import itertools
+from queue import Empty
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("mock-printer")
 
-def mock_print(filepath, on_complete=None):
+# 默认的打印失败率
+DEFAULT_FAILURE_RATE = 0.05
+
+class RealClock:
+    """真实时钟"""
+    
+    def now(self):
+        return time.monotonic()
+    
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class InstantClock:
+    """不真正等待的时钟，sleep立即返回并把时间向前推进
+    
+    所有线程共用同一个时间，只适合不关心并发时序的测试；
+    需要模拟多台打印机的时序时使用Simulation
+    """
+    
+    def __init__(self):
+        self._now = 0.0
+        self._lock = threading.Lock()
+    
+    def now(self):
+        with self._lock:
+            return self._now
+    
+    def sleep(self, seconds):
+        with self._lock:
+            self._now += max(0, seconds)
+
+def mock_print(filepath, on_complete=None, print_time=None, clock=None, rng=None,
+               failure_rate=DEFAULT_FAILURE_RATE, background=True):
     """
     模拟打印文件
     模拟打印机的行为，但不实际打印任何内容
@@ -27,7 +62,14 @@ def mock_print(filepath, on_complete=None):
     Args:
         filepath: 要打印的文件路径
         on_complete: 打印完成后的回调函数，接收一个布尔参数表示成功与否
+        print_time: 模拟的打印时长（秒），为None时根据文件大小估计
+        clock: 用于等待的时钟，默认为真实时钟
+        rng: 决定打印是否失败的随机数生成器，默认为random模块
+        failure_rate: 打印失败的概率
+        background: 是否在新线程中打印；为False时在调用线程中打印，返回前已调用on_complete
     """
+    clock = clock or RealClock()
+    rng = rng or random
     if not os.path.exists(filepath):
         logger.error(f"错误: 文件 {filepath} 不存在")
         if callable(on_complete):
@@ -44,18 +86,20 @@ def mock_print(filepath, on_complete=None):
     def print_process():
         # 模拟文件处理和打印过程
         try:
-            file_size = os.path.getsize(filepath)
-            # 根据文件大小模拟不同的打印时间
-            print_time = max(2, min(10, file_size / 1024 / 100))
+            duration = print_time
+            if duration is None:
+                file_size = os.path.getsize(filepath)
+                # 根据文件大小模拟不同的打印时间
+                duration = max(2, min(10, file_size / 1024 / 100))
             
             # 显示打印进度
             for i in range(10):
                 progress = (i + 1) * 10
                 logger.info(f"打印进度: {progress}%")
-                time.sleep(print_time / 10)
+                clock.sleep(duration / 10)
             
-            # 模拟打印成功或失败 (95% 成功率)
-            success = random.random() < 0.95
+            # 模拟打印成功或失败
+            success = rng.random() >= failure_rate
             
             if success:
                 logger.info(f"文件 {filename} 打印成功")
@@ -83,6 +127,9 @@ def mock_print(filepath, on_complete=None):
                     logger.error(f"执行回调函数失败: {str(callback_error)}")
             return False
     
+    if not background:
+        return print_process()
+    
     # 在单独的线程中执行打印过程
     logger.info(f"创建打印线程: {filepath}")
     t = threading.Thread(target=print_process)
@@ -96,6 +143,235 @@ def print_file(filepath, on_complete=None):
     """兼容接口，供app.py调用"""
     return mock_print(filepath, on_complete)
 
+class MockPrinterDevice:
+    """
+    独立的模拟打印设备
+    同一时间只能打印一个文件，可以创建多个实例模拟多台打印机
+    
+    Args:
+        name: 设备名称
+        clock: 用于等待的时钟，默认为真实时钟
+        seed: 失败注入的随机种子，同一种子和名称的设备失败序列相同；为None时不固定
+        failure_rate: 打印失败的概率
+    """
+    
+    def __init__(self, name, clock=None, seed=None, failure_rate=DEFAULT_FAILURE_RATE):
+        self.name = name
+        self.clock = clock
+        self.rng = random.Random(f"{seed}:{name}") if seed is not None else None
+        self.failure_rate = failure_rate
+        self.jobs_printed = 0
+        self.jobs_failed = 0
+        self._busy = False
+        self._lock = threading.Lock()
+    
+    @property
+    def busy(self):
+        with self._lock:
+            return self._busy
+    
+    def print_file(self, filepath, on_complete=None, print_time=None, background=True):
+        """
+        在该设备上打印文件，设备忙时返回False
+        
+        Args:
+            filepath: 要打印的文件路径
+            on_complete: 打印完成后的回调函数，接收一个布尔参数表示成功与否
+            print_time: 模拟的打印时长（秒），为None时根据文件大小估计
+            background: 是否在新线程中打印，为False时阻塞到打印结束
+        """
+        with self._lock:
+            if self._busy:
+                logger.error(f"打印机 {self.name} 忙，无法打印: {filepath}")
+                return False
+            self._busy = True
+        
+        logger.info(f"打印机 {self.name} 接收任务: {filepath}")
+        
+        def finished(success):
+            with self._lock:
+                self._busy = False
+                if success:
+                    self.jobs_printed += 1
+                else:
+                    self.jobs_failed += 1
+            if callable(on_complete):
+                on_complete(success)
+        
+        started = mock_print(filepath, finished, print_time, self.clock, self.rng, self.failure_rate, background)
+        # 文件不存在时mock_print已通过回调释放设备
+        return started or not background
+
+class PrinterProfile:
+    """
+    模拟打印机的性能和故障参数
+    
+    Args:
+        pages_per_minute: 每分钟打印页数
+        warmup_seconds: 空闲超过sleep_after秒后（以及第一次打印前）的预热时间
+        sleep_after: 空闲多久后进入休眠
+        failure_rate: 任务打印失败的概率
+        jam_rate: 每打印一页发生卡纸的概率
+        jam_clear_seconds: 处理一次卡纸的时间
+        offline_rate: 开始任务时打印机离线的概率
+        offline_seconds: 离线持续的时间
+    """
+    
+    def __init__(self, pages_per_minute=30, warmup_seconds=10, sleep_after=300,
+                 failure_rate=DEFAULT_FAILURE_RATE, jam_rate=0.0, jam_clear_seconds=60,
+                 offline_rate=0.0, offline_seconds=300):
+        self.pages_per_minute = pages_per_minute
+        self.warmup_seconds = warmup_seconds
+        self.sleep_after = sleep_after
+        self.failure_rate = failure_rate
+        self.jam_rate = jam_rate
+        self.jam_clear_seconds = jam_clear_seconds
+        self.offline_rate = offline_rate
+        self.offline_seconds = offline_seconds
+
+class Simulation:
+    """
+    离散事件模拟
+    事件按时间顺序在run()中依次执行，时间直接跳到下一个事件，不真正等待；
+    时间相同的事件按安排的先后顺序执行，同样的输入总是得到同样的结果
+    """
+    
+    def __init__(self):
+        self._now = 0.0
+        self._events = []
+        self._seq = itertools.count()
+    
+    def now(self):
+        return self._now
+    
+    def schedule(self, delay, callback, *args):
+        """在delay秒后执行callback(*args)"""
+        heapq.heappush(self._events, (self._now + max(0, delay), next(self._seq), callback, args))
+    
+    def run(self, until=None):
+        """执行事件直到没有事件或时间超过until，返回执行的事件数"""
+        count = 0
+        while self._events:
+            if until is not None and self._events[0][0] > until:
+                self._now = until
+                break
+            self._now, _, callback, args = heapq.heappop(self._events)
+            callback(*args)
+            count += 1
+        return count
+
+class SimulatedPrinter:
+    """
+    在Simulation中运行的模拟打印机，同一时间只能打印一个任务
+    
+    打印耗时 = 离线等待 + 预热 + 页数/速度 + 卡纸处理，失败、卡纸和离线由种子决定
+    """
+    
+    def __init__(self, name, simulation, profile=None, seed=0):
+        self.name = name
+        self.simulation = simulation
+        self.profile = profile or PrinterProfile()
+        self.rng = random.Random(f"{seed}:{name}")
+        self.busy = False
+        self.jobs_printed = 0
+        self.jobs_failed = 0
+        self.pages_printed = 0
+        self.jams = 0
+        self.offline_events = 0
+        self.busy_seconds = 0.0
+        self._idle_since = None
+    
+    def print_job(self, pages, on_complete=None):
+        """开始打印pages页，完成后调用on_complete(成功与否)；打印机忙时返回False"""
+        if self.busy:
+            return False
+        self.busy = True
+        profile = self.profile
+        now = self.simulation.now()
+        duration = 0.0
+        if self.rng.random() < profile.offline_rate:
+            self.offline_events += 1
+            duration += profile.offline_seconds
+        if self._idle_since is None or now + duration - self._idle_since >= profile.sleep_after:
+            duration += profile.warmup_seconds
+        duration += pages * 60 / profile.pages_per_minute
+        if profile.jam_rate:
+            jams = sum(1 for _ in range(pages) if self.rng.random() < profile.jam_rate)
+            self.jams += jams
+            duration += jams * profile.jam_clear_seconds
+        success = self.rng.random() >= profile.failure_rate
+        self.simulation.schedule(duration, self._finish, pages, duration, success, on_complete)
+        return True
+    
+    def _finish(self, pages, duration, success, on_complete):
+        self.busy = False
+        self._idle_since = self.simulation.now()
+        self.busy_seconds += duration
+        if success:
+            self.jobs_printed += 1
+            self.pages_printed += pages
+        else:
+            self.jobs_failed += 1
+        if callable(on_complete):
+            on_complete(success)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'jobs_printed': self.jobs_printed,
+            'jobs_failed': self.jobs_failed,
+            'pages_printed': self.pages_printed,
+            'jams': self.jams,
+            'offline_events': self.offline_events,
+            'busy_seconds': self.busy_seconds
+        }
+
+def simulate_printing(jobs, queue, printer_count, profile=None, seed=0):
+    """
+    模拟任务经过队列分配到多台打印机的全过程
+    
+    Args:
+        jobs: 任务列表，每个任务至少包含pages，可选arrival（到达时间，秒）；
+            模拟结束后每个任务记录started_at、finished_at和success
+        queue: 任务队列，需支持put和get(block=False)，例如scheduler.Scheduler
+        printer_count: 打印机数量
+        profile: 打印机参数，所有打印机相同
+        seed: 随机种子
+    
+    Returns:
+        {'makespan': 最后一个任务完成的时间, 'printers': 每台打印机的统计}
+    """
+    simulation = Simulation()
+    printers = [SimulatedPrinter(f"sim-{i + 1}", simulation, profile, seed) for i in range(printer_count)]
+    
+    def dispatch():
+        for printer in printers:
+            if printer.busy:
+                continue
+            try:
+                file_info = queue.get(block=False)
+            except Empty:
+                return
+            file_info['started_at'] = simulation.now()
+            printer.print_job(file_info['pages'], lambda success, file_info=file_info: finished(file_info, success))
+    
+    def finished(file_info, success):
+        file_info['finished_at'] = simulation.now()
+        file_info['success'] = success
+        dispatch()
+    
+    def arrive(file_info):
+        queue.put(file_info)
+        dispatch()
+    
+    for file_info in jobs:
+        simulation.schedule(file_info.get('arrival', 0), arrive, file_info)
+    simulation.run()
+    return {
+        'makespan': simulation.now(),
+        'printers': [printer.to_dict() for printer in printers]
+    }
+
 def main():
     """主函数"""
     # 检查命令行参数
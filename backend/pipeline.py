@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+打印流水线阶段
+每个阶段有自己的工作线程，从输入队列取任务处理后交给下一阶段；
+阶段之间使用有界队列，下游处理不过来时上游阻塞，避免提前准备过多任务
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger("web-printer.pipeline")
+
+
+class Stage:
+    """流水线的一个阶段
+
+    Args:
+        name: 阶段名称
+        handler: 处理函数 handler(item)，返回交给下一阶段的任务，返回None表示任务在本阶段结束
+        inbox: 输入队列
+        workers: 工作线程数
+        emit: 输出函数 emit(item)，通常是下一阶段有界队列的put，队列满时阻塞
+        on_error: 处理或输出出错时调用 on_error(item, error)，用于把任务标记为失败
+    """
+
+    def __init__(self, name, handler, inbox, workers=1, emit=None, on_error=None):
+        self.name = name
+        self.inbox = inbox
+        self.workers = workers
+        self.processed = 0
+        self._handler = handler
+        self._emit = emit
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def busy(self):
+        """正在处理的任务数"""
+        with self._lock:
+            return self._busy
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'pending': self.inbox.qsize(),
+            'busy': self.busy,
+            'processed': self.processed
+        }
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            with self._lock:
+                self._busy += 1
+            try:
+                result = self._handler(item)
+                # 等待下游队列有空位期间任务仍计为本阶段处理中
+                if result is not None and self._emit is not None:
+                    self._emit(result)
+            except Exception as e:
+                logger.error(f"流水线阶段 {self.name} 处理任务出错: {str(e)}")
+                if self._on_error is not None:
+                    try:
+                        self._on_error(item, e)
+                    except Exception as error:
+                        logger.error(f"流水线阶段 {self.name} 处理失败任务出错: {str(error)}")
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self.processed += 1
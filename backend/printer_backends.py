@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+打印机后端
+每台打印机对应一个后端对象，print_document把文件发送到打印机并阻塞到打印真正结束，
+失败时抛出PrintError
+"""
+
+import logging
+import subprocess
+import time
+
+from ipp import IPPClient, JOB_COMPLETED, JOB_FINISHED_STATES
+
+logger = logging.getLogger("web-printer.backends")
+
+
+class PrintError(Exception):
+    """打印失败"""
+
+
+class PrinterBackend:
+    """打印机后端接口"""
+
+    def print_document(self, path, job_name, expected_seconds=None):
+        """打印文件，阻塞直到打印结束
+
+        Args:
+            path: 可直接打印的文件（PDF或图片）
+            job_name: 任务名称
+            expected_seconds: 预计打印耗时（秒），用于模拟打印时长和等待超时
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MockBackend(PrinterBackend):
+    """模拟打印机后端，在打印机工作线程中直接执行模拟打印，不为每个任务另开线程
+
+    Args:
+        device: mock_printer.MockPrinterDevice
+        time_scale: 模拟打印时长与预计耗时的比例
+    """
+
+    def __init__(self, device, time_scale=1.0):
+        self.device = device
+        self.time_scale = time_scale
+
+    def print_document(self, path, job_name, expected_seconds=None):
+        result = []
+
+        def print_complete_callback(success):
+            logger.info(f"收到打印完成回调: {job_name}, 结果: {success}")
+            result.append(success)
+
+        # 按预计耗时模拟打印时长，返回时已调用回调
+        print_time = None if expected_seconds is None else expected_seconds * self.time_scale
+        if not self.device.print_file(path, print_complete_callback, print_time, background=False):
+            raise PrintError("启动模拟打印失败")
+        if not result or not result[0]:
+            raise PrintError("模拟打印失败")
+
+
+class LprBackend(PrinterBackend):
+    """通过lpr把文件交给本机CUPS队列，lpr返回即视为完成
+
+    Args:
+        queue_name: CUPS队列名，为None时使用系统默认打印机
+    """
+
+    def __init__(self, queue_name=None):
+        self.queue_name = queue_name
+
+    def command(self, path):
+        if self.queue_name is None:
+            return ['lpr', path]
+        return ['lpr', '-P', self.queue_name, path]
+
+    def print_document(self, path, job_name, expected_seconds=None):
+        try:
+            subprocess.run(self.command(path), check=True)
+        except (subprocess.CalledProcessError, OSError) as e:
+            raise PrintError(f"lpr执行失败: {str(e)}")
+
+
+class IppBackend(PrinterBackend):
+    """通过IPP直接提交到打印机，并轮询任务状态直到打印机报告任务结束
+
+    Args:
+        printer_uri: 打印机的IPP URI
+        poll_interval: 查询任务状态的间隔（秒）
+        timeout: 在预计耗时之外最多等待的时间（秒）
+    """
+
+    def __init__(self, printer_uri, poll_interval=1.0, timeout=600):
+        self.client = IPPClient(printer_uri)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def print_document(self, path, job_name, expected_seconds=None):
+        try:
+            job_id = self.client.print_job(path, job_name)
+            logger.info(f"IPP任务已提交: {job_name}, 任务ID: {job_id}")
+            deadline = time.time() + self.timeout + (expected_seconds or 0)
+            while True:
+                state, reasons = self.client.job_state(job_id)
+                if state in JOB_FINISHED_STATES:
+                    break
+                if time.time() > deadline:
+                    raise PrintError(f"等待IPP任务 {job_id} 结束超时")
+                time.sleep(self.poll_interval)
+        except PrintError:
+            raise
+        except Exception as e:
+            raise PrintError(str(e))
+        if state != JOB_COMPLETED:
+            raise PrintError(f"IPP任务 {job_id} 未完成，状态: {state}, 原因: {', '.join(reasons)}")
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+打印机注册表
+每台打印机拥有自己的工作线程，唯一的分派线程把待打印队列中的任务交给空闲的打印机；
+线程数只取决于打印机数量，与任务数量无关
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from queue import Queue, Full
+
+logger = logging.getLogger("web-printer.printers")
+
+
+class Printer:
+    """单台打印机及其专属工作线程
+
+    Args:
+        name: 打印机名称（真实打印机时为CUPS队列名）
+        print_job: 打印函数，签名为 print_job(file_info, printer)，阻塞直到打印结束
+        on_idle: 打印结束后的回调，签名为 on_idle(printer)
+        backend: 打印机后端（printer_backends.PrinterBackend），负责把文件发送到打印机
+    """
+
+    def __init__(self, name, print_job, on_idle, backend=None):
+        self.name = name
+        self.backend = backend
+        # 当前正在打印的任务，由调度器在持有队列锁时修改
+        self.current_job = None
+        # 当前任务开始的时间，用于估算打印机何时空闲
+        self.started_at = None
+        self.jobs_processed = 0
+        self._print_job = print_job
+        self._on_idle = on_idle
+        self._inbox = Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, name=f"printer-{name}")
+        self._thread.daemon = True
+
+    @property
+    def busy(self):
+        return self.current_job is not None
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, file_info):
+        """把任务交给该打印机，调用者需保证打印机空闲"""
+        self.current_job = file_info
+        self.started_at = time.time()
+        self._inbox.put_nowait(file_info)
+
+    def stop(self, timeout=None):
+        """当前任务结束后停止工作线程"""
+        self._inbox.put(None)
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'busy': self.busy,
+            'file_id': self.current_job['id'] if self.current_job else None,
+            'jobs_processed': self.jobs_processed
+        }
+
+    def _run(self):
+        while True:
+            file_info = self._inbox.get()
+            if file_info is None:
+                return
+            try:
+                self._print_job(file_info, self)
+            except Exception as e:
+                logger.error(f"打印机 {self.name} 处理任务出错: {str(e)}")
+            finally:
+                self.jobs_processed += 1
+                self._on_idle(self)
+
+
+class PrinterRegistry:
+    """按名称管理所有打印机"""
+
+    def __init__(self):
+        self._printers = OrderedDict()
+
+    def add(self, printer):
+        if printer.name in self._printers:
+            raise ValueError(f"打印机名称重复: {printer.name}")
+        self._printers[printer.name] = printer
+
+    def get(self, name):
+        return self._printers.get(name)
+
+    def all(self):
+        return list(self._printers.values())
+
+    def free_printer(self):
+        """返回第一台空闲的打印机，没有则返回None"""
+        for printer in self._printers.values():
+            if not printer.busy:
+                return printer
+        return None
+
+    def any_busy(self):
+        return any(printer.busy for printer in self._printers.values())
+
+    def __len__(self):
+        return len(self._printers)
+
+
+class Dispatcher:
+    """唯一的分派线程：等待有空闲的打印机，再从待打印队列取出任务交给它
+
+    打印机空闲时由printer_idle唤醒，任务分派不会在打印机线程或流水线线程中执行。
+
+    Args:
+        registry: PrinterRegistry
+        inbox: 待打印队列，取出None时停止
+        lock: 保护打印机状态的锁，与修改Printer.current_job的代码共用
+        on_dispatch: 任务交给打印机后的回调 on_dispatch(file_info, printer)，调用时持有lock
+    """
+
+    def __init__(self, registry, inbox, lock, on_dispatch=None):
+        self.registry = registry
+        self.inbox = inbox
+        self.dispatched = 0
+        self._lock = lock
+        self._idle = threading.Condition(lock)
+        self._on_dispatch = on_dispatch
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def printer_idle(self):
+        """打印机变为空闲后调用，调用者必须持有lock"""
+        self._idle.notify()
+
+    def stop(self, timeout=None):
+        """停止分派，已在待打印队列中的任务留在队列中"""
+        with self._lock:
+            self._stopping = True
+            self._idle.notify()
+        try:
+            # 唤醒阻塞在空队列上的分派线程；队列满时分派线程不会阻塞
+            self.inbox.put_nowait(None)
+        except Full:
+            pass
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            # 先等到有空闲的打印机再取任务，取出前任务一直留在有界的待打印队列中
+            with self._lock:
+                while not self._stopping and self.registry.free_printer() is None:
+                    self._idle.wait()
+                if self._stopping:
+                    return
+            file_info = self.inbox.get()
+            if file_info is None:
+                return
+            with self._lock:
+                # 只有本线程分派任务，等待期间空闲的打印机不会被占用
+                printer = self.registry.free_printer()
+                printer.submit(file_info)
+                self.dispatched += 1
+                try:
+                    if self._on_dispatch is not None:
+                        self._on_dispatch(file_info, printer)
+                except Exception as e:
+                    logger.error(f"分派任务回调出错: {str(e)}")
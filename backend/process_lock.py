@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+进程间文件锁
+基于flock，持有锁的进程退出（包括崩溃）时由内核自动释放，
+用于多进程部署时选出唯一的调度进程，以及避免同一上传被多个进程同时合并
+"""
+
+import fcntl
+import os
+import threading
+
+
+class FileLock:
+    """flock排他锁，同一进程内的不同FileLock对象之间同样互斥
+
+    Args:
+        path: 锁文件路径，不存在时自动创建
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self, blocking=True):
+        """获取锁，blocking为False时锁被占用立即返回False"""
+        with self._lock:
+            if self._fd is not None:
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            except Exception:
+                os.close(fd)
+                raise
+            self._fd = fd
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+生成测试文档
+基准测试脚本和各测试脚本使用的PDF生成函数。
+"""
+
+import io
+
+from PyPDF2 import PdfWriter
+
+# A4纸的尺寸（点）
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+
+
+def make_pdf(rng, pages, size):
+    """生成指定页数、大小约为size字节的PDF，内容由rng决定，每次生成的文件都不同"""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(PAGE_WIDTH, PAGE_HEIGHT)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    # 用随机内容的附件把文件填充到目标大小，同时避免内容去重
+    padding = max(16, size - len(buffer.getvalue()))
+    writer.add_attachment('padding.bin', rng.randbytes(padding))
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+打印任务调度器
+按优先级分类严格排序；同一优先级内按客户端做差额轮询（DRR），
+每个客户端每轮获得固定页数的额度，提交大文件的客户端不会阻塞其他客户端的小任务。
+可选按页数从少到多（最短任务优先）排列同一客户端的任务。
+任务的优先级由服务器按客户端地址决定，客户端只能请求不高于其允许值的优先级。
+"""
+
+import heapq
+import ipaddress
+import itertools
+import threading
+import time
+from collections import deque
+from queue import Empty
+
+# 优先级分类，从高到低
+PRIORITY_CLASSES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+# 每个客户端每轮获得的额度（页）
+DEFAULT_QUANTUM = 10
+
+
+def job_cost(file_info):
+    """任务的调度成本（页数）"""
+    return max(1, int(file_info.get('pages') or 1))
+
+
+class PriorityPolicy:
+    """按客户端地址决定任务可使用的最高优先级
+
+    Args:
+        rules: [(地址或网段, 优先级)]，按顺序使用第一条匹配的规则
+        default: 不匹配任何规则的客户端可使用的最高优先级
+    """
+
+    def __init__(self, rules=(), default=DEFAULT_PRIORITY):
+        self.rules = []
+        for network, priority in rules:
+            if priority not in PRIORITY_CLASSES:
+                raise ValueError(f"未知的优先级: {priority}")
+            self.rules.append((ipaddress.ip_network(network, strict=False), priority))
+        if default not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级: {default}")
+        self.default = default
+
+    @classmethod
+    def parse(cls, text, default=DEFAULT_PRIORITY):
+        """解析逗号分隔的“地址或网段=优先级”，如 10.0.5.0/24=high,10.0.9.7=low"""
+        rules = []
+        for item in text.split(','):
+            if item.strip():
+                network, _, priority = item.partition('=')
+                rules.append((network.strip(), priority.strip()))
+        return cls(rules, default)
+
+    def allowed(self, client):
+        """客户端可使用的最高优先级"""
+        try:
+            address = ipaddress.ip_address(client)
+        except ValueError:
+            return self.default
+        for network, priority in self.rules:
+            if address.version == network.version and address in network:
+                return priority
+        return self.default
+
+    def resolve(self, client, requested=None):
+        """任务的优先级：客户端请求的优先级高于允许值时降为允许值，未请求或无效时使用允许值"""
+        allowed = self.allowed(client)
+        if requested not in PRIORITY_CLASSES:
+            return allowed
+        return max(requested, allowed, key=PRIORITY_CLASSES.index)
+
+
+class _ClassQueue:
+    """一个优先级分类内的差额轮询队列"""
+
+    def __init__(self, quantum, shortest_first):
+        self.quantum = quantum
+        self.shortest_first = shortest_first
+        # 客户端 -> 任务堆，元素为 (排序键, 序号, 任务)
+        self.jobs = {}
+        self.deficits = {}
+        # 有任务的客户端，按轮询顺序排列，队首为当前轮到的客户端
+        self.active = deque()
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self.jobs.values())
+
+    def push(self, client, seq, file_info):
+        if client not in self.jobs:
+            self.jobs[client] = []
+            self.deficits[client] = 0
+            self.active.append(client)
+        key = job_cost(file_info) if self.shortest_first else 0
+        heapq.heappush(self.jobs[client], (key, seq, file_info))
+
+    def pop(self):
+        while self.active:
+            client = self.active[0]
+            jobs = self.jobs[client]
+            cost = job_cost(jobs[0][2])
+            if self.deficits[client] >= cost:
+                self.deficits[client] -= cost
+                file_info = heapq.heappop(jobs)[2]
+                if not jobs:
+                    # 客户端没有任务时退出轮询，额度清零
+                    self.active.popleft()
+                    del self.jobs[client]
+                    del self.deficits[client]
+                return file_info
+            # 额度不足，补充额度后轮到下一个客户端
+            self.deficits[client] += self.quantum
+            self.active.rotate(-1)
+        return None
+
+    def copy(self):
+        other = _ClassQueue(self.quantum, self.shortest_first)
+        other.jobs = {client: list(jobs) for client, jobs in self.jobs.items()}
+        other.deficits = dict(self.deficits)
+        other.active = deque(self.active)
+        return other
+
+
+class Scheduler:
+    """按优先级和客户端公平调度的任务队列，接口与queue.Queue的get/put/qsize兼容
+
+    Args:
+        fair: 是否按客户端公平调度，为False时所有任务视为同一客户端
+        shortest_first: 是否优先调度页数少的任务
+        quantum: 每个客户端每轮获得的额度（页）
+    """
+
+    def __init__(self, fair=True, shortest_first=False, quantum=DEFAULT_QUANTUM):
+        self.fair = fair
+        self.shortest_first = shortest_first
+        self._cond = threading.Condition()
+        self._classes = {priority: _ClassQueue(quantum, shortest_first) for priority in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+        self._size = 0
+
+    def put(self, file_info):
+        priority = file_info.get('priority')
+        if priority not in self._classes:
+            priority = DEFAULT_PRIORITY
+        client = file_info.get('client', '') if self.fair else ''
+        with self._cond:
+            self._classes[priority].push(client, next(self._seq), file_info)
+            self._size += 1
+            self._cond.notify()
+
+    def get(self, block=True, timeout=None):
+        """取出下一个应调度的任务"""
+        with self._cond:
+            if not block:
+                timeout = 0
+            deadline = None if timeout is None else time.time() + timeout
+            while self._size == 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self._cond.wait(remaining)
+            for priority in PRIORITY_CLASSES:
+                file_info = self._classes[priority].pop()
+                if file_info is not None:
+                    self._size -= 1
+                    return file_info
+        raise Empty
+
+    def qsize(self):
+        with self._cond:
+            return self._size
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def ordered(self):
+        """按调度顺序返回所有等待中的任务（不改变队列状态）"""
+        with self._cond:
+            classes = [self._classes[priority].copy() for priority in PRIORITY_CLASSES]
+        result = []
+        for class_queue in classes:
+            while True:
+                file_info = class_queue.pop()
+                if file_info is None:
+                    break
+                result.append(file_info)
+        return result
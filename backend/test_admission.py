@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试上传准入控制的脚本
+"""
+
+import sys
+import tempfile
+import logging
+
+from admission import AdmissionController, AdmissionError
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("admission-test")
+
+MB = 1024 * 1024
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+def make_controller(folder, clock, queue=None, **options):
+    settings = dict(max_queue_jobs=10, max_inflight_bytes=100 * MB, min_free_bytes=0,
+                    client_bytes_rate=10 * MB, client_bytes_burst=50 * MB,
+                    client_jobs_rate=1, client_jobs_burst=3, retry_after=10)
+    settings.update(options)
+    queue = queue if queue is not None else [0]
+    return AdmissionController(folder, lambda: queue[0], clock=clock, **settings)
+
+def rejection(controller, key, client, size):
+    try:
+        controller.admit(key, client, size)
+    except AdmissionError as e:
+        return e.reason, e.status, e.retry_after
+    return None
+
+def test_inflight_and_queue():
+    """正在上传的数据量和排队任务数超过上限时拒绝，释放后恢复"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = [0]
+        controller = make_controller(tmp_dir, FakeClock(), queue)
+        assert rejection(controller, 'a', 'c1', 60 * MB) is None
+        assert rejection(controller, 'b', 'c2', 60 * MB) == ('inflight', 503, 10)
+        assert controller.inflight_bytes == 60 * MB
+        controller.release('a')
+        controller.release('a')
+        assert controller.inflight_bytes == 0
+        # 单个超过上限的上传在没有其他上传时放行
+        assert rejection(controller, 'b', 'c2', 200 * MB) is None
+        controller.release('b')
+        
+        queue[0] = 10
+        assert rejection(controller, 'c', 'c3', MB) == ('queue', 503, 10)
+        
+        queue[0] = 0
+        controller.reserve(('chunk', 'x'), 10 * MB)
+        controller.reserve(('plain', 'y'), 10 * MB)
+        assert controller.release_where(lambda key: key[0] == 'chunk') == 1
+        assert controller.inflight_bytes == 10 * MB
+
+def test_disk_space():
+    """上传完成后磁盘剩余空间低于下限时拒绝"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        controller = make_controller(tmp_dir, FakeClock())
+        controller.min_free_bytes = controller.free_bytes() - 20 * MB
+        assert rejection(controller, 'a', 'c1', 10 * MB) is None
+        # 已准入的上传计入磁盘占用
+        assert rejection(controller, 'b', 'c2', 15 * MB) == ('disk', 503, 60)
+
+def test_client_token_buckets():
+    """每个客户端按任务数和字节数限速，不影响其他客户端"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clock = FakeClock()
+        controller = make_controller(tmp_dir, clock)
+        for i in range(3):
+            assert rejection(controller, f'a{i}', 'heavy', MB) is None
+        assert rejection(controller, 'a3', 'heavy', MB) == ('client', 429, 1)
+        assert rejection(controller, 'b0', 'light', MB) is None
+        clock.now += 1
+        assert rejection(controller, 'a3', 'heavy', MB) is None
+        
+        # 字节桶：50MB突发后按10MB/秒恢复
+        clock.now += 10
+        assert rejection(controller, 'big', 'bulk', 45 * MB) is None
+        assert rejection(controller, 'big2', 'bulk', 25 * MB) == ('client', 429, 2)
+        clock.now += 2
+        assert rejection(controller, 'big2', 'bulk', 25 * MB) is None
+
+def test_charge_jobs_only():
+    """无需上传的任务只消耗任务令牌，不预留也不消耗字节令牌"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clock = FakeClock()
+        queue = [0]
+        controller = make_controller(tmp_dir, clock, queue, client_bytes_burst=MB)
+        for _ in range(3):
+            controller.charge('c1')
+        try:
+            controller.charge('c1')
+            assert False, "超过任务令牌桶时应该拒绝"
+        except AdmissionError as e:
+            assert (e.reason, e.status, e.retry_after) == ('client', 429, 1)
+        assert controller.inflight_bytes == 0
+        assert rejection(controller, 'a', 'c2', MB) is None
+        clock.now += 1
+        controller.charge('c1')
+        
+        queue[0] = 10
+        try:
+            controller.charge('c3')
+            assert False, "排队任务过多时应该拒绝"
+        except AdmissionError as e:
+            assert e.reason == 'queue'
+
+if __name__ == "__main__":
+    logger.info("开始测试上传准入控制")
+    test_inflight_and_queue()
+    test_disk_space()
+    test_client_token_buckets()
+    test_charge_jobs_only()
+    logger.info("所有测试通过")
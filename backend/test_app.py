@@ -0,0 +1,536 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试Web接口和应用启动的脚本
+每个测试在临时目录中导入一个独立的应用模块，上传目录和任务数据库相对于工作目录
+"""
+
+import os
+import sys
+import io
+import time
+import random
+import socket
+import hashlib
+import threading
+import shutil
+import tempfile
+import logging
+import importlib.util
+from contextlib import contextmanager
+
+from sample_documents import make_pdf
+from job_store import SQLiteJobStore, FINISHED_STATES
+
+# 模拟打印机快速完成，关闭时不长时间等待
+os.environ.setdefault('WEBPRINT_MOCK_TIME_SCALE', '0.001')
+os.environ.setdefault('WEBPRINT_MOCK_SEED', '1')
+os.environ.setdefault('WEBPRINT_DRAIN_TIMEOUT', '2')
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("app-test")
+
+def load_app(name):
+    """在当前工作目录中导入一个新的应用模块，不启动调度"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BACKEND_DIR, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@contextmanager
+def temp_work_dir():
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='webprint-test-')
+    os.chdir(work_dir)
+    try:
+        yield work_dir
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@contextmanager
+def running_app(name='webprint_app'):
+    """在临时目录中导入并启动应用，结束时关闭"""
+    with temp_work_dir():
+        module = load_app(name)
+        module.start_background()
+        try:
+            yield module
+        finally:
+            module.shutdown()
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.05)
+
+def test_import_does_not_restore_jobs():
+    """重载器的主进程和子进程各导入一次应用，未完成的任务只在调用start_background的进程中恢复一次"""
+    with temp_work_dir():
+        os.makedirs('uploads')
+        path = os.path.join('uploads', 'job1_a.pdf')
+        with open(path, 'wb') as f:
+            f.write(make_pdf(random.Random(1), 1, 4096))
+        store = SQLiteJobStore(os.path.join('data', 'jobs.db'))
+        store.add_job({'id': 'job1', 'name': 'a.pdf', 'path': path, 'timestamp': time.time()}, 'queued')
+
+        modules = [load_app('webprint_reloader'), load_app('webprint_server')]
+        try:
+            for module in modules:
+                assert module.dispatcher is None
+                assert module.print_scheduler.qsize() == 0
+            assert len(store.get_job('job1')['history']) == 1
+
+            server = modules[1]
+            server.start_background()
+            server.start_background()
+            wait_until(lambda: store.get_state('job1') in FINISHED_STATES)
+            states = [entry['state'] for entry in store.get_job('job1')['history']]
+            assert states.count('printing') == 1, states
+        finally:
+            for module in modules:
+                module.shutdown()
+    logger.info("导入应用不恢复任务测试通过")
+
+def test_event_stream_limit():
+    """推送连接数达到上限时返回503，客户端改用长轮询；连接关闭后释放名额"""
+    with running_app() as module:
+        module.MAX_EVENT_STREAMS = 1
+        client = module.app.test_client()
+        first = client.get('/api/events', buffered=False)
+        assert first.status_code == 200
+        assert next(first.response).startswith(b'retry:')
+
+        second = client.get('/api/events')
+        assert second.status_code == 503
+        assert second.get_json()['fallback'] == 'poll'
+        assert int(second.headers['Retry-After']) > 0
+
+        first.close()
+        assert module.event_broker.subscriber_count() == 0
+        # 尚未开始推送就断开的连接同样释放名额
+        third = client.get('/api/events', buffered=False)
+        assert third.status_code == 200
+        third.close()
+        assert module.event_broker.subscriber_count() == 0
+    logger.info("推送连接数限制测试通过")
+
+def test_event_server_redirect():
+    """配置了推送服务器时/api/events重定向到推送服务器，推送服务器只发送订阅的任务"""
+    with running_app() as module:
+        module.EVENTS_BIND = '127.0.0.1:0'
+        module.start_event_server()
+        mine = {'id': 'mine', 'name': 'a.pdf', 'path': 'a.pdf', 'timestamp': time.time()}
+        other = {'id': 'other', 'name': 'b.pdf', 'path': 'b.pdf', 'timestamp': time.time()}
+        module.job_store.add_job(mine, 'queued')
+        module.job_store.add_job(other, 'queued')
+        port = module.event_server.address[1]
+
+        response = module.app.test_client().get('/api/events?ids=mine')
+        assert response.status_code == 307
+        assert response.headers['Location'] == f'http://localhost:{port}/api/events?ids=mine'
+        assert module.event_broker.subscriber_count() == 0
+
+        sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+        try:
+            sock.sendall(b'GET /api/events?ids=mine HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            data = b''
+            while b'event: queue' not in data:
+                data += sock.recv(65536)
+            assert b'"file_id": "mine"' in data
+            assert b'other' not in data
+            wait_until(lambda: module.event_broker.subscriber_count() == 1)
+
+            module.update_job_status(other, 'printing')
+            module.update_job_status(mine, 'printing')
+            while b'printing' not in data:
+                data += sock.recv(65536)
+            assert b'other' not in data
+        finally:
+            sock.close()
+        wait_until(lambda: module.event_broker.subscriber_count() == 0)
+    logger.info("推送服务器重定向测试通过")
+
+def test_dedup_charges_client_jobs():
+    """内容已存在的重复上传同样计入客户端的任务令牌桶，超出时返回429和Retry-After"""
+    with running_app() as module:
+        module.admission.client_jobs_burst = 2
+        module.admission.client_jobs_rate = 0.1
+        client = module.app.test_client()
+        content = make_pdf(random.Random(2), 1, 4096)
+        file_hash = hashlib.sha256(content).hexdigest()
+        response = client.post('/api/print', data={'file': (io.BytesIO(content), 'a.pdf')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200
+        
+        response = client.post('/api/dedup', json={'filename': 'a.pdf', 'fileHash': file_hash})
+        assert response.get_json()['deduplicated'] is True
+        before = set(os.listdir('uploads'))
+        for path, body in (('/api/dedup', {'filename': 'a.pdf', 'fileHash': file_hash}),
+                           ('/api/chunk/init', {'filename': 'a.pdf', 'fileHash': file_hash,
+                                                'fileSize': len(content)})):
+            response = client.post(path, json=body)
+            assert response.status_code == 429, path
+            assert int(response.headers['Retry-After']) > 0
+        # 被拒绝的请求不留下复制的文件
+        assert not set(os.listdir('uploads')) - before
+    logger.info("重复上传准入控制测试通过")
+
+def test_queue_state_published_outside_lock():
+    """队列变化时持锁的调用者只做标记，完整状态由推送线程生成；没有订阅者时不生成"""
+    with running_app() as module:
+        threads = []
+        ordered = module.print_scheduler.ordered
+        
+        def recording_ordered():
+            threads.append(threading.current_thread().name)
+            return ordered()
+        
+        module.print_scheduler.ordered = recording_ordered
+        sub = module.event_broker.subscribe()
+        with module.queue_lock:
+            module.publish_queue_state_locked()
+            time.sleep(0.1)
+            assert threads == []
+        events = sub.get(timeout=5)
+        assert [event_type for _, event_type, _ in events] == ['queue']
+        assert threads == ['queue-state']
+        
+        module.event_broker.unsubscribe(sub)
+        with module.queue_lock:
+            module.publish_queue_state_locked()
+        time.sleep(0.1)
+        assert threads == ['queue-state']
+        
+        # 查询接口按需生成
+        assert module.app.test_client().get('/api/queue').get_json()['queue_size'] == 0
+        assert threads[-1] != 'queue-state'
+    logger.info("队列状态推送测试通过")
+
+def test_submit_rejected_while_draining():
+    """排空期间新任务返回503和Retry-After，其他接口照常处理；再次调用shutdown等待排空完成"""
+    with running_app() as module:
+        module.is_drained = lambda: False
+        drain = module.start_shutdown()
+        wait_until(module.shutting_down.is_set)
+        client = module.app.test_client()
+        response = client.post('/api/print', data={'file': (io.BytesIO(b'%PDF-1.4'), 'a.pdf')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) > 0
+        response = client.post('/api/dedup', json={'filename': 'a.pdf', 'fileHash': '0' * 64})
+        assert response.status_code == 503
+        assert client.get('/api/queue').status_code == 200
+        
+        assert drain.is_alive()
+        module.shutdown(timeout=5)
+        assert module.shutdown_complete.is_set()
+    logger.info("排空期间拒绝新任务测试通过")
+
+def test_job_details_hide_private_fields():
+    """任务详情不包含服务器上的文件路径、提交者的地址和内容哈希"""
+    with running_app() as module:
+        client = module.app.test_client()
+        content = make_pdf(random.Random(3), 1, 4096)
+        response = client.post('/api/print', data={'file': (io.BytesIO(content), 'a.pdf'), 'priority': 'high'},
+                               content_type='multipart/form-data',
+                               environ_base={'REMOTE_ADDR': '10.1.2.3'})
+        file_id = response.get_json()['file_id']
+        job = client.get(f'/api/jobs/{file_id}').get_json()
+        assert job['name'] == 'a.pdf'
+        assert job['history']
+        # 客户端请求的优先级不超过服务器允许的值
+        assert job['priority'] == 'normal'
+        for field in ('path', 'print_path', 'work_dir', 'client', 'hash'):
+            assert field not in job, field
+        assert '10.1.2.3' not in str(job)
+        assert hashlib.sha256(content).hexdigest() not in str(job)
+    logger.info("任务详情字段测试通过")
+
+def test_batch_status_long_poll():
+    """批量状态查询在状态与已知不同时立即返回，否则等到相关任务状态变化或超时"""
+    with running_app() as module:
+        for file_id in ('j1', 'j2'):
+            module.job_store.add_job({'id': file_id, 'name': 'a.pdf', 'path': 'uploads/a.pdf'}, 'queued')
+        client = module.app.test_client()
+        
+        def poll(known, timeout):
+            start = time.time()
+            response = client.post('/api/status/batch', json={'fileIds': list(known), 'known': known,
+                                                              'timeout': timeout})
+            assert response.status_code == 200
+            return response.get_json()['statuses'], time.time() - start
+        
+        statuses, elapsed = poll({'j1': 'printing', 'missing': 'unknown'}, 10)
+        assert statuses == {'j1': 'queued', 'missing': 'unknown'}
+        assert elapsed < 1
+        
+        statuses, elapsed = poll({'j1': 'queued'}, 0.3)
+        assert statuses == {'j1': 'queued'}
+        assert elapsed >= 0.3
+        
+        timer = threading.Timer(0.2, module.update_status, args=('j1', 'printing'))
+        timer.start()
+        statuses, elapsed = poll({'j1': 'queued'}, 10)
+        timer.join()
+        assert statuses == {'j1': 'printing'}
+        assert 0.2 <= elapsed < 5
+        
+        # 其他任务的状态变化不会提前返回
+        timer = threading.Timer(0.1, module.update_status, args=('j2', 'printing'))
+        timer.start()
+        statuses, elapsed = poll({'j1': 'printing'}, 0.5)
+        timer.join()
+        assert statuses == {'j1': 'printing'}
+        assert elapsed >= 0.5
+        
+        response = client.post('/api/status/batch', json={'fileIds': ['j1'], 'timeout': 'x'})
+        assert response.status_code == 400
+    logger.info("批量状态长轮询测试通过")
+
+def test_download():
+    """下载支持Range和ETag条件请求，已打印的文件不再提供下载"""
+    with running_app() as module:
+        client = module.app.test_client()
+        content = make_pdf(random.Random(4), 2, 16 * 1024)
+        file_hash = hashlib.sha256(content).hexdigest()
+        path = os.path.join('uploads', 'waiting_a.pdf')
+        with open(path, 'wb') as f:
+            f.write(content)
+        module.download_index['waiting'] = {'id': 'waiting', 'name': 'a.pdf', 'path': path, 'hash': file_hash}
+        
+        response = client.get('/api/download/waiting')
+        assert response.status_code == 200
+        assert response.data == content
+        assert response.headers['ETag'] == f'"{file_hash}"'
+        assert 'a.pdf' in response.headers['Content-Disposition']
+        
+        response = client.get('/api/download/waiting', headers={'Range': 'bytes=100-199'})
+        assert response.status_code == 206
+        assert response.data == content[100:200]
+        assert response.headers['Content-Range'] == f'bytes 100-199/{len(content)}'
+        
+        response = client.get('/api/download/waiting', headers={'If-None-Match': f'"{file_hash}"'})
+        assert response.status_code == 304
+        assert response.data == b''
+        
+        # 打印完成后上传目录中的文件已删除，内容存储中保留的副本不对外提供
+        response = client.post('/api/print', data={'file': (io.BytesIO(content), 'b.pdf')},
+                               content_type='multipart/form-data')
+        file_id = response.get_json()['file_id']
+        wait_until(lambda: module.job_store.get_state(file_id) in FINISHED_STATES
+                   and not any(name.startswith(file_id) for name in os.listdir('uploads')))
+        assert module.blob_store.lookup(file_hash) is not None
+        assert client.get(f'/api/download/{file_id}').status_code == 404
+        
+        assert client.get('/api/download/missing').status_code == 404
+    logger.info("下载测试通过")
+
+def test_queue_hides_other_jobs():
+    """队列状态和推送只包含客户端指定的任务，不公开其他客户端的任务ID"""
+    with running_app() as module:
+        with module.queue_lock:
+            for file_id in ('mine', 'other'):
+                module.pipeline_jobs[file_id] = {'id': file_id, 'name': 'a.pdf', 'pages': 1}
+                module.job_store.add_job({'id': file_id, 'name': 'a.pdf', 'path': 'uploads/a.pdf'}, 'queued')
+        client = module.app.test_client()
+        
+        queue = client.get('/api/queue').get_json()
+        assert queue['queue_size'] == 2
+        assert queue['jobs'] == []
+        assert all('file_id' not in printer for printer in queue['printers'])
+        queue = client.get('/api/queue?ids=mine').get_json()
+        assert [job['file_id'] for job in queue['jobs']] == ['mine']
+        assert queue['jobs'][0]['position'] == 1
+        
+        def first_events(url):
+            response = client.get(url, buffered=False)
+            next(response.response)
+            text = next(response.response).decode('utf-8')
+            response.close()
+            return text
+        
+        # 不指定ids的推送连接不发送任何任务的状态
+        text = first_events('/api/events')
+        assert 'event: status' not in text
+        assert 'mine' not in text and 'other' not in text
+        text = first_events('/api/events?ids=mine')
+        assert 'mine' in text and 'other' not in text
+        
+        with module.queue_lock:
+            module.pipeline_jobs.clear()
+    logger.info("队列任务范围测试通过")
+
+def test_metrics_names():
+    """/metrics导出的指标名称和类型（仪表盘和告警规则依赖这些名称）"""
+    with running_app() as module:
+        client = module.app.test_client()
+        content = make_pdf(random.Random(5), 1, 4096)
+        response = client.post('/api/print', data={'file': (io.BytesIO(content), 'a.pdf')},
+                               content_type='multipart/form-data')
+        file_id = response.get_json()['file_id']
+        wait_until(lambda: module.job_store.get_state(file_id) in FINISHED_STATES)
+        text = client.get('/metrics').get_data(as_text=True)
+        types = dict(line.split()[2:4] for line in text.splitlines() if line.startswith('# TYPE '))
+        assert types == {
+            'webprint_http_request_seconds': 'histogram',
+            'webprint_upload_bytes_total': 'counter',
+            'webprint_job_stage_seconds': 'histogram',
+            'webprint_jobs_finished_total': 'counter',
+            'webprint_queue_lock_wait_seconds': 'histogram',
+            'webprint_queue_lock_hold_seconds': 'histogram',
+            'webprint_admission_rejected_total': 'counter',
+            'webprint_inflight_upload_bytes': 'gauge',
+            'webprint_dispatcher': 'gauge',
+            'webprint_queue_jobs': 'gauge',
+            'webprint_printers_busy': 'gauge',
+            'webprint_conversion_cache_hits': 'gauge',
+            'webprint_conversion_cache_misses': 'gauge',
+            'webprint_process_peak_rss_bytes': 'gauge'
+        }, types
+        assert 'webprint_http_request_seconds_count{endpoint="upload_file",method="POST",status="200"} 1' in text
+        assert f'webprint_upload_bytes_total{{kind="plain"}} {len(content)}' in text
+        assert 'webprint_job_stage_seconds_count{stage="upload"} 1' in text
+    logger.info("指标名称测试通过")
+
+def test_chunk_hash_checked_before_write():
+    """直接写入模式下首次上传的分块直接写入目标文件，校验失败时不标记为已接收；
+    重传已接收的分块先写入临时文件，校验失败时不会覆盖已接收的数据"""
+    with running_app() as module:
+        client = module.app.test_client()
+        content = make_pdf(random.Random(6), 1, 64 * 1024)
+        chunk_size = 16 * 1024
+        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        response = client.post('/api/chunk/init', json={'filename': 'a.pdf', 'fileSize': len(content),
+                                                        'chunkSize': chunk_size})
+        file_id = response.get_json()['file_id']
+        bitmap = module.chunk_uploads.get(file_id).bitmap
+        part_path = module.chunk_uploads.get(file_id).path(module.PART_FILENAME)
+        # 只有经过临时文件的分块才会调用pwrite_stream
+        spooled = []
+        pwrite_stream = module.pwrite_stream
+        
+        def recording_pwrite(*args):
+            spooled.append(args[2])
+            return pwrite_stream(*args)
+        
+        module.pwrite_stream = recording_pwrite
+        
+        def upload(index, data, chunk_hash):
+            return client.post('/api/chunk/upload', data={
+                'fileId': file_id,
+                'chunkIndex': str(index),
+                'chunkHash': chunk_hash,
+                'file': (io.BytesIO(data), 'blob')
+            }, content_type='multipart/form-data')
+        
+        def part():
+            with open(part_path, 'rb') as f:
+                return f.read()
+        
+        corrupt = bytes(len(chunks[0]))[:-1] + b'x'
+        response = upload(0, corrupt, hashlib.sha256(chunks[0]).hexdigest())
+        assert response.status_code == 400
+        assert not bitmap.is_set(0)
+        
+        for index, chunk in enumerate(chunks):
+            assert upload(index, chunk, hashlib.sha256(chunk).hexdigest()).status_code == 200
+        assert part() == content
+        assert spooled == []
+        # 重传已接收的分块时校验失败，目标文件保持不变
+        assert upload(1, corrupt, hashlib.sha256(chunks[1]).hexdigest()).status_code == 400
+        assert part() == content
+        assert spooled == []
+        assert upload(1, chunks[1], hashlib.sha256(chunks[1]).hexdigest()).status_code == 200
+        assert part() == content
+        assert spooled == [chunk_size]
+        # 没有残留的临时文件
+        assert not [name for name in os.listdir(module.CHUNKS_FOLDER) if name.endswith('.tmp')]
+        
+        # 整个文件的哈希在后台计算，不占用请求线程
+        response = client.post('/api/chunk/complete', json={'fileId': file_id})
+        assert response.get_json()['status'] == 'assembling'
+        wait_until(lambda: module.job_store.get_job(file_id).get('hash') == hashlib.sha256(content).hexdigest())
+    logger.info("分块校验测试通过")
+
+def test_stage_error_fails_job():
+    """流水线阶段处理出错的任务标记为失败、离开流水线并通知订阅者"""
+    with running_app() as module:
+        def broken(file_info):
+            raise RuntimeError("转换进程崩溃")
+        
+        module.pipeline_stages[1]._handler = broken
+        sub = module.event_broker.subscribe()
+        client = module.app.test_client()
+        content = make_pdf(random.Random(7), 1, 4096)
+        response = client.post('/api/print', data={'file': (io.BytesIO(content), 'a.pdf')},
+                               content_type='multipart/form-data')
+        file_id = response.get_json()['file_id']
+        wait_until(lambda: module.job_store.get_state(file_id) == 'error')
+        assert file_id not in module.pipeline_jobs
+        assert not any(name.startswith(file_id) for name in os.listdir('uploads'))
+        
+        statuses = []
+        deadline = time.time() + 5
+        while 'error' not in statuses and time.time() < deadline:
+            statuses += [data['status'] for _, event_type, data in sub.get(timeout=1)
+                         if event_type == 'status' and data['file_id'] == file_id]
+        assert 'error' in statuses
+        assert client.get('/api/queue').get_json()['queue_size'] == 0
+    logger.info("流水线出错测试通过")
+
+def test_failed_jobs_recorded():
+    """接收和转换阶段失败的任务同样计入结束的任务数，各阶段耗时保存到任务记录中"""
+    with running_app() as module:
+        failed = module.jobs_finished.value('error')
+        file_info = {'id': 'gone', 'name': 'a.pdf', 'path': os.path.join('uploads', 'gone_a.pdf'),
+                     'scheduled_at': time.time()}
+        module.job_store.add_job(file_info, 'queued')
+        assert module.ingest_job(file_info) is None
+        assert module.job_store.get_state('gone') == 'error'
+        assert 'queue_wait' in module.job_store.get_job('gone')['timeline']
+        
+        def broken(src, out_dir):
+            raise RuntimeError("转换失败")
+        
+        path = os.path.join('uploads', 'bad_a.docx')
+        with open(path, 'wb') as f:
+            f.write(b'not a document')
+        file_info = {'id': 'bad', 'name': 'a.docx', 'path': path}
+        module.job_store.add_job(file_info, 'queued')
+        module.record_timing(file_info, 'upload', 0.5)
+        assert module.prepare_print_file(file_info, {}, 'a.pdf', broken) is None
+        assert module.job_store.get_state('bad') == 'error'
+        assert module.job_store.get_job('bad')['timeline'] == {'upload': 0.5}
+        assert not os.path.exists(path)
+        assert module.jobs_finished.value('error') == failed + 2
+    logger.info("失败任务记录测试通过")
+
+if __name__ == "__main__":
+    logger.info("开始测试Web接口...")
+    test_import_does_not_restore_jobs()
+    test_event_stream_limit()
+    test_event_server_redirect()
+    test_dedup_charges_client_jobs()
+    test_queue_state_published_outside_lock()
+    test_submit_rejected_while_draining()
+    test_job_details_hide_private_fields()
+    test_batch_status_long_poll()
+    test_download()
+    test_queue_hides_other_jobs()
+    test_metrics_names()
+    test_chunk_hash_checked_before_write()
+    test_stage_error_fails_job()
+    test_failed_jobs_recorded()
+    logger.info("所有测试完成")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试小任务合并打印的脚本
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+from queue import Queue
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+
+from batching import Batcher, image_to_pdf, merge_pdfs
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("batching-test")
+
+def make_pdf(path, pages):
+    """生成指定页数的空白PDF"""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(595, 842)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+def run_batcher(jobs, window=0.3, **kwargs):
+    """把jobs放入Batcher，返回输出的任务列表"""
+    inbox = Queue()
+    output = []
+
+    def make_batch(batch):
+        return {'id': 'batch', 'batch': batch, 'pages': sum(job['pages'] for job in batch)}
+
+    batcher = Batcher(inbox, output.append, lambda job: job['pages'] <= 5, make_batch, window, **kwargs)
+    batcher.start()
+    for job in jobs:
+        inbox.put(job)
+    deadline = time.time() + 5
+    while batcher.processed < len(jobs) and time.time() < deadline:
+        time.sleep(0.05)
+    return output, batcher
+
+def test_batcher_groups_small_jobs():
+    """连续的小任务合并为一批，大任务打断批次并单独输出"""
+    jobs = [
+        {'id': 'a', 'pages': 1},
+        {'id': 'b', 'pages': 2},
+        {'id': 'big', 'pages': 40},
+        {'id': 'c', 'pages': 1}
+    ]
+    output, batcher = run_batcher(jobs)
+    assert [job['id'] for job in output] == ['batch', 'big', 'c'], output
+    assert [job['id'] for job in output[0]['batch']] == ['a', 'b']
+    assert batcher.batches == 1
+    assert batcher.processed == 4
+    logger.info("小任务合并测试通过")
+
+def test_batcher_limits():
+    """批次的任务数和页数不超过上限"""
+    jobs = [{'id': str(i), 'pages': 2} for i in range(5)]
+    output, _ = run_batcher(jobs, max_jobs=2)
+    assert [len(job.get('batch', [job])) for job in output] == [2, 2, 1], output
+
+    output, _ = run_batcher(jobs, max_pages=5)
+    assert [job.get('pages') for job in output] == [4, 4, 2], output
+    logger.info("批次上限测试通过")
+
+def test_merge_pdfs():
+    """合并PDF和图片，可选插入分隔页"""
+    work_dir = tempfile.mkdtemp()
+    try:
+        first = make_pdf(os.path.join(work_dir, 'first.pdf'), 2)
+        image_path = os.path.join(work_dir, 'photo.png')
+        Image.new('RGB', (3000, 2000), 'red').save(image_path)
+        second = image_to_pdf(image_path, os.path.join(work_dir, 'photo.pdf'), dpi=300)
+
+        merged = merge_pdfs([first, second], os.path.join(work_dir, 'merged.pdf'))
+        assert len(PdfReader(merged).pages) == 3
+
+        merged = merge_pdfs([first, second], os.path.join(work_dir, 'merged.pdf'), separator_pages=True)
+        reader = PdfReader(merged)
+        assert len(reader.pages) == 4
+        # 图片页不超过A4
+        box = reader.pages[3].mediabox
+        assert max(box.width, box.height) <= 11.69 * 72 + 1
+        logger.info("PDF合并测试通过")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    logger.info("开始测试小任务合并打印")
+    test_batcher_groups_small_jobs()
+    test_batcher_limits()
+    test_merge_pdfs()
+    logger.info("所有测试通过")
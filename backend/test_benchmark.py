@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试基准测试脚本中生成负载和统计结果的函数
+"""
+
+import io
+import sys
+import random
+import logging
+
+from PyPDF2 import PdfReader
+
+from benchmark import parse_size, summarize, build_plans, parse_args
+from sample_documents import make_pdf
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("benchmark-test")
+
+def test_make_pdf():
+    """生成的PDF页数正确、大小接近目标，且每个文件内容不同"""
+    assert parse_size('64K') == 64 * 1024
+    assert parse_size('1.5M') == 1536 * 1024
+    assert parse_size('100') == 100
+    
+    rng = random.Random(1)
+    first = make_pdf(rng, 3, 200 * 1024)
+    second = make_pdf(rng, 3, 200 * 1024)
+    assert len(PdfReader(io.BytesIO(first)).pages) == 3
+    assert abs(len(first) - 200 * 1024) < 4096
+    assert first != second
+    logger.info("PDF生成测试通过")
+
+def test_plans_reproducible():
+    """同一随机种子生成相同的负载"""
+    args = parse_args(['--clients', '2', '--jobs', '3', '--sizes', '8K,16K', '--chunked', '0.5'])
+    plans = build_plans(args)
+    assert [len(plan) for plan in plans] == [3, 3]
+    assert plans == build_plans(args)
+    assert plans != build_plans(parse_args(['--clients', '2', '--jobs', '3', '--sizes', '8K,16K',
+                                            '--chunked', '0.5', '--seed', '2']))
+    logger.info("负载生成测试通过")
+
+def test_summarize():
+    """百分位按最近秩法计算"""
+    assert summarize([]) == {'count': 0}
+    stats = summarize([i / 100 for i in range(100, 0, -1)])
+    assert stats['count'] == 100
+    assert stats['p50'] == 0.5
+    assert stats['p90'] == 0.9
+    assert stats['p99'] == 0.99
+    assert stats['max'] == 1.0
+    assert summarize([2.0])['p99'] == 2.0
+    logger.info("统计测试通过")
+
+if __name__ == "__main__":
+    logger.info("开始测试基准测试脚本")
+    test_make_pdf()
+    test_plans_reproducible()
+    test_summarize()
+    logger.info("所有测试通过")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试内容存储的脚本
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import logging
+
+from blob_store import BlobStore, derived_key, file_sha256, is_valid_hash
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("blob-store-test")
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+def test_lru_eviction():
+    """测试超过容量时淘汰最近最少使用的内容"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = BlobStore(os.path.join(tmp_dir, 'blobs'), max_bytes=250)
+        keys = []
+        for i in range(3):
+            src = os.path.join(tmp_dir, f'src_{i}')
+            key = write_file(src, bytes([i]) * 100)
+            assert file_sha256(src) == key
+            assert store.put(key, src)
+            keys.append(key)
+            if i == 1:
+                # 访问第一个文件，使第二个文件成为最久未使用的
+                assert store.get(keys[0], os.path.join(tmp_dir, 'copy_0'))
+        
+        assert keys[0] in store
+        assert keys[1] not in store
+        assert keys[2] in store
+        assert store.stats()['bytes'] == 200
+        
+        # 取出的内容与原文件相同
+        dst = os.path.join(tmp_dir, 'copy_2')
+        assert store.get(keys[2], dst)
+        with open(dst, 'rb') as f:
+            assert f.read() == bytes([2]) * 100
+        assert not store.get(keys[1], os.path.join(tmp_dir, 'copy_1'))
+        assert store.stats()['hits'] == 2
+        assert store.stats()['misses'] == 1
+        
+        # 重新打开时从磁盘恢复索引
+        store = BlobStore(os.path.join(tmp_dir, 'blobs'), max_bytes=250)
+        assert store.stats()['entries'] == 2
+
+def test_shared_between_processes():
+    """多个进程（这里用两个实例模拟）共享同一存储：保存后其他进程可以取出，容量上限按所有进程的总大小计算"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = os.path.join(tmp_dir, 'blobs')
+        first = BlobStore(root, max_bytes=150)
+        second = BlobStore(root, max_bytes=150)
+        sources = []
+        for i in range(2):
+            src = os.path.join(tmp_dir, f'src_{i}')
+            sources.append((write_file(src, bytes([i]) * 100), src))
+        
+        assert first.put(*sources[0])
+        assert second.get(sources[0][0], os.path.join(tmp_dir, 'copy_0'))
+        assert sources[0][0] in second
+        
+        # 第二个实例保存后总大小超过上限，淘汰第一个实例保存的内容
+        assert second.put(*sources[1])
+        assert first.stats()['bytes'] == 100
+        assert sources[0][0] not in first
+        assert not first.get(sources[0][0], os.path.join(tmp_dir, 'copy_1'))
+        assert first.get(sources[1][0], os.path.join(tmp_dir, 'copy_2'))
+
+def test_derived_key():
+    """处理结果的存储键由内容哈希和处理参数共同决定"""
+    content_hash = hashlib.sha256(b'docx').hexdigest()
+    key = derived_key(content_hash, 'pdf:writer_pdf_Export')
+    assert is_valid_hash(key)
+    assert key == derived_key(content_hash, 'pdf:writer_pdf_Export')
+    assert key != derived_key(content_hash, 'pdf:other')
+    assert key != content_hash
+
+def test_lookup():
+    """直接返回内容的文件路径，不存在时返回None"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = BlobStore(os.path.join(tmp_dir, 'blobs'), max_bytes=1000)
+        src = os.path.join(tmp_dir, 'src')
+        key = write_file(src, b'download')
+        assert store.lookup(key) is None
+        store.put(key, src)
+        with open(store.lookup(key), 'rb') as f:
+            assert f.read() == b'download'
+
+if __name__ == "__main__":
+    logger.info("开始测试内容存储")
+    test_lru_eviction()
+    test_shared_between_processes()
+    test_derived_key()
+    test_lookup()
+    logger.info("测试结果: 成功")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试分块上传位图的脚本
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import logging
+
+from chunk_upload import ChunkUploadRegistry
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("chunk-upload-test")
+
+def make_metadata(total_chunks):
+    return {
+        'filename': 'test.pdf',
+        'id': str(uuid.uuid4()),
+        'totalChunks': total_chunks,
+        'fileSize': total_chunks * 1024,
+        'timestamp': time.time()
+    }
+
+def test_concurrent_marks():
+    """测试并发标记分块不会丢失记录"""
+    total_chunks = 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry = ChunkUploadRegistry(tmp_dir)
+        upload = registry.create(make_metadata(total_chunks))
+        assert upload.bitmap.missing() == list(range(total_chunks))
+        
+        def mark_range(start):
+            for index in range(start, total_chunks, 8):
+                upload.bitmap.mark(index)
+        
+        threads = [threading.Thread(target=mark_range, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert upload.bitmap.all_set()
+        assert upload.bitmap.count() == total_chunks
+        assert upload.bitmap.missing() == []
+        registry.discard(upload.file_id)
+
+def test_reload_from_disk():
+    """测试重启后从磁盘恢复已接收的分块"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry = ChunkUploadRegistry(tmp_dir)
+        metadata = make_metadata(10)
+        upload = registry.create(metadata)
+        upload.bitmap.mark(3)
+        upload.bitmap.mark(7)
+        registry.discard(upload.file_id)
+        
+        # 新的注册表（模拟重启或其他进程）从磁盘加载
+        registry = ChunkUploadRegistry(tmp_dir)
+        upload = registry.get(metadata['id'])
+        assert upload.bitmap.received() == [3, 7]
+        assert registry.get('../' + metadata['id']) is None
+        assert registry.get(str(uuid.uuid4())) is None
+        registry.discard(upload.file_id)
+
+def test_claim_across_registries():
+    """不同进程的注册表中只有一个能认领同一上传"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        metadata = make_metadata(2)
+        first = ChunkUploadRegistry(tmp_dir).create(metadata)
+        second = ChunkUploadRegistry(tmp_dir).get(metadata['id'])
+        assert not second.claimed
+        assert first.claim()
+        assert not first.claim()
+        assert second.claimed
+        assert not second.claim()
+        first.close()
+        second.close()
+
+def test_find_by_hash_across_registries():
+    """按内容哈希查找时包括其他进程初始化的上传，跳过已被其他进程完成的上传"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        metadata = make_metadata(2)
+        metadata['fileHash'] = 'a' * 64
+        registry = ChunkUploadRegistry(tmp_dir)
+        other = ChunkUploadRegistry(tmp_dir)
+        assert other.find_by_hash('a' * 64, metadata['fileSize']) is None
+        
+        upload = registry.create(metadata)
+        found = other.find_by_hash('a' * 64, metadata['fileSize'])
+        assert found.file_id == metadata['id']
+        assert other.find_by_hash('a' * 64, metadata['fileSize'] + 1) is None
+        
+        # 上传完成后分块目录被删除
+        registry.discard(upload.file_id)
+        shutil.rmtree(os.path.join(tmp_dir, metadata['id']))
+        assert other.find_by_hash('a' * 64, metadata['fileSize']) is None
+        assert len(other) == 0
+
+if __name__ == "__main__":
+    logger.info("开始测试分块上传位图")
+    test_concurrent_marks()
+    test_reload_from_disk()
+    test_claim_across_registries()
+    test_find_by_hash_across_registries()
+    logger.info("测试结果: 成功")
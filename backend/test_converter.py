@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试DOCX转换器池的脚本
+使用一个模拟soffice命令行的脚本代替LibreOffice
+"""
+
+import os
+import sys
+import stat
+import time
+import tempfile
+import threading
+import subprocess
+import logging
+
+import converter
+from converter import ConverterPool, ConversionError, SofficeWorker
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("converter-test")
+
+# 模拟的soffice：把使用的用户配置目录写入输出的PDF文件
+FAKE_SOFFICE = """#!{python}
+import os, sys, time
+args = sys.argv[1:]
+profile = [a for a in args if a.startswith('-env:UserInstallation=')][0]
+out_dir = args[args.index('--outdir') + 1]
+src = args[-1]
+if src.endswith('bad.docx'):
+    sys.exit(1)
+time.sleep(0.2)
+with open(os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + '.pdf'), 'w') as f:
+    f.write(profile)
+"""
+
+def make_fake_soffice(tmp_dir):
+    path = os.path.join(tmp_dir, 'soffice')
+    with open(path, 'w') as f:
+        f.write(FAKE_SOFFICE.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+def test_concurrent_conversions():
+    """同名文档并发转换时输出互不覆盖，且每个工作槽使用独立的配置目录"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pool = ConverterPool(2, os.path.join(tmp_dir, 'convert'), soffice=make_fake_soffice(tmp_dir),
+                             base_port=None, timeout=10)
+        src = os.path.join(tmp_dir, 'report.docx')
+        with open(src, 'w') as f:
+            f.write('docx')
+        
+        results = {}
+        def convert(i):
+            out_dir = os.path.join(tmp_dir, f'job-{i}')
+            os.makedirs(out_dir)
+            results[i] = pool.convert(src, out_dir)
+        
+        threads = [threading.Thread(target=convert, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(set(results.values())) == 4
+        profiles = set()
+        for path in results.values():
+            with open(path) as f:
+                profiles.add(f.read())
+        # 两个工作槽各有自己的配置目录
+        assert len(profiles) == 2
+        assert pool.stats()['idle'] == 2
+        
+        # 转换失败时抛出异常并归还工作槽
+        bad = os.path.join(tmp_dir, 'bad.docx')
+        with open(bad, 'w') as f:
+            f.write('docx')
+        try:
+            pool.convert(bad, tmp_dir)
+            assert False, "应当转换失败"
+        except ConversionError:
+            pass
+        assert pool.stats()['idle'] == 2
+
+class FakePropertyValue:
+    Name = None
+    Value = None
+
+class HangingDesktop:
+    """模拟卡住的soffice：打开文档的调用一直阻塞，直到进程被结束"""
+    
+    def __init__(self, process):
+        self.process = process
+    
+    def loadComponentFromURL(self, url, frame, flags, args):
+        self.process.wait()
+        raise RuntimeError("连接已断开")
+
+def test_uno_watchdog():
+    """UNO转换超时时结束soffice进程并使任务失败，下次使用前重新启动进程"""
+    saved = converter.uno, getattr(converter, 'PropertyValue', None)
+    converter.uno = object()
+    converter.PropertyValue = FakePropertyValue
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        worker = SofficeWorker(0, tmp_dir, port=1, timeout=0.5)
+        worker.process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        worker._desktop = HangingDesktop(worker.process)
+        try:
+            start_time = time.time()
+            try:
+                worker.convert(os.path.join(tmp_dir, 'hang.docx'), tmp_dir)
+                assert False, "应当转换超时"
+            except ConversionError as e:
+                assert '未完成' in str(e)
+            assert time.time() - start_time < 5
+            assert worker.process.poll() is not None
+            assert not worker.healthy()
+            assert worker._desktop is None
+        finally:
+            worker.stop()
+            converter.uno, converter.PropertyValue = saved
+
+if __name__ == "__main__":
+    logger.info("开始测试转换器池")
+    test_concurrent_conversions()
+    test_uno_watchdog()
+    logger.info("测试结果: 成功")
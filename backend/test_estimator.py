@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文档信息提取和打印耗时估算的脚本
+"""
+
+import os
+import sys
+import tempfile
+import logging
+
+import docx
+from docx.shared import RGBColor
+from PIL import Image
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, NameObject
+
+from estimator import estimate_job, estimate_print_seconds
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("estimator-test")
+
+def write_pdf(path, pages, content=None):
+    writer = PdfWriter()
+    for _ in range(pages):
+        page = PageObject.create_blank_page(None, 595, 842)
+        if content is not None:
+            stream = DecodedStreamObject()
+            stream.set_data(content)
+            page[NameObject('/Contents')] = stream
+        writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def test_pdf_estimate():
+    """PDF的页数及内容流中的彩色操作"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mono = os.path.join(tmp_dir, 'mono.pdf')
+        write_pdf(mono, 12, b'0.5 0.5 0.5 rg 0 0 100 100 re f')
+        color = os.path.join(tmp_dir, 'color.pdf')
+        write_pdf(color, 2, b'1 0 0 rg 0 0 100 100 re f')
+        
+        estimate = estimate_job(mono)
+        assert estimate['pages'] == 12 and not estimate['color']
+        assert estimate['seconds'] == estimate_print_seconds(12)
+        estimate = estimate_job(color)
+        assert estimate['pages'] == 2 and estimate['color']
+        # 彩色打印比黑白慢
+        assert estimate_print_seconds(2, True) > estimate_print_seconds(2, False)
+
+def test_image_and_docx_estimate():
+    """图片的分辨率和颜色，DOCX的彩色文字"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        photo = os.path.join(tmp_dir, 'photo.jpg')
+        Image.new('RGB', (1200, 800), (200, 30, 30)).save(photo, dpi=(300, 300))
+        scan = os.path.join(tmp_dir, 'scan.png')
+        Image.new('RGB', (600, 400), (128, 128, 128)).save(scan)
+        
+        estimate = estimate_job(photo)
+        assert estimate['color'] and estimate['width'] == 1200 and estimate['dpi'] == 300
+        estimate = estimate_job(scan)
+        assert not estimate['color'] and estimate['dpi'] is None
+        
+        document = docx.Document()
+        document.add_paragraph('黑色文字')
+        report = os.path.join(tmp_dir, 'report.docx')
+        document.save(report)
+        assert not estimate_job(report)['color']
+        document.add_paragraph().add_run('红色文字').font.color.rgb = RGBColor(0xff, 0, 0)
+        document.save(report)
+        estimate = estimate_job(report)
+        assert estimate['color'] and estimate['pages'] == 1
+        
+        # 无法解析的文件按一页黑白估算
+        broken = os.path.join(tmp_dir, 'broken.pdf')
+        with open(broken, 'wb') as f:
+            f.write(b'not a pdf')
+        assert estimate_job(broken)['pages'] == 1
+
+if __name__ == "__main__":
+    logger.info("开始测试耗时估算")
+    test_pdf_estimate()
+    test_image_and_docx_estimate()
+    logger.info("测试结果: 成功")
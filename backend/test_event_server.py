@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试SSE推送服务器的脚本
+用原始socket模拟大量浏览器连接
+"""
+
+import sys
+import json
+import time
+import socket
+import threading
+import logging
+
+from events import EventBroker, format_sse
+from event_server import EventServer, StreamRejected
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("event-server-test")
+
+def open_stream(query):
+    file_ids = query.get('ids', [''])[0].split(',')
+    if 'bad' in file_ids:
+        raise StreamRejected(400, {'error': '参数无效'})
+    return (file_ids,
+            lambda: format_sse('queue', {'watching': file_ids}),
+            lambda event: format_sse(event[1], event[2], event[0]))
+
+def start_server(**kwargs):
+    broker = EventBroker()
+    server = EventServer(broker, ('127.0.0.1', 0), open_stream, **kwargs)
+    server.start()
+    return broker, server
+
+def connect(server, query):
+    sock = socket.create_connection(server.address, timeout=5)
+    sock.sendall(f'GET /api/events?{query} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    return sock
+
+def read_until(sock, marker, data=b''):
+    while marker not in data:
+        buf = sock.recv(65536)
+        assert buf, data
+        data += buf
+    return data
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.01)
+
+def test_many_idle_streams():
+    """所有连接由一个线程服务，事件只发给订阅了该任务的连接，断开的连接释放订阅"""
+    threads_before = threading.active_count()
+    broker, server = start_server()
+    socks = []
+    try:
+        for i in range(300):
+            socks.append(connect(server, f'ids=job{i % 2}'))
+        for i, sock in enumerate(socks):
+            data = read_until(sock, b'\n\n', read_until(sock, b'retry: 3000\n\n'))
+            assert data.startswith(b'HTTP/1.1 200 OK\r\n')
+            assert b'text/event-stream' in data
+            assert f'"watching": ["job{i % 2}"]'.encode() in data
+        assert server.stream_count() == 300
+        assert threading.active_count() == threads_before + 1
+
+        broker.publish('status', {'file_id': 'job1', 'status': 'printing'}, 'job1')
+        broker.publish('queue', {'queue_size': 3})
+        for i, sock in enumerate(socks):
+            data = read_until(sock, b'queue_size')
+            assert (b'printing' in data) == (i % 2 == 1)
+
+        for sock in socks[:100]:
+            sock.close()
+        wait_until(lambda: broker.subscriber_count() == 200)
+        assert server.stream_count() == 200
+    finally:
+        for sock in socks:
+            sock.close()
+        server.close()
+    assert broker.subscriber_count() == 0
+    logger.info("大量空闲连接测试通过")
+
+def test_rejected_streams():
+    """连接数已满时返回503和Retry-After，参数无效时返回对应的状态码"""
+    broker, server = start_server(max_streams=1, retry_after=30)
+    first = connect(server, 'ids=a')
+    try:
+        read_until(first, b'retry:')
+        second = connect(server, 'ids=b')
+        data = read_until(second, b'}')
+        head, body = data.split(b'\r\n\r\n', 1)
+        assert head.startswith(b'HTTP/1.1 503 ')
+        assert b'Retry-After: 30' in head
+        assert json.loads(body)['fallback'] == 'poll'
+        # 拒绝后服务器关闭连接
+        assert second.recv(1) == b''
+        second.close()
+
+        first.close()
+        wait_until(lambda: broker.subscriber_count() == 0)
+        bad = connect(server, 'ids=bad')
+        assert read_until(bad, b'}').startswith(b'HTTP/1.1 400 ')
+        bad.close()
+    finally:
+        server.close()
+    logger.info("拒绝连接测试通过")
+
+def test_heartbeat():
+    """没有事件的连接定期收到心跳"""
+    broker, server = start_server(heartbeat=0.2)
+    sock = connect(server, 'ids=a')
+    try:
+        read_until(sock, b': keepalive\n\n')
+    finally:
+        sock.close()
+        server.close()
+
+if __name__ == "__main__":
+    logger.info("开始测试推送服务器")
+    test_many_idle_streams()
+    test_rejected_streams()
+    test_heartbeat()
+    logger.info("所有测试通过")
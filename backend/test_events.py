@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试事件推送模块的脚本
+"""
+
+import sys
+import json
+import time
+import threading
+import logging
+
+from events import EventBroker, Subscription, format_sse
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("events-test")
+
+def test_filtering_and_limit():
+    """任务事件只发给关心该任务的订阅者，队列事件发给所有订阅者；订阅数达到上限时拒绝"""
+    broker = EventBroker()
+    everything = broker.subscribe()
+    only_a = broker.subscribe(['a'])
+    broker.publish('status', {'file_id': 'b', 'status': 'printing'}, 'b')
+    broker.publish('queue', {'queue_size': 1})
+
+    assert [event[1] for event in everything.get(timeout=0)] == ['status', 'queue']
+    events = only_a.get(timeout=0)
+    assert [event[1] for event in events] == ['queue']
+    # 事件ID单调递增
+    assert events[0][0] == 2
+
+    assert broker.subscribe(limit=2) is None
+    broker.unsubscribe(only_a)
+    assert broker.subscribe(limit=2) is not None
+    assert broker.subscriber_count() == 2
+    logger.info("事件过滤和订阅上限测试通过")
+
+def test_overflow():
+    """缓冲区满时丢弃最旧的事件并标记溢出，发布者不会阻塞"""
+    sub = Subscription(max_pending=3)
+    for i in range(5):
+        sub.push((i, 'status', {'n': i}))
+    assert sub.overflowed
+    assert [event[0] for event in sub.get(timeout=0)] == [2, 3, 4]
+    assert sub.get(timeout=0) == []
+
+def test_get_wakes_on_push():
+    """等待中的订阅者在新事件到达时立即返回，没有事件时超时返回空列表"""
+    sub = Subscription()
+    start = time.time()
+    assert sub.get(timeout=0.1) == []
+    assert time.time() - start >= 0.1
+
+    timer = threading.Timer(0.05, sub.push, args=((1, 'queue', {}),))
+    timer.start()
+    start = time.time()
+    assert sub.get(timeout=5) == [(1, 'queue', {})]
+    assert time.time() - start < 1
+    timer.join()
+
+def test_format_sse():
+    """事件按SSE格式编码，中文不转义，以空行结束"""
+    text = format_sse('status', {'file_id': 'a', 'status': '完成'}, 7)
+    assert text.endswith('\n\n')
+    lines = text.rstrip('\n').split('\n')
+    assert lines[:2] == ['id: 7', 'event: status']
+    assert lines[2].startswith('data: ') and '完成' in lines[2]
+    assert json.loads(lines[2][len('data: '):]) == {'file_id': 'a', 'status': '完成'}
+    assert format_sse('queue', {}) == 'event: queue\ndata: {}\n\n'
+
+if __name__ == "__main__":
+    logger.info("开始测试事件推送模块")
+    test_filtering_and_limit()
+    test_overflow()
+    test_get_wakes_on_push()
+    test_format_sse()
+    logger.info("所有测试通过")
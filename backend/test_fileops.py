@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试文件操作工具的脚本
+通过替换内核复制函数分别测试copy_file_range、sendfile和普通读写三种复制方式，以及分块按偏移写入预分配的文件
+"""
+
+import io
+import os
+import sys
+import errno
+import hashlib
+import random
+import tempfile
+import logging
+
+import fileops
+from fileops import concat_files, preallocate, pwrite_stream
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("fileops-test")
+
+def unsupported(in_fd, out_fd, count):
+    raise OSError(errno.ENOSYS, "不支持")
+
+def make_parts(tmp_dir, sizes):
+    rng = random.Random(1)
+    paths = []
+    for i, size in enumerate(sizes):
+        path = os.path.join(tmp_dir, f'chunk_{i}')
+        with open(path, 'wb') as f:
+            f.write(rng.randbytes(size))
+        paths.append(path)
+    return paths
+
+def concat_with(copy_file_range, sendfile, sizes):
+    """使用给定的内核复制函数拼接文件，返回 (拼接结果是否正确, 各方式复制的字节数)"""
+    used = {'copy_file_range': 0, 'sendfile': 0}
+
+    def counting(name, func):
+        def copy(in_fd, out_fd, count):
+            n = func(in_fd, out_fd, count)
+            used[name] += n
+            return n
+        return copy
+
+    saved = fileops._copy_file_range, fileops._sendfile
+    fileops._copy_file_range = counting('copy_file_range', copy_file_range)
+    fileops._sendfile = counting('sendfile', sendfile)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = make_parts(tmp_dir, sizes)
+            dst = os.path.join(tmp_dir, 'merged')
+            assert concat_files(paths, dst) == sum(sizes)
+            expected = b''.join(open(path, 'rb').read() for path in paths)
+            with open(dst, 'rb') as f:
+                return f.read() == expected, used
+    finally:
+        fileops._copy_file_range, fileops._sendfile = saved
+
+def test_concat_copy_paths():
+    """三种复制方式拼接的结果相同；内核复制不可用时依次回退"""
+    sizes = [3 * 1024 * 1024 + 7, 0, 1, 200 * 1024]
+
+    ok, used = concat_with(fileops._copy_file_range, fileops._sendfile, sizes)
+    assert ok
+    assert used == {'copy_file_range': sum(sizes), 'sendfile': 0}
+
+    ok, used = concat_with(unsupported, fileops._sendfile, sizes)
+    assert ok
+    assert used == {'copy_file_range': 0, 'sendfile': sum(sizes)}
+
+    ok, used = concat_with(unsupported, unsupported, sizes)
+    assert ok
+    assert used == {'copy_file_range': 0, 'sendfile': 0}
+    logger.info("拼接文件测试通过")
+
+def test_concat_errors():
+    """非回退类的错误直接抛出，源文件缺失时抛出异常"""
+    def broken(in_fd, out_fd, count):
+        raise OSError(errno.EIO, "读写错误")
+
+    try:
+        concat_with(broken, fileops._sendfile, [10])
+        assert False, "应当抛出IO错误"
+    except OSError as e:
+        assert e.errno == errno.EIO
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            concat_files([os.path.join(tmp_dir, 'missing')], os.path.join(tmp_dir, 'merged'))
+            assert False, "应当找不到源文件"
+        except FileNotFoundError:
+            pass
+    logger.info("拼接错误测试通过")
+
+def test_preallocate_and_pwrite():
+    """分块按偏移写入预分配的文件，写入顺序不影响结果，超出上限的分块返回limit+1"""
+    chunk_size = 64 * 1024
+    data = random.Random(2).randbytes(chunk_size * 3 + 100)
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'data.part')
+        preallocate(path, len(data))
+        assert os.path.getsize(path) == len(data)
+        # 已存在的文件不会被清空
+        preallocate(path, len(data))
+        
+        for index in reversed(range(len(chunks))):
+            hasher = hashlib.sha256()
+            written = pwrite_stream(path, io.BytesIO(chunks[index]), index * chunk_size,
+                                    len(chunks[index]), hasher)
+            assert written == len(chunks[index])
+            assert hasher.hexdigest() == hashlib.sha256(chunks[index]).hexdigest()
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        
+        # 数据超过上限时只写入limit字节并返回limit+1
+        assert pwrite_stream(path, io.BytesIO(b'x' * 101), 0, 100) == 101
+        # 数据不足时返回实际写入的字节数
+        assert pwrite_stream(path, io.BytesIO(b'y' * 10), 0, 100) == 10
+        assert os.path.getsize(path) == len(data)
+        
+        # 目标文件不存在时不会创建
+        try:
+            pwrite_stream(os.path.join(tmp_dir, 'missing'), io.BytesIO(b'z'), 0, 1)
+            assert False, "应当找不到目标文件"
+        except FileNotFoundError:
+            pass
+    logger.info("预分配和偏移写入测试通过")
+
+if __name__ == "__main__":
+    logger.info("开始测试文件操作工具")
+    test_concat_copy_paths()
+    test_concat_errors()
+    test_preallocate_and_pwrite()
+    logger.info("所有测试通过")
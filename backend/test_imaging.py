@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试图片规范化的脚本
+"""
+
+import os
+import sys
+import tempfile
+import logging
+
+from PIL import Image
+
+from imaging import normalize_image, target_size
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("imaging-test")
+
+def test_target_size():
+    """只有超过纸张像素数的图片需要缩小，横向图片按旋转后计算"""
+    assert target_size(2000, 1500, 300, 'A4') is None
+    width, height = target_size(8000, 6000, 300, 'A4')
+    assert width <= 11.69 * 300 and height <= 8.27 * 300
+    assert abs(width / height - 8000 / 6000) < 0.01
+
+def test_normalize_photo():
+    """缩小手机照片，去掉EXIF并按方向旋转"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = os.path.join(tmp_dir, 'photo.jpg')
+        img = Image.effect_noise((4000, 3000), 64).convert('RGB')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # 需要顺时针旋转90度
+        exif[0x010f] = 'PhoneMaker'
+        img.save(src, quality=95, exif=exif)
+        
+        dst = normalize_image(src, os.path.join(tmp_dir, 'out.jpg'), 150, 'A4')
+        assert os.path.getsize(dst) < os.path.getsize(src)
+        with Image.open(dst) as out:
+            # 旋转后为纵向，并且不超过A4在150dpi下的尺寸
+            assert out.height > out.width
+            assert out.height <= int(11.69 * 150) and out.width <= int(8.27 * 150)
+            assert not out.getexif()
+            assert round(out.info['dpi'][0]) == 150
+
+def test_normalize_transparent_png():
+    """透明图片按白纸合成，可选转换为灰度"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = os.path.join(tmp_dir, 'logo.png')
+        Image.new('RGBA', (3000, 3000), (0, 0, 0, 0)).save(src)
+        dst = normalize_image(src, os.path.join(tmp_dir, 'out.png'), 100, 'A4', grayscale=True)
+        with Image.open(dst) as out:
+            assert out.mode == 'L'
+            assert out.getpixel((0, 0)) == 255
+
+if __name__ == "__main__":
+    logger.info("开始测试图片规范化")
+    test_target_size()
+    test_normalize_photo()
+    test_normalize_transparent_png()
+    logger.info("测试结果: 成功")
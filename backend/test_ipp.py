@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试IPP打印后端的脚本
+在本机启动一个简单的IPP服务器代替真实打印机
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ipp
+from printer_backends import IppBackend, PrintError
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("ipp-test")
+
+class StandInPrinter(ThreadingHTTPServer):
+    """模拟IPP打印机：任务在被查询两次后结束，任务名包含jam的任务中止；
+    drop_responses大于0时处理完请求后不响应、直接断开连接"""
+    
+    daemon_threads = True
+    
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), IPPHandler)
+        self.connections = 0
+        self.drop_responses = 0
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+class IPPHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        operation, request_id, groups, offset = ipp.decode_message(data)
+        server = self.server
+        with server.lock:
+            if operation == ipp.PRINT_JOB:
+                job_id = len(server.jobs) + 1
+                server.jobs[job_id] = {
+                    'name': ipp.find_attribute(groups, ipp.OPERATION_ATTRIBUTES, 'job-name'),
+                    'format': ipp.find_attribute(groups, ipp.OPERATION_ATTRIBUTES, 'document-format'),
+                    'document': data[offset:],
+                    'polls': 0
+                }
+                response = [(ipp.JOB_ATTRIBUTES, [(ipp.INTEGER, 'job-id', job_id),
+                                                  (ipp.ENUM, 'job-state', ipp.JOB_PENDING)])]
+            else:
+                job = server.jobs[ipp.find_attribute(groups, ipp.OPERATION_ATTRIBUTES, 'job-id')]
+                job['polls'] += 1
+                state = ipp.JOB_PROCESSING
+                reasons = ['job-printing']
+                if job['polls'] >= 2:
+                    state = ipp.JOB_ABORTED if 'jam' in job['name'] else ipp.JOB_COMPLETED
+                    reasons = ['media-jam-error'] if state == ipp.JOB_ABORTED else ['none']
+                response = [(ipp.JOB_ATTRIBUTES, [(ipp.ENUM, 'job-state', state),
+                                                  (ipp.KEYWORD, 'job-state-reasons', reasons)])]
+            if server.drop_responses > 0:
+                server.drop_responses -= 1
+                self.close_connection = True
+                return
+        body = ipp.encode_message(0x0000, request_id, [(ipp.OPERATION_ATTRIBUTES, [
+            (ipp.CHARSET, 'attributes-charset', 'utf-8'),
+            (ipp.NATURAL_LANGUAGE, 'attributes-natural-language', 'en')
+        ])] + response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/ipp')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_encode_decode():
+    """多值属性和整数属性的编码解码"""
+    data = ipp.encode_message(ipp.GET_JOB_ATTRIBUTES, 7, [(ipp.OPERATION_ATTRIBUTES, [
+        (ipp.INTEGER, 'job-id', 42),
+        (ipp.KEYWORD, 'requested-attributes', ['job-state', 'job-state-reasons'])
+    ])]) + b'document'
+    operation, request_id, groups, offset = ipp.decode_message(data)
+    assert (operation, request_id) == (ipp.GET_JOB_ATTRIBUTES, 7)
+    assert groups[0][1] == {'job-id': [42], 'requested-attributes': ['job-state', 'job-state-reasons']}
+    assert data[offset:] == b'document'
+
+def test_ipp_backend():
+    """文档通过同一个连接提交，打印机报告完成后才返回，中止的任务报错"""
+    server = StandInPrinter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = IppBackend(f"ipp://127.0.0.1:{server.server_address[1]}/ipp/print", poll_interval=0.01, timeout=5)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'doc.pdf')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1024 * 1024))
+            
+            backend.print_document(path, 'report')
+            backend.print_document(path, 'report-2')
+            try:
+                backend.print_document(path, 'paper-jam')
+                assert False, "中止的任务应当报错"
+            except PrintError as e:
+                assert 'media-jam-error' in str(e)
+            
+            with open(path, 'rb') as f:
+                assert server.jobs[1]['document'] == f.read()
+            assert server.jobs[1]['format'] == 'application/pdf'
+            assert server.jobs[2]['polls'] == 2
+            # 所有请求复用同一个连接
+            assert server.connections == 1
+            assert backend.client.connections_opened == 1
+    finally:
+        backend.close()
+        server.shutdown()
+        server.server_close()
+
+def test_retry_only_idempotent():
+    """复用的连接断开后只读的查询重新连接重试，Print-Job不重试，避免重复打印"""
+    server = StandInPrinter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ipp.IPPClient(f"ipp://127.0.0.1:{server.server_address[1]}/ipp/print", timeout=5)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'doc.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4 test')
+            job_id = client.print_job(path, 'first')
+            
+            server.drop_responses = 1
+            try:
+                client.print_job(path, 'second')
+                assert False, "连接断开时Print-Job应当报错"
+            except ipp.IPPError:
+                pass
+            # 打印机收到了文档，没有重发
+            assert len(server.jobs) == 2
+            
+            client.print_job(path, 'third')
+            server.drop_responses = 1
+            # 第一次查询被丢弃，重试的查询是第二次，任务结束
+            state, _ = client.job_state(job_id)
+            assert state == ipp.JOB_COMPLETED
+            assert server.jobs[job_id]['polls'] == 2
+            assert len(server.jobs) == 3
+            assert client.connections_opened == 3
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    logger.info("开始测试IPP打印后端")
+    test_encode_decode()
+    test_ipp_backend()
+    test_retry_only_idempotent()
+    logger.info("测试结果: 成功")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试打印任务存储的脚本
+"""
+
+import os
+import sys
+import tempfile
+import time
+import logging
+
+from job_store import MemoryJobStore, SQLiteJobStore
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("job-store-test")
+
+def make_file_info(file_id):
+    return {
+        'id': file_id,
+        'name': f"{file_id}.pdf",
+        'path': os.path.join('uploads', f"{file_id}_{file_id}.pdf"),
+        'timestamp': time.time()
+    }
+
+def check_store(store):
+    """两种存储实现共用的检查"""
+    store.add_job(make_file_info('a'), 'queued')
+    store.add_job(make_file_info('b'), 'queued')
+    assert store.set_state('a', 'printing')
+    assert store.set_state('a', 'completed')
+    assert not store.set_state('missing', 'printing')
+    
+    assert store.get_state('a') == 'completed'
+    assert store.get_state('missing') is None
+    assert store.get_states(['a', 'b', 'missing']) == {'a': 'completed', 'b': 'queued', 'missing': 'unknown'}
+    assert store.active_states() == {'b': 'queued'}
+    assert [info['id'] for info in store.jobs_in_states(('queued', 'printing'))] == ['b']
+    
+    info = make_file_info('a')
+    info['pages'] = 3
+    assert store.update_info(info)
+    assert not store.update_info(make_file_info('missing'))
+    
+    job = store.get_job('a')
+    assert job['name'] == 'a.pdf'
+    assert job['pages'] == 3
+    assert [entry['state'] for entry in job['history']] == ['queued', 'printing', 'completed']
+    
+    # 只清理超过保留时间的已结束任务
+    assert store.evict_expired(time.time() + store.retention_seconds + 1) == 1
+    assert store.get_state('a') is None
+    assert store.get_state('b') == 'queued'
+    assert store.count() == 1
+
+def test_memory_job_store():
+    """测试内存任务存储"""
+    check_store(MemoryJobStore(retention_seconds=60))
+
+def test_sqlite_job_store():
+    """测试SQLite任务存储及重启后的数据恢复"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'jobs.db')
+        store = SQLiteJobStore(db_path, retention_seconds=60)
+        check_store(store)
+        store.close()
+        
+        # 重新打开数据库，排队中的任务仍然存在
+        store = SQLiteJobStore(db_path, retention_seconds=60)
+        assert [info['id'] for info in store.jobs_in_states(('queued',))] == ['b']
+        assert store._connect().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        store.close()
+
+def test_sqlite_shared_queue():
+    """测试多进程共享的任务提交队列、状态变化记录和共享数据"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'jobs.db')
+        web = SQLiteJobStore(db_path)
+        dispatcher = SQLiteJobStore(db_path)
+        seq = dispatcher.last_change()
+        
+        for file_id in ('a', 'b', 'c'):
+            web.add_job(make_file_info(file_id), 'queued')
+            web.submit(file_id)
+        web.set_state('b', 'error')
+        # 只返回仍在排队的任务，取出后不会再次返回
+        assert [info['id'] for info in dispatcher.take_submitted()] == ['a', 'c']
+        assert dispatcher.take_submitted() == []
+        
+        changes = dispatcher.changes_since(seq)
+        assert [(file_id, state) for _, file_id, state in changes] == \
+            [('a', 'queued'), ('b', 'queued'), ('c', 'queued'), ('b', 'error')]
+        assert dispatcher.changes_since(changes[-1][0]) == []
+        assert dispatcher.last_change() == changes[-1][0]
+        
+        assert web.get_shared('queue') == (0, None)
+        dispatcher.put_shared('queue', {'queue_size': 1})
+        dispatcher.put_shared('queue', {'queue_size': 2})
+        assert web.get_shared('queue') == (2, {'queue_size': 2})
+        web.close()
+        dispatcher.close()
+
+if __name__ == "__main__":
+    logger.info("开始测试任务存储")
+    test_memory_job_store()
+    test_sqlite_job_store()
+    test_sqlite_shared_queue()
+    logger.info("测试结果: 成功")
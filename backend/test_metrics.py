@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试运行指标的脚本
+"""
+
+import sys
+import time
+import threading
+import logging
+
+from metrics import MetricsRegistry, InstrumentedLock, LOCK_BUCKETS
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("metrics-test")
+
+def test_render():
+    """计数器、直方图和仪表按Prometheus文本格式输出"""
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', '请求数', ('status',))
+    latency = registry.histogram('latency_seconds', '耗时', ('stage',), buckets=(0.1, 1))
+    registry.gauge('queue_jobs', '排队任务数', lambda: 3)
+    
+    requests.inc('200')
+    requests.inc('200', amount=2)
+    requests.inc('500')
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, 'print')
+    assert requests.value('200') == 3
+    assert latency.snapshot('print') == ([1, 1, 1], 5.55, 3)
+    
+    lines = registry.render().splitlines()
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{status="200"} 3' in lines
+    assert 'requests_total{status="500"} 1' in lines
+    # 区间计数是累计的
+    assert 'latency_seconds_bucket{stage="print",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="print",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="print",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="print"} 3' in lines
+    assert 'queue_jobs 3' in lines
+    logger.info("指标输出测试通过")
+
+def test_instrumented_lock():
+    """记录锁的等待和持有时间，Condition等待期间不计入"""
+    registry = MetricsRegistry()
+    wait = registry.histogram('wait_seconds', '等待', buckets=LOCK_BUCKETS)
+    hold = registry.histogram('hold_seconds', '持有', buckets=LOCK_BUCKETS)
+    lock = InstrumentedLock(wait, hold)
+    condition = threading.Condition(lock)
+    
+    with lock:
+        time.sleep(0.02)
+    assert hold.snapshot()[1] >= 0.02
+    
+    def notify_later():
+        time.sleep(0.2)
+        with condition:
+            condition.notify_all()
+    
+    thread = threading.Thread(target=notify_later)
+    thread.start()
+    with condition:
+        assert condition.wait(2)
+    thread.join()
+    _, wait_total, wait_count = wait.snapshot()
+    _, hold_total, hold_count = hold.snapshot()
+    # Condition.wait前后的两段持有时间分别记录
+    assert wait_count == 3
+    assert hold_count == 4
+    assert wait_total < 0.1
+    assert hold_total < 0.15
+    assert not lock.locked()
+    logger.info("锁计时测试通过")
+
+if __name__ == "__main__":
+    logger.info("开始测试运行指标")
+    test_render()
+    test_instrumented_lock()
+    logger.info("所有测试通过")
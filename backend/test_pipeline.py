@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试打印流水线阶段的脚本
+"""
+
+import sys
+import time
+import threading
+import logging
+from queue import Queue
+
+from pipeline import Stage
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("pipeline-test")
+
+def test_overlap_and_backpressure():
+    """转换与打印重叠进行，下游繁忙时上游最多提前准备队列容量个任务"""
+    convert_queue = Queue()
+    print_queue = Queue(maxsize=1)
+    events = []
+    lock = threading.Lock()
+    
+    def record(name, item):
+        with lock:
+            events.append((time.time(), name, item))
+    
+    def convert(item):
+        record('convert_start', item)
+        time.sleep(0.1)
+        record('convert_end', item)
+        if item == 'bad':
+            raise ValueError("转换失败")
+        return item
+    
+    stage = Stage('convert', convert, convert_queue, workers=1, emit=print_queue.put)
+    stage.start()
+    for item in ('bad', 0, 1, 2, 3):
+        convert_queue.put(item)
+    
+    # 打印机暂不取任务：一个任务在队列中，一个在等待队列空位，其余未开始
+    time.sleep(0.6)
+    assert print_queue.qsize() == 1
+    assert stage.busy == 1
+    assert stage.to_dict()['pending'] == 2
+    
+    # 模拟打印机逐个打印，每个任务打印期间下一个任务已经在转换
+    printed = []
+    for _ in range(4):
+        item = print_queue.get()
+        record('print_start', item)
+        time.sleep(0.15)
+        printed.append(item)
+    assert printed == [0, 1, 2, 3]
+    
+    starts = {item: t for t, name, item in events if name == 'convert_start'}
+    prints = {item: t for t, name, item in events if name == 'print_start'}
+    # 任务3在任务2开始打印之前就已开始转换
+    assert starts[3] < prints[2] + 0.15
+    assert stage.processed == 5
+
+def test_error_callback():
+    """处理或输出出错时调用on_error，之后的任务继续处理"""
+    inbox = Queue()
+    output = []
+    failed = []
+    done = threading.Event()
+    
+    def handle(item):
+        if item == 'bad':
+            raise ValueError("处理失败")
+        return item
+    
+    def emit(item):
+        if item == 'stuck':
+            raise RuntimeError("输出失败")
+        output.append(item)
+        if item == 'last':
+            done.set()
+    
+    stage = Stage('convert', handle, inbox, emit=emit, on_error=lambda item, e: failed.append((item, str(e))))
+    stage.start()
+    for item in ('bad', 'ok', 'stuck', 'last'):
+        inbox.put(item)
+    assert done.wait(5)
+    assert output == ['ok', 'last']
+    assert failed == [('bad', '处理失败'), ('stuck', '输出失败')]
+    assert stage.processed == 4
+
+if __name__ == "__main__":
+    logger.info("开始测试打印流水线")
+    test_overlap_and_backpressure()
+    test_error_callback()
+    logger.info("测试结果: 成功")
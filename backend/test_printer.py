@@ -8,6 +8,7 @@
 import os
 import sys
 import time
+import random
 import logging
 import threading
 import importlib.util
@@ -112,6 +113,183 @@ def test_printer_callback():
     
     return result[0]
 
+def test_multiple_devices():
+    """测试多台模拟打印机并行打印"""
+    mock_printer = import_mock_printer()
+    assert mock_printer, "无法导入模拟打印机模块"
+    
+    device_count = 3
+    devices = [mock_printer.MockPrinterDevice(f"printer-{i}") for i in range(device_count)]
+    
+    # 为每台设备创建测试文件
+    test_files = []
+    for i in range(device_count):
+        test_file = os.path.join(os.path.dirname(__file__), f"test_print_{i}.txt")
+        with open(test_file, "w") as f:
+            f.write("This is a test file for printing.\n" * 100)
+        test_files.append(test_file)
+    
+    events = [threading.Event() for _ in range(device_count)]
+    
+    try:
+        start = time.time()
+        for device, test_file, event in zip(devices, test_files, events):
+            assert device.print_file(test_file, lambda success, event=event: event.set())
+            # 设备忙时不接收新任务
+            assert device.busy
+            assert not device.print_file(test_file)
+        
+        for event in events:
+            assert event.wait(timeout=30), "等待打印超时"
+        elapsed = time.time() - start
+        logger.info(f"{device_count} 台打印机并行打印耗时: {elapsed:.2f}秒")
+        
+        # 每个任务至少需要2秒，并行执行时总耗时应远小于串行耗时
+        assert elapsed < 2 * device_count
+        for device in devices:
+            assert not device.busy
+            assert device.jobs_printed + device.jobs_failed == 1
+    finally:
+        for test_file in test_files:
+            try:
+                os.remove(test_file)
+            except OSError:
+                logger.warning(f"删除测试文件失败: {test_file}")
+
+def test_seeded_device_with_instant_clock():
+    """使用不等待的时钟时打印立即完成，相同种子的失败序列相同"""
+    mock_printer = import_mock_printer()
+    assert mock_printer, "无法导入模拟打印机模块"
+    
+    test_file = os.path.join(os.path.dirname(__file__), "test_print_instant.txt")
+    with open(test_file, "w") as f:
+        f.write("This is a test file for printing.\n")
+    
+    def print_many(device, count):
+        results = []
+        for _ in range(count):
+            done = threading.Event()
+            assert device.print_file(test_file, lambda success: (results.append(success), done.set()), 60)
+            assert done.wait(timeout=5)
+        return results
+    
+    try:
+        clock = mock_printer.InstantClock()
+        start = time.time()
+        first = print_many(mock_printer.MockPrinterDevice("p", clock, seed=7, failure_rate=0.3), 50)
+        assert time.time() - start < 5
+        # 每个任务在虚拟时间中耗时60秒
+        assert clock.now() == 50 * 60
+        second = print_many(mock_printer.MockPrinterDevice("p", mock_printer.InstantClock(), seed=7, failure_rate=0.3), 50)
+        assert first == second
+        assert 0 < first.count(False) < 50
+    finally:
+        os.remove(test_file)
+
+def test_printer_profile():
+    """预热、打印速度、卡纸和离线按参数计入打印耗时"""
+    mock_printer = import_mock_printer()
+    assert mock_printer, "无法导入模拟打印机模块"
+    
+    simulation = mock_printer.Simulation()
+    profile = mock_printer.PrinterProfile(pages_per_minute=60, warmup_seconds=10, sleep_after=100, failure_rate=0)
+    printer = mock_printer.SimulatedPrinter("p", simulation, profile)
+    finished = []
+    
+    def submit(pages):
+        assert printer.print_job(pages, lambda success: finished.append((simulation.now(), success)))
+        assert not printer.print_job(1)
+    
+    # 第一次打印需要预热；紧接着的任务不需要；空闲超过sleep_after后再次预热
+    submit(5)
+    simulation.run()
+    submit(5)
+    simulation.run()
+    simulation.schedule(100, submit, 5)
+    simulation.run()
+    assert finished == [(15, True), (20, True), (135, True)]
+    
+    profile.jam_rate = 1
+    profile.jam_clear_seconds = 30
+    profile.offline_rate = 1
+    profile.offline_seconds = 200
+    submit(2)
+    simulation.run()
+    # 离线200秒 + 离线期间进入休眠后的预热10秒 + 2页 + 2次卡纸
+    assert finished[-1] == (135 + 200 + 10 + 2 + 60, True)
+    assert printer.jams == 2
+    assert printer.offline_events == 1
+
+def test_simulated_throughput():
+    """数千个任务经过调度器分配到多台模拟打印机，在几秒内完成且结果可重现"""
+    mock_printer = import_mock_printer()
+    assert mock_printer, "无法导入模拟打印机模块"
+    from scheduler import Scheduler
+    
+    def run(seed):
+        rng = random.Random(seed)
+        jobs = [{'id': str(i), 'client': f"c{rng.randrange(50)}", 'pages': rng.randint(1, 30),
+                 'arrival': i * 0.5} for i in range(5000)]
+        profile = mock_printer.PrinterProfile(jam_rate=0.001, offline_rate=0.01)
+        result = mock_printer.simulate_printing(jobs, Scheduler(), 40, profile, seed)
+        return jobs, result
+    
+    start = time.time()
+    jobs, result = run(1)
+    elapsed = time.time() - start
+    logger.info(f"模拟 {len(jobs)} 个任务耗时 {elapsed:.2f}秒，模拟时间 {result['makespan']:.0f}秒")
+    assert elapsed < 10
+    assert all('finished_at' in job and job['finished_at'] >= job['started_at'] >= job['arrival'] for job in jobs)
+    printers = result['printers']
+    assert sum(p['jobs_printed'] + p['jobs_failed'] for p in printers) == len(jobs)
+    assert sum(p['pages_printed'] for p in printers) == sum(job['pages'] for job in jobs if job['success'])
+    
+    again, result_again = run(1)
+    assert result_again == result
+    assert [job['finished_at'] for job in again] == [job['finished_at'] for job in jobs]
+
+def test_dispatcher():
+    """唯一的分派线程把有界队列中的任务交给空闲的打印机，线程数不随任务数增长，停止后线程退出"""
+    from queue import Queue
+    from printers import Printer, PrinterRegistry, Dispatcher
+    
+    lock = threading.Lock()
+    registry = PrinterRegistry()
+    inbox = Queue(maxsize=2)
+    printed = []
+    
+    def print_job(file_info, printer):
+        time.sleep(0.002)
+        printed.append((file_info['id'], printer.name))
+    
+    def on_idle(printer):
+        with lock:
+            printer.current_job = None
+            dispatcher.printer_idle()
+    
+    for i in range(3):
+        registry.add(Printer(f"printer-{i}", print_job, on_idle))
+    dispatcher = Dispatcher(registry, inbox, lock)
+    thread_count = threading.active_count()
+    for printer in registry.all():
+        printer.start()
+    dispatcher.start()
+    
+    for i in range(200):
+        inbox.put({'id': str(i)})
+        assert threading.active_count() <= thread_count + 4
+    deadline = time.time() + 10
+    while len(printed) < 200 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(int(file_id) for file_id, _ in printed) == list(range(200))
+    assert len({name for _, name in printed}) == 3
+    assert dispatcher.dispatched == 200
+    
+    dispatcher.stop(timeout=5)
+    for printer in registry.all():
+        printer.stop(timeout=5)
+    assert threading.active_count() == thread_count
+
 if __name__ == "__main__":
     logger.info("开始测试模拟打印机功能")
     result = test_printer_callback()
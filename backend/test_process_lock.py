@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试进程间文件锁的脚本
+"""
+
+import os
+import sys
+import tempfile
+import logging
+import multiprocessing
+
+from process_lock import FileLock
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("process-lock-test")
+
+def try_lock(path, result):
+    result.put(FileLock(path).acquire(blocking=False))
+
+def test_exclusive_across_processes():
+    """锁被持有时其他对象和其他进程都无法获取，释放后可以获取"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'dispatcher.lock')
+        first = FileLock(path)
+        assert first.acquire(blocking=False)
+        assert first.held
+        assert not FileLock(path).acquire(blocking=False)
+        
+        result = multiprocessing.Queue()
+        process = multiprocessing.Process(target=try_lock, args=(path, result))
+        process.start()
+        process.join()
+        assert result.get() is False
+        
+        first.release()
+        assert not first.held
+        with FileLock(path) as second:
+            assert second.held
+    logger.info("进程间互斥测试通过")
+
+if __name__ == "__main__":
+    logger.info("开始测试进程间文件锁")
+    test_exclusive_across_processes()
+    logger.info("所有测试通过")
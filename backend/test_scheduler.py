@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试打印任务调度器的脚本
+"""
+
+import sys
+import logging
+
+from scheduler import Scheduler, PriorityPolicy
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("scheduler-test")
+
+def job(file_id, client, pages, priority='normal'):
+    return {'id': file_id, 'client': client, 'pages': pages, 'priority': priority}
+
+def drain(scheduler):
+    return [scheduler.get(block=False)['id'] for _ in range(scheduler.qsize())]
+
+def test_fair_share():
+    """大文件不会阻塞其他客户端的小任务，高优先级任务先于所有普通任务"""
+    scheduler = Scheduler(fair=True, quantum=10)
+    scheduler.put(job('big', 'a', 500))
+    scheduler.put(job('a2', 'a', 1))
+    for i in range(3):
+        scheduler.put(job(f'b{i}', 'b', 2))
+    scheduler.put(job('urgent', 'c', 50, priority='high'))
+    
+    expected = scheduler.ordered()
+    order = drain(scheduler)
+    assert [file_info['id'] for file_info in expected] == order
+    assert order[0] == 'urgent'
+    # 客户端b的小任务都排在500页的大文件之前
+    assert order.index('b2') < order.index('big')
+    assert order[-1] == 'a2'
+    assert scheduler.empty()
+
+def test_fifo_and_shortest_first():
+    """关闭公平调度时按提交顺序；开启最短任务优先时按页数"""
+    fifo = Scheduler(fair=False)
+    sjf = Scheduler(fair=False, shortest_first=True)
+    for scheduler in (fifo, sjf):
+        scheduler.put(job('j1', 'a', 30))
+        scheduler.put(job('j2', 'b', 1))
+        scheduler.put(job('j3', 'a', 5))
+    assert drain(fifo) == ['j1', 'j2', 'j3']
+    assert drain(sjf) == ['j2', 'j3', 'j1']
+
+def test_priority_policy():
+    """优先级由客户端地址决定，客户端只能请求不高于允许值的优先级"""
+    policy = PriorityPolicy.parse('10.0.5.0/24=high, 10.0.9.7=low')
+    assert policy.resolve('10.0.5.20') == 'high'
+    assert policy.resolve('10.0.5.20', 'low') == 'low'
+    assert policy.resolve('10.0.6.1', 'high') == 'normal'
+    assert policy.resolve('10.0.6.1', 'urgent') == 'normal'
+    assert policy.resolve('10.0.9.7', 'high') == 'low'
+    assert policy.resolve('::1', 'high') == 'normal'
+    assert policy.resolve('', 'high') == 'normal'
+    assert PriorityPolicy.parse('').resolve('10.0.5.20', 'high') == 'normal'
+    try:
+        PriorityPolicy.parse('10.0.0.0/8=urgent')
+        assert False, "应当拒绝未知的优先级"
+    except ValueError:
+        pass
+
+if __name__ == "__main__":
+    logger.info("开始测试调度器")
+    test_fair_share()
+    test_fifo_and_shortest_first()
+    test_priority_policy()
+    logger.info("测试结果: 成功")
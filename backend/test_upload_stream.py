@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试流式上传解析的脚本
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import logging
+
+import upload_stream
+from upload_stream import FileSink, UploadError, parse_multipart
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger("upload-stream-test")
+
+BOUNDARY = 'webprint-test-boundary'
+
+def make_body(parts):
+    """生成multipart请求体，parts为 (字段名, 值, 文件名或None)"""
+    body = b''
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + value + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+def test_stream_to_file():
+    """文件数据跨越多次读取时完整写入，同时得到哈希和字段"""
+    data = os.urandom(300 * 1024)
+    body = make_body([('priority', b'high', None), ('file', data, 'doc.pdf'), ('client', b'a', None)])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        opened = []
+        
+        def open_file(name, filename, fields):
+            opened.append((name, filename, dict(fields)))
+            return FileSink(os.path.join(tmp_dir, filename))
+        
+        original_size = upload_stream.READ_BUFFER_SIZE
+        upload_stream.READ_BUFFER_SIZE = 4096
+        try:
+            fields, sinks = parse_multipart(io.BytesIO(body), BOUNDARY, open_file)
+        finally:
+            upload_stream.READ_BUFFER_SIZE = original_size
+        
+        # 打开文件时只能看到文件之前的字段
+        assert opened == [('file', 'doc.pdf', {'priority': 'high'})]
+        assert fields == {'priority': 'high', 'client': 'a'}
+        assert sinks[0].size == len(data)
+        assert sinks[0].hexdigest() == hashlib.sha256(data).hexdigest()
+        with open(os.path.join(tmp_dir, 'doc.pdf'), 'rb') as f:
+            assert f.read() == data
+    logger.info("流式写入测试通过")
+
+def test_offset_and_limit():
+    """写入已有文件的指定位置，超过大小限制时标记overflow"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'data.part')
+        with open(path, 'wb') as f:
+            f.write(b'.' * 10)
+        
+        fields, sinks = parse_multipart(io.BytesIO(make_body([('file', b'abcd', 'chunk')])), BOUNDARY,
+                                        lambda name, filename, fields: FileSink(path, 4, 4))
+        assert sinks[0].size == 4 and not sinks[0].overflow
+        with open(path, 'rb') as f:
+            assert f.read() == b'....abcd..'
+        
+        fields, sinks = parse_multipart(io.BytesIO(make_body([('file', b'abcdef', 'chunk')])), BOUNDARY,
+                                        lambda name, filename, fields: FileSink(path, 4, 4))
+        assert sinks[0].overflow
+    logger.info("偏移写入测试通过")
+
+def test_truncated_body():
+    """请求体不完整时删除已写入的文件"""
+    body = make_body([('file', b'x' * 1000, 'doc.pdf')])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'doc.pdf')
+        try:
+            parse_multipart(io.BytesIO(body[:-30]), BOUNDARY, lambda name, filename, fields: FileSink(path))
+            assert False, "不完整的请求体应该解析失败"
+        except UploadError:
+            pass
+        assert not os.path.exists(path)
+    logger.info("不完整请求测试通过")
+
+if __name__ == "__main__":
+    logger.info("开始测试流式上传解析")
+    test_stream_to_file()
+    test_offset_and_limit()
+    test_truncated_body()
+    logger.info("所有测试通过")
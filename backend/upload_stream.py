@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式上传解析
+直接从请求流解析multipart/form-data，文件部分按固定大小的缓冲区写入最终位置，
+写入时同时计算哈希和检查大小，不经过Werkzeug的临时文件，内存占用与上传大小无关
+"""
+
+import hashlib
+import logging
+import os
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, Field, File, Data, Epilogue
+
+logger = logging.getLogger("web-printer.upload-stream")
+
+# 每次从请求流读取的字节数
+READ_BUFFER_SIZE = 256 * 1024
+# 普通表单字段的总大小上限
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """上传的数据不合法"""
+
+
+class FileSink:
+    """把上传的文件数据写入目标文件，同时计算SHA-256和大小
+
+    Args:
+        path: 目标文件
+        offset: 写入位置，为None时新建（截断）文件从头写入，否则写入已有文件的offset处
+        limit: 最多接受的字节数，超出时overflow为True且不再写入
+    """
+
+    def __init__(self, path, offset=None, limit=None):
+        self.path = path
+        self.offset = offset
+        self.limit = limit
+        self.size = 0
+        self.overflow = False
+        self._hasher = hashlib.sha256()
+        if offset is None:
+            self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        else:
+            self._fd = os.open(path, os.O_WRONLY)
+
+    def write(self, data):
+        if self.overflow:
+            return
+        if self.limit is not None and self.size + len(data) > self.limit:
+            self.overflow = True
+            return
+        self._hasher.update(data)
+        view = memoryview(data)
+        while view:
+            if self.offset is None:
+                n = os.write(self._fd, view)
+            else:
+                n = os.pwrite(self._fd, view, self.offset + self.size)
+            view = view[n:]
+            self.size += n
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def discard(self):
+        """关闭并删除新建的文件（写入已有文件时只关闭）"""
+        self.close()
+        if self.offset is None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def parse_multipart(stream, boundary, open_file, max_field_bytes=MAX_FIELD_BYTES):
+    """解析multipart请求流
+
+    Args:
+        stream: 请求体（如request.stream）
+        boundary: multipart边界
+        open_file: 遇到文件部分时调用 open_file(字段名, 文件名, 已解析的字段)，
+            返回FileSink接收数据，返回None时丢弃该部分
+        max_field_bytes: 普通字段的总大小上限
+
+    Returns:
+        (字段字典, 打开的FileSink列表)；解析失败时删除已写入的文件并抛出UploadError
+    """
+    if isinstance(boundary, str):
+        boundary = boundary.encode('latin-1')
+    decoder = MultipartDecoder(boundary, max_form_memory_size=max_field_bytes + READ_BUFFER_SIZE)
+    fields = {}
+    sinks = []
+    field_bytes = 0
+    current_field = None
+    current_sink = None
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                decoder.receive_data(stream.read(READ_BUFFER_SIZE) or None)
+            elif isinstance(event, Field):
+                current_field = (event.name, [])
+                current_sink = None
+            elif isinstance(event, File):
+                current_field = None
+                current_sink = open_file(event.name, event.filename or '', fields)
+                if current_sink is not None:
+                    sinks.append(current_sink)
+            elif isinstance(event, Data):
+                if current_field is not None:
+                    field_bytes += len(event.data)
+                    if field_bytes > max_field_bytes:
+                        raise UploadError("表单字段过大")
+                    current_field[1].append(event.data)
+                    if not event.more_data:
+                        fields[current_field[0]] = b''.join(current_field[1]).decode('utf-8', errors='replace')
+                        current_field = None
+                elif current_sink is not None:
+                    current_sink.write(event.data)
+                    if not event.more_data:
+                        current_sink.close()
+                        current_sink = None
+            elif isinstance(event, Epilogue):
+                break
+    except Exception as e:
+        for sink in sinks:
+            sink.discard()
+        # 请求体超过MAX_CONTENT_LENGTH等HTTP错误原样抛出
+        if isinstance(e, (UploadError, HTTPException)):
+            raise
+        raise UploadError(f"解析上传数据失败: {str(e)}") from e
+    for sink in sinks:
+        sink.close()
+    return fields, sinks
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+生产环境入口
+gunicorn -c gunicorn.conf.py wsgi:app
+多个工作进程共享SQLite任务存储，其中一个进程负责调度和打印
+"""
+
+import os
+
+os.environ.setdefault('WEBPRINT_MULTI_WORKER', '1')
+
+from app import app, start_background  # noqa: E402
+
+start_background()